@@ -0,0 +1,44 @@
+
+# tick time of the struct-of-arrays constellation against the number of spacecraft,
+# compared with stepping the scalar SpacecraftSim once per spacecraft
+#
+#   sim-ops-lib$ python -m benchmarks.bench_constellation
+
+import time
+from dataclasses import replace
+from datetime import datetime
+
+from so.batch import NullSink
+from so.constellation import Constellation
+from so.geometry import GeometryEngine
+from so.spacecraft import SpacecraftSim
+from benchmarks.common import scenario
+
+def bench(n, ticks=50):
+    constellation = Constellation(replace(scenario, constellation=[scenario.tle] * n))
+    ts, sink = datetime.fromisoformat(scenario.begin).timestamp(), NullSink()
+
+    start = time.perf_counter()
+    for i in range(ticks):
+        constellation.ping(ts + i)
+        constellation.publish(sink)
+
+    return (time.perf_counter() - start) / ticks
+
+def bench_scalar(ticks=50):
+    sc_sim = SpacecraftSim(scenario, geometry=GeometryEngine(scenario))
+    ts = datetime.fromisoformat(scenario.begin).timestamp()
+
+    start = time.perf_counter()
+    for i in range(ticks):
+        sc_sim.ping(ts + i)
+        sc_sim.state.to_dict()
+
+    return (time.perf_counter() - start) / ticks
+
+if __name__ == '__main__':
+    scalar = bench_scalar()
+
+    print(f"{ 'spacecraft':>10} { 'tick':>10} { 'scalar':>10}")
+    for n in [1, 10, 100, 500, 1000]:
+        print(f"{ n:>10} { bench(n)*1e3:8.2f}ms { scalar*n*1e3:8.2f}ms")
@@ -0,0 +1,40 @@
+# published bytes per tick during a pass, complete states (full) against changed fields with
+# a keyframe every SO_KEYFRAME_INTERVAL ticks (delta), late in a session with a day of flight dynamics
+#
+#   sim-ops-lib$ python -m benchmarks.bench_delta
+
+from so.core import OverrideState
+from so.delta import DeltaBackend
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from so.serializer import dumps
+from so.loop import tick
+from benchmarks.common import scenario, Tee
+
+class CountingSink:
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def publish(self, topic, data, retain=False):
+        self.bytes += len(dumps(data))
+        return True
+
+if __name__ == '__main__':
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    gs_sim.state.program_track = True
+    gs_sim.state.flight_dynamics = [[1000.0, 2000.0, 3000.0, 1500.0, 5.0] for i in range(8640)]
+
+    full, delta = CountingSink(), CountingSink()
+    backend = Tee(full, DeltaBackend(delta))
+
+    ts, ticks = gs_sim.state.ts + 120, 600
+    for i in range(ticks):
+        tick(ts + i, gs_sim, sc_sim, OverrideState(), backend)
+
+    print(f"full:  { full.bytes / ticks / 1024:10.1f} kB/tick")
+    print(f"delta: { delta.bytes / ticks / 1024:10.1f} kB/tick ({ full.bytes / delta.bytes:.1f}x less)")
+
+    gs_sim.stop()
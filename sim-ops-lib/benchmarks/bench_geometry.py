@@ -0,0 +1,64 @@
+
+# compare the per-tick skyfield path against the precomputed geometry table
+#
+#   sim-ops-lib$ python -m benchmarks.bench_geometry
+
+import time
+from datetime import datetime
+from skyfield.api import load, wgs84, EarthSatellite
+import pytz
+
+from so.geometry import GeometryEngine
+from benchmarks.common import scenario
+
+def per_tick(ts_list):
+    time_scale = load.timescale()
+    ephemeris = load('de421.bsp')
+    earth, sun = ephemeris['earth'], ephemeris['sun']
+    lines = [x.strip() for x in scenario.tle.split("\n") if len(x) > 0]
+    satellite = EarthSatellite(lines[1], lines[2], lines[0])
+    location = wgs84.latlon(scenario.ground_station.latitude, scenario.ground_station.longitude,
+                            elevation_m=scenario.ground_station.altitude)
+
+    for ts in ts_list:
+        t = time_scale.from_datetime(datetime.fromtimestamp(ts, tz=pytz.UTC))
+
+        # spacecraft simulator
+        position = satellite.at(t)
+        position.is_sunlit(ephemeris)
+        wgs84.geographic_position_of(position)
+        earth.at(t).observe(earth)
+        earth.at(t).observe(sun)
+
+        # ground station simulator
+        topocentric = (satellite - location).at(t)
+        topocentric.altaz()
+        topocentric.frame_latlon_and_rates(location)
+
+def table(geometry, ts_list):
+    for ts in ts_list:
+        geometry.sample(ts)
+
+if __name__ == '__main__':
+    ts_i = datetime.fromisoformat(scenario.begin).timestamp()
+    ts_f = datetime.fromisoformat(scenario.end).timestamp()
+    ts_list = [ts_i + 0.25 + i for i in range(int(ts_f - ts_i))]
+    n = len(ts_list)
+
+    start = time.perf_counter()
+    per_tick(ts_list)
+    t_tick = time.perf_counter() - start
+
+    start = time.perf_counter()
+    geometry = GeometryEngine(scenario)
+    t_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table(geometry, ts_list)
+    t_table = time.perf_counter() - start
+
+    print(f"ticks: { n }")
+    print(f"per-tick skyfield:  { t_tick*1e6/n:10.1f} us/tick  total { t_tick:.3f}s")
+    print(f"geometry build:     { t_build:.3f}s")
+    print(f"geometry lookup:    { t_table*1e6/n:10.1f} us/tick  total { t_table:.3f}s")
+    print(f"speedup (lookup):   { t_tick/t_table:10.1f}x")
@@ -0,0 +1,55 @@
+# time the archive path adds to a tick, with a stand-in client answering every request after a
+# fixed round trip as a remote S3 compatible store would: bucket check before every object (before),
+# buckets remembered, and queued for the upload workers
+#
+#   sim-ops-lib$ python -m benchmarks.bench_object_store
+
+import time
+
+from so.core import ObjectStore
+
+ROUND_TRIP = 0.02
+
+class LatencyClient:
+    def __init__(self, round_trip: float = ROUND_TRIP) -> None:
+        self.round_trip = round_trip
+        self.buckets = set()
+
+    def bucket_exists(self, bucket):
+        time.sleep(self.round_trip)
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        time.sleep(self.round_trip)
+        self.buckets.add(bucket)
+
+    def put_object(self, bucket_name, object_name, data, length):
+        time.sleep(self.round_trip)
+
+def timeit(f, n=50):
+    start = time.perf_counter()
+    for i in range(n):
+        f(i)
+
+    return (time.perf_counter() - start) / n
+
+if __name__ == '__main__':
+    packet = bytes(1024)
+
+    # the previous store: a bucket check before every object
+    client = LatencyClient()
+    def before(i):
+        if not client.bucket_exists('bench-tm'):
+            client.make_bucket('bench-tm')
+        client.put_object('bench-tm', str(i), packet, len(packet))
+
+    cached = ObjectStore(client=LatencyClient())
+    queued = ObjectStore(client=LatencyClient())
+
+    print(f"bucket check + put (before): { timeit(before)*1e3:8.3f} ms")
+    print(f"cached buckets:              { timeit(lambda i: cached.store('bench-tm', str(i), packet))*1e3:8.3f} ms")
+    print(f"upload queue:                { timeit(lambda i: queued.store_async('bench-tm', str(i), packet))*1e3:8.3f} ms")
+
+    start = time.perf_counter()
+    queued.flush()
+    print(f"flush:                       { (time.perf_counter() - start)*1e3:8.3f} ms { queued.stats() }")
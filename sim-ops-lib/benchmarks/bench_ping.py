@@ -0,0 +1,68 @@
+
+# ping cost late in a long session: the states carry a day of flight dynamics readings and
+# a long TC history; before structural sharing every ping started with a deepcopy of the state
+#
+#   sim-ops-lib$ python -m benchmarks.bench_ping
+
+import copy, time
+
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from benchmarks.common import scenario
+
+# ping as before structural sharing, every tick starts from a deepcopy of the current state
+class _DeepcopyGroundStationSim(GroundStationSim):
+    def ping(self, ts, sc_state=None, ov_state=None):
+        self.state = copy.deepcopy(self.state)
+        return super().ping(ts, sc_state=sc_state, ov_state=ov_state)
+
+class _DeepcopySpacecraftSim(SpacecraftSim):
+    def ping(self, ts, gs_state=None, ov_state=None):
+        self.state = copy.deepcopy(self.state)
+        return super().ping(ts, gs_state=gs_state, ov_state=ov_state)
+
+def timeit(f, n=200):
+    start = time.perf_counter()
+    for i in range(n):
+        f(i)
+
+    return (time.perf_counter() - start) / n
+
+# simulators with a day of readings every 10s and 500 commands
+def _sims(geometry, gs_cls, sc_cls):
+    gs_sim = gs_cls(scenario, geometry=geometry)
+    sc_sim = sc_cls(scenario, geometry=geometry)
+    gs_sim.state.program_track = True
+
+    gs_sim.state.flight_dynamics = [[1000.0, 2000.0, 3000.0, 1500.0, 5.0] for i in range(8640)]
+    sc_sim.state.dhs_tc_history = [f"{ str(i).zfill(3) }\t2023-08-27T04:40:00\tTC_TTC_001" for i in range(500)]
+
+    return gs_sim, sc_sim
+
+def _ping(gs_sim, sc_sim, ts):
+    def ping(i):
+        gs_state = gs_sim.ping(ts + i, sc_state=sc_sim.state)
+        sc_sim.ping(ts + i, gs_state=gs_state)
+
+    return ping
+
+if __name__ == '__main__':
+    geometry = GeometryEngine(scenario)
+    gs_sim, sc_sim = _sims(geometry, GroundStationSim, SpacecraftSim)
+    gs_before, sc_before = _sims(geometry, _DeepcopyGroundStationSim, _DeepcopySpacecraftSim)
+
+    ts = gs_sim.state.ts + 300
+
+    deepcopy = timeit(lambda i: (copy.deepcopy(gs_sim.state), copy.deepcopy(sc_sim.state)))
+    shallow = timeit(lambda i: (copy.copy(gs_sim.state), copy.copy(sc_sim.state)))
+    before = timeit(_ping(gs_before, sc_before, ts))
+    after = timeit(_ping(gs_sim, sc_sim, ts))
+
+    print(f"state deepcopy (before): { deepcopy*1e3:8.3f} ms")
+    print(f"state copy (after):      { shallow*1e3:8.3f} ms")
+    print(f"ping (before):           { before*1e3:8.3f} ms")
+    print(f"ping (after):            { after*1e3:8.3f} ms")
+
+    gs_sim.stop()
+    gs_before.stop()
@@ -0,0 +1,67 @@
+# ticks per second and overruns of concurrent real time sessions on SessionPool against the number
+# of worker processes, with a short time step so that sessions compete for the CPU; sessions in one
+# process share the GIL, sessions in separate workers run on separate cores
+#
+#   sim-ops-lib$ python -m benchmarks.bench_pool
+
+import os, json, time, shutil, tempfile
+
+from so.batch import NullSink
+from so.pool import SessionPool
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIME_STEP = 0.01
+DURATION = 10.0
+
+# module level so that spawned workers can unpickle it
+def _backend(scenario, prefix=''):
+    return NullSink()
+
+def _ticks(pool, names):
+    return dict((x, pool.control({ 'system': 'admin', 'control': 'status', 'session': x })['scheduler']) for x in names)
+
+if __name__ == '__main__':
+    # the demo scenario with a short time step, sessions read scenarios from the working directory
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data', 'scenarios', 'bench-pool'))
+    with open(os.path.join(_ROOT, 'data', 'scenarios', 'ops-sat-demo', 'data.json'), 'r') as fin:
+        data = json.load(fin)
+    data['time_step'] = TIME_STEP
+    with open(os.path.join(workdir, 'data', 'scenarios', 'bench-pool', 'data.json'), 'w') as fout:
+        json.dump(data, fout)
+    os.symlink(os.path.join(_ROOT, 'de421.bsp'), os.path.join(workdir, 'de421.bsp'))
+    os.chdir(workdir)
+
+    cores = os.cpu_count()
+    workers = sorted(set([1, 2, 4, cores]))
+    sessions = [1, 2, 4, 8]
+
+    print(f"{ cores } cores, { 1/TIME_STEP:.0f} ticks/s per session, aggregate ticks/s (overruns %)")
+    print('sessions ' + ''.join([f"{ str(x) + ' workers':>18}" for x in workers]))
+    try:
+        for n in sessions:
+            line = f"{ n:>8} "
+            for w in workers:
+                pool = SessionPool(workers=w, backend=_backend, products=False)
+                names = [f"bench-{ i }" for i in range(n)]
+                try:
+                    for name in names:
+                        pool.control({ 'system': 'admin', 'control': 'start', 'value': 'bench-pool', 'session': name })
+
+                    # sessions warm up, then ticks and overruns over the measured window
+                    time.sleep(2.0)
+                    before, start = _ticks(pool, names), time.perf_counter()
+                    time.sleep(DURATION)
+                    after, elapsed = _ticks(pool, names), time.perf_counter() - start
+                finally:
+                    for name in names:
+                        pool.control({ 'system': 'admin', 'control': 'stop', 'session': name })
+                    pool.close()
+
+                ticks = sum([after[x]['ticks'] - before[x]['ticks'] for x in names])
+                overruns = sum([after[x]['overruns'] - before[x]['overruns'] for x in names])
+                line += f"{ ticks / elapsed:11.1f} ({ 100 * overruns / max(ticks, 1):3.0f}%)"
+            print(line)
+    finally:
+        shutil.rmtree(workdir)
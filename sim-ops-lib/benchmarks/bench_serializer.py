@@ -0,0 +1,57 @@
+# publishing cost of both states per tick: asdict with custom_dict_factory and json (before),
+# the compiled per class serializer with json and, if installed, with orjson and numpy arrays;
+# and the ground station spectrums as json against the packed binary payload
+#
+#   sim-ops-lib$ python -m benchmarks.bench_serializer
+
+import json, time
+from dataclasses import asdict
+
+from so.core import custom_dict_factory
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from so.serializer import serializer, orjson, pack_spectrum
+from benchmarks.common import scenario
+
+def timeit(f, n=500):
+    start = time.perf_counter()
+    for i in range(n):
+        f()
+
+    return (time.perf_counter() - start) / n
+
+if __name__ == '__main__':
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    gs_sim.state.program_track = True
+
+    ts = gs_sim.state.ts + 300
+    gs_state = gs_sim.ping(ts, sc_state=sc_sim.state)
+    sc_state = sc_sim.ping(ts, gs_state=gs_state)
+    states = [gs_state, sc_state]
+
+    def before():
+        for state in states:
+            json.dumps(asdict(state, dict_factory=custom_dict_factory))
+
+    def compiled():
+        for state in states:
+            json.dumps(serializer(state.__class__).to_dict(state))
+
+    def compiled_orjson():
+        for state in states:
+            orjson.dumps(serializer(state.__class__, arrays=True).to_dict(state), option=orjson.OPT_SERIALIZE_NUMPY)
+
+    print(f"asdict + json (before):  { timeit(before)*1e3:8.3f} ms")
+    print(f"compiled + json:         { timeit(compiled)*1e3:8.3f} ms")
+    if orjson is not None:
+        print(f"compiled + orjson:       { timeit(compiled_orjson)*1e3:8.3f} ms")
+
+    spectrum_json = lambda: json.dumps([gs_state.spectrum_ul, gs_state.spectrum_dl])
+    spectrum_bin = lambda: pack_spectrum(gs_state.ts, gs_state.spectrum_ul, gs_state.spectrum_dl)
+    print(f"spectrum json:           { timeit(spectrum_json)*1e3:8.3f} ms { len(spectrum_json()):8d} bytes")
+    print(f"spectrum binary:         { timeit(spectrum_bin)*1e3:8.3f} ms { len(spectrum_bin()):8d} bytes")
+
+    gs_sim.stop()
@@ -0,0 +1,57 @@
+
+# time and resident memory of building the simulators: without the skyfield object cache (baseline,
+# each simulator loads its own ephemeris, timescale and satellite as before the cache), with a cold
+# and with a warm cache; memory is the RSS growth of a process keeping a few sims of each mode alive
+#
+#   sim-ops-lib$ python -m benchmarks.bench_startup
+
+import sys, time, subprocess
+
+from so import cache
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from so.session import resident_memory
+from benchmarks.common import scenario
+
+MODES = ['baseline', 'cold', 'warm']
+
+def start(mode):
+    start = time.perf_counter()
+
+    if mode != 'warm':
+        cache.clear()
+    geometry = GeometryEngine(scenario)
+    if mode == 'baseline':
+        cache.clear()
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    if mode == 'baseline':
+        cache.clear()
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    gs_sim.stop()
+
+    return time.perf_counter() - start, (geometry, gs_sim, sc_sim)
+
+# one mode in a fresh process, so that the memory of one mode is not reused by the next
+def measure(mode, n=10, keep=5):
+    start(mode)
+
+    times, sims, _rss = [], [], resident_memory()
+    for i in range(n):
+        seconds, sim = start(mode)
+        times.append(seconds)
+        if i < keep:
+            sims.append(sim)
+
+    print(f"{ mode },{ sum(times)/n },{ (resident_memory() - _rss) / keep }")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+        sys.exit(0)
+
+    print(f"{ 'mode':>10} { 'start':>10} { 'rss per sim':>12}")
+    for mode in MODES:
+        result = subprocess.run([sys.executable, '-W', 'ignore', '-m', 'benchmarks.bench_startup', mode], capture_output=True, text=True)
+        _, seconds, rss = result.stdout.strip().split('\n')[-1].split(',')
+        print(f"{ mode:>10} { float(seconds)*1e3:7.1f} ms { float(rss):9.1f} MB")
@@ -0,0 +1,46 @@
+# scenario and helpers shared by the benchmarks and the tests
+
+from so.core import GroundStation, Scenario, OverrideState
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from so.loop import tick
+
+ground_station = GroundStation(
+    name = 'Darmstadt',
+    latitude = 49.8718,
+    longitude= 8.6224,
+    altitude=127
+)
+
+scenario = Scenario(
+    name = 'testing-0',
+    begin = '2023-08-27 04:40:00+00:00',
+    end = '2023-08-27 04:55:00+00:00',
+    tle =  'OPS-SAT\n1 44878U 19092F   23237.49766723  .00030600  00000-0  81781-3 0  9990\n2 44878  97.4743  67.3096 0007340 241.3055 118.7452 15.38003807204438',
+    time_step = 1,
+    running = False,
+    ground_station = ground_station
+)
+
+# ticks of the test scenario during the pass, publishing to backend
+def run_ticks(backend, ticks=12):
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    gs_sim.state.program_track = True
+
+    ts, states = gs_sim.state.ts + 300, []
+    for i in range(ticks):
+        states.append(tick(ts + i, gs_sim, sc_sim, OverrideState(), backend))
+    gs_sim.stop()
+
+    return states
+
+# publishes the same messages to several backends
+class Tee:
+    def __init__(self, *backends) -> None:
+        self.backends = backends
+
+    def publish(self, topic, data, retain=False):
+        return all([x.publish(topic, data, retain=retain) for x in self.backends])
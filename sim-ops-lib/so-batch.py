@@ -0,0 +1,35 @@
+
+import argparse, logging
+
+from so.core import load_scenario
+from so.batch import run_batch, NullSink, MemorySink, FileSink
+
+logger = logging.getLogger(__name__)
+
+# run a scenario headless from begin to end, without MQTT, MinIO or wall-clock pacing
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a sim-ops scenario in batch mode.')
+    parser.add_argument('scenario', help='scenario uid, from data/scenarios')
+    parser.add_argument('--sink', choices=['null', 'file', 'memory'], default='null')
+    parser.add_argument('--output', default='batch.jsonl', help='output filename for the file sink')
+    parser.add_argument('--no-products', action='store_true', help='skip TM packets and flight dynamics products')
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if scenario is None:
+        parser.error(f"scenario not found: { args.scenario }")
+
+    match args.sink:
+        case 'file':
+            sink = FileSink(args.output)
+        case 'memory':
+            sink = MemorySink()
+        case other:
+            sink = NullSink()
+
+    try:
+        stats = run_batch(scenario, sink=sink, products=not args.no_products)
+    finally:
+        sink.close()
+
+    print(f"{ stats['ticks'] } ticks in { stats['seconds']:.3f}s: { stats['ticks_per_second']:.1f} ticks/s")
@@ -1,12 +1,13 @@
 
-import os, sys, json, zmq, subprocess
+import os, sys, json, zmq, base64, subprocess
 sys.path.insert(0, '')
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 from .core import ObjectStore
 from .spacecraft import SpacePacketHandler
+from .geometry import cached_products
 
 CONTROL_TCP = os.getenv('SO_CONTROL_TCP', 'tcp://so-master:5555')
 if not CONTROL_TCP:
@@ -24,7 +25,8 @@ app.add_middleware(
     allow_origins = ['*'],
     allow_credentials = True,
     allow_methods = ["*"],
-    allow_headers = ["*"]
+    allow_headers = ["*"],
+    expose_headers = ['ETag', 'X-Total-Count']
 )
 
 def _control(data):
@@ -51,9 +53,9 @@ def _root():
     return { 'title': app.title, 'version': app.version }
 
 @app.get('/admin/status', status_code=200)
-def _get_admin_status(admin_pw: str):
+def _get_admin_status(admin_pw: str, session: str = 'default'):
     if _valid_auth(admin_pw):
-        return _control({ 'system': 'admin', 'control': 'status', 'value': 'null' })
+        return _control({ 'system': 'admin', 'control': 'status', 'value': 'null', 'session': session })
     else:
         raise HTTPException(status_code=405, detail='Requires admin auth.')
 
@@ -72,9 +74,30 @@ async def _post_control(request: Request):
 
     return result
 
+# spectrums are generated only while requested, see SO_SPECTRUM_DEMAND
+@app.post('/spectrum/heartbeat')
+def _spectrum_heartbeat(session: str = 'default'):
+    return _control({ 'system': 'spectrum', 'control': 'heartbeat', 'session': session })
+
+@app.get('/spectrum')
+def _get_spectrum(session: str = 'default'):
+    return _control({ 'system': 'spectrum', 'control': 'get', 'session': session })
+
+# recent U/L or D/L spectrums (simulation times start to end), at most rows rows and bins bins,
+# as JSON lists or packed binary (see so.serializer.unpack_waterfall)
+@app.get('/waterfall')
+def _get_waterfall(session: str = 'default', direction: str = 'dl', start: float = None, end: float = None, rows: int = None, bins: int = None, format: str = 'json'):
+    result = _control({ 'system': 'waterfall', 'session': session, 'direction': direction, 'start': start, 'end': end,
+                        'rows': rows, 'bins': bins, 'format': format })
+
+    if format == 'binary' and result.get('status') == 'OK':
+        return Response(content=base64.b64decode(result['data']), media_type='application/octet-stream')
+
+    return result
+
 @app.get('/admin/hist')
-def _get_Admin_hist():
-    result = _control({ 'system': 'admin', 'control': 'history', 'value': 'null' })
+def _get_Admin_hist(session: str = 'default'):
+    result = _control({ 'system': 'admin', 'control': 'history', 'value': 'null', 'session': session })
 
     return result
 
@@ -91,13 +114,30 @@ def _admin_trigger(trigger: str, admin_pw: str):
     else:
         raise HTTPException(status_code=405, detail='Requires admin auth.')
 
+@app.get('/scenarios/{uid}/products')
+def _scenario_products(uid: str):
+    if uid not in os.listdir(os.path.join('data', 'scenarios')):
+        raise HTTPException(status_code=404, detail='Scenario not found.')
+
+    return cached_products(uid)
+
 @app.get('/obj-store/tm')
 def _os_get_tm():
     return OBJ_STORE.get_objects_tm()
 
+# flight dynamics products newest first, paged with offset and limit (X-Total-Count has the number of
+# products) and without the readings for data=false; unchanged products answer If-None-Match with 304
 @app.get('/obj-store/fd')
-def _os_get_fd():
-    return OBJ_STORE.get_objects_fd()
+def _os_get_fd(request: Request, response: Response, offset: int = 0, limit: int = 0, data: bool = True):
+    index = OBJ_STORE.fd_index(offset=offset, limit=limit, data=data)
+
+    etag = f'"{ index["version"] }-{ offset }-{ limit }-{ int(data) }"'
+    headers = { 'ETag': etag, 'X-Total-Count': str(index['total']) }
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    return index['products']
 
 @app.get('/obj-store/set/{uid}/{key}/{value}', status_code=200)
 def _os_set(uid: str, key: str, value: str):
@@ -111,7 +151,7 @@ def _os_set(uid: str, key: str, value: str):
 
 @app.get('/obj-store/sp/{bucket}/{object_name}')
 def _os_tm_by_uid(bucket: str, object_name: str):
-    bytes = OBJ_STORE.get(bucket, object_name)
+    bytes = OBJ_STORE.get_packet(bucket, object_name)
     packet = SPH.from_bytestream(bytes)
 
     return SPH.as_dict(packet, post_proc=False)
@@ -0,0 +1,233 @@
+
+import os, zlib, json, threading, logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# segments: TM packets appended to segment objects with an index, objects: one object per packet
+SO_ARCHIVE = os.getenv('SO_ARCHIVE', 'segments')
+if not SO_ARCHIVE:
+    SO_ARCHIVE = 'segments'
+
+# a segment closes after SO_ARCHIVE_SEGMENT seconds (0 for one segment per pass) or when no packet
+# came for SO_ARCHIVE_GAP seconds (end of pass); segments are uploaded in parts of SO_ARCHIVE_FLUSH
+# packets, each part once
+SO_ARCHIVE_SEGMENT = os.getenv('SO_ARCHIVE_SEGMENT', '600')
+if not SO_ARCHIVE_SEGMENT:
+    SO_ARCHIVE_SEGMENT = '600'
+SO_ARCHIVE_GAP = os.getenv('SO_ARCHIVE_GAP', '60')
+if not SO_ARCHIVE_GAP:
+    SO_ARCHIVE_GAP = '60'
+SO_ARCHIVE_FLUSH = os.getenv('SO_ARCHIVE_FLUSH', '12')
+if not SO_ARCHIVE_FLUSH:
+    SO_ARCHIVE_FLUSH = '12'
+
+# none or zlib, packets are compressed one by one so that each can still be read on its own
+SO_ARCHIVE_COMPRESSION = os.getenv('SO_ARCHIVE_COMPRESSION', 'none')
+if not SO_ARCHIVE_COMPRESSION:
+    SO_ARCHIVE_COMPRESSION = 'none'
+
+COMPRESSIONS = ['none', 'zlib']
+
+SEGMENTS_PREFIX = 'segments/'
+
+def segment_names(start: int, part: int = 0) -> tuple:
+    return f"{ SEGMENTS_PREFIX }{ start }.{ part }.sp", f"{ SEGMENTS_PREFIX }{ start }.{ part }.json"
+
+# packets of the current part of a segment back to back, the index has the name, offset and length
+# of each; parts are immutable once uploaded, readers find packets through the part indexes
+@dataclass
+class Segment:
+    start: int
+    end: int
+    compression: str = 'none'
+    part: int = 0
+    part_start: int = None
+    data: bytearray = field(default_factory=bytearray)
+    packets: list = field(default_factory=list)
+
+    def append(self, name: str, ts: int, byte_stream: bytes) -> None:
+        if self.compression == 'zlib':
+            byte_stream = zlib.compress(byte_stream)
+
+        if len(self.packets) == 0:
+            self.part_start = ts
+        self.packets.append([name, len(self.data), len(byte_stream)])
+        self.data += byte_stream
+        self.end = ts
+
+    def index(self, closed: bool = False) -> dict:
+        return { 'version': 2, 'segment': segment_names(self.start, self.part)[0], 'segment_start': self.start, 'part': self.part,
+                 'start': self.part_start, 'end': self.end, 'compression': self.compression, 'closed': closed, 'packets': list(self.packets) }
+
+    def next_part(self) -> None:
+        self.part += 1
+        self.data, self.packets = bytearray(), []
+
+# writes TM packets of <sim_uid>-tm buckets as segments, in place of ObjectStore.store; a single
+# uploader thread uploads the parts in order, each part before its index
+class SegmentWriter:
+    def __init__(self, store, segment: int = None, gap: int = None, compression: str = None, flush_packets: int = None) -> None:
+        self.object_store = store
+        self.segment = int(segment if segment is not None else SO_ARCHIVE_SEGMENT)
+        self.gap = int(gap if gap else SO_ARCHIVE_GAP)
+        self.compression = compression if compression else SO_ARCHIVE_COMPRESSION
+        self.flush_packets = int(flush_packets if flush_packets else SO_ARCHIVE_FLUSH)
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown archive compression: { self.compression }")
+
+        # bucket -> open segment, (bucket, segment start, part) -> (part bytes, index) to upload
+        self.open = {}
+        self.pending = OrderedDict()
+        self.uploading = False
+        self.stopping = False
+        self.thread = None
+        self.cond = threading.Condition()
+
+        self.packets, self.segments, self.uploads, self.failed = 0, 0, 0, 0
+
+    def _enqueue(self, bucket: str, segment: Segment, closed: bool = False) -> None:
+        self.pending[(bucket, segment.start, segment.part)] = (bytes(segment.data), segment.index(closed=closed))
+        segment.next_part()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._upload_loop, name='so-archive', daemon=True)
+            self.thread.start()
+        self.cond.notify_all()
+
+    def _close(self, bucket: str) -> None:
+        self._enqueue(bucket, self.open.pop(bucket), closed=True)
+        self.segments += 1
+
+    # same arguments as ObjectStore.store, object names are the packet times
+    def store(self, bucket, object_name, byte_stream):
+        ts = int(object_name)
+
+        with self.cond:
+            segment = self.open.get(bucket)
+            if segment is not None and ((self.segment > 0 and ts - segment.start >= self.segment) or ts - segment.end > self.gap):
+                self._close(bucket)
+                segment = None
+            if segment is None:
+                segment = self.open[bucket] = Segment(ts, ts, compression=self.compression)
+            elif len(segment.packets) >= self.flush_packets:
+                self._enqueue(bucket, segment)
+
+            segment.append(object_name, ts, byte_stream)
+            self.packets += 1
+
+    def _put(self, bucket, object_name, byte_stream) -> bool:
+        if hasattr(self.object_store, 'store_retry'):
+            return self.object_store.store_retry(bucket, object_name, byte_stream)
+
+        try:
+            self.object_store.store(bucket, object_name, byte_stream)
+            return True
+        except Exception as e:
+            logger.error(f"Failed upload { bucket }/{ object_name }: { e }")
+            return False
+
+    def _upload_loop(self):
+        while True:
+            with self.cond:
+                while len(self.pending) == 0:
+                    if self.stopping:
+                        self.thread = None
+                        self.cond.notify_all()
+                        return
+                    self.cond.wait()
+                (bucket, _, _), (data, index) = self.pending.popitem(last=False)
+                self.uploading = True
+
+            _segment, _index = segment_names(index['segment_start'], index['part'])
+            _ok = self._put(bucket, _segment, data) and self._put(bucket, _index, json.dumps(index).encode())
+
+            with self.cond:
+                self.uploading = False
+                if _ok:
+                    self.uploads += 1
+                else:
+                    self.failed += 1
+                self.cond.notify_all()
+
+    # close the open segments (of the given buckets, all by default) and wait for the uploads of this
+    # writer only, true if they were done within timeout seconds
+    def flush(self, timeout: float = 60.0, buckets: list = None) -> bool:
+        with self.cond:
+            for bucket in list(self.open.keys()):
+                if buckets is None or bucket in buckets:
+                    self._close(bucket)
+
+            self.stopping = True
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: self.thread is None, timeout)
+            self.stopping = False
+
+            return self.thread is None
+
+    def stats(self) -> dict:
+        with self.cond:
+            return { 'format': 'segments', 'packets': self.packets, 'segments': self.segments, 'open': len(self.open),
+                     'pending': len(self.pending) + self.uploading, 'uploads': self.uploads, 'failed': self.failed,
+                     'store': self.object_store.stats() if hasattr(self.object_store, 'stats') else {} }
+
+# finds packets through the segment indexes, indexes are cached by ETag so that only new
+# or still growing segments are downloaded again
+class SegmentReader:
+    def __init__(self, store) -> None:
+        self.object_store = store
+
+        # (bucket, index name) -> (etag, index, packet name -> (offset, length))
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def _indexes(self, bucket: str) -> list:
+        objects = self.object_store.client.list_objects(bucket, prefix=SEGMENTS_PREFIX, recursive=True)
+
+        result = []
+        for object in objects:
+            if not object.object_name.endswith('.json'):
+                continue
+
+            key = (bucket, object.object_name)
+            self.lock.acquire()
+            try:
+                _cached = self.indexes.get(key)
+            finally:
+                self.lock.release()
+
+            if _cached is None or _cached[0] != object.etag:
+                index = self.object_store.get(bucket, object.object_name, is_json=True)
+                _cached = (object.etag, index, dict((x[0], (x[1], x[2])) for x in index['packets']))
+
+                self.lock.acquire()
+                try:
+                    self.indexes[key] = _cached
+                finally:
+                    self.lock.release()
+
+            result.append(_cached)
+
+        return sorted(result, key=lambda x: x[1]['start'])
+
+    # names of the packets in the segments of a bucket
+    def names(self, bucket: str) -> list:
+        return [x[0] for _, index, _ in self._indexes(bucket) for x in index['packets']]
+
+    # packet bytes with a ranged read of its segment, None if no segment has it
+    def get(self, bucket: str, object_name: str) -> bytes:
+        try:
+            ts = int(object_name)
+        except ValueError:
+            return None
+
+        for _, index, packets in reversed(self._indexes(bucket)):
+            if index['start'] <= ts:
+                if object_name not in packets:
+                    return None
+                offset, length = packets[object_name]
+                data = self.object_store.get(bucket, index['segment'], offset=offset, length=length)
+
+                return zlib.decompress(data) if index['compression'] == 'zlib' else data
+
+        return None
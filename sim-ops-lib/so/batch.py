@@ -0,0 +1,87 @@
+
+import json, time, base64, logging
+from datetime import datetime
+
+from .core import Scenario, OverrideState, Products
+from .geometry import GeometryEngine
+from .ground_station import GroundStationSim
+from .spacecraft import SpacecraftSim, SpacePacketHandler
+from .loop import tick
+from .constellation import Constellation
+from .serializer import dumps
+
+logger = logging.getLogger(__name__)
+
+# sinks replace both the MQTT backend (publish) and the object store (store) in batch runs
+class NullSink:
+    def publish(self, topic, data, retain=False):
+        return True
+
+    def store(self, bucket, object_name, byte_stream):
+        pass
+
+    def close(self):
+        pass
+
+class MemorySink(NullSink):
+    def __init__(self) -> None:
+        self.messages = []
+        self.objects = {}
+
+    def publish(self, topic, data, retain=False):
+        self.messages.append((topic, data))
+        return True
+
+    def store(self, bucket, object_name, byte_stream):
+        self.objects[(bucket, object_name)] = byte_stream
+
+# one JSON object per line, packets and products base64 encoded
+class FileSink(NullSink):
+    def __init__(self, filename: str) -> None:
+        self.fout = open(filename, 'w')
+
+    def publish(self, topic, data, retain=False):
+        if isinstance(data, bytes):
+            self.fout.write(json.dumps({ 'topic': topic, 'data': base64.b64encode(data).decode() }) + '\n')
+            return True
+
+        # messages may hold numpy arrays with the orjson backend, which returns bytes
+        _line = dumps({ 'topic': topic, 'data': data })
+        self.fout.write((_line.decode() if isinstance(_line, bytes) else _line) + '\n')
+        return True
+
+    def store(self, bucket, object_name, byte_stream):
+        self.fout.write(json.dumps({ 'bucket': bucket, 'object_name': object_name, 'data': base64.b64encode(byte_stream).decode() }) + '\n')
+
+    def close(self):
+        self.fout.close()
+
+# run a scenario from begin to end as fast as possible
+def run_batch(scenario: Scenario, sink=None, sim_uid: str = 'sim-batch', products: bool = True) -> dict:
+    sink = sink if sink else NullSink()
+
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    constellation = Constellation(scenario) if scenario.constellation else None
+    ov_state = OverrideState()
+    sph = SpacePacketHandler() if products else None
+
+    ts = datetime.fromisoformat(scenario.begin).timestamp()
+    ts_f = datetime.fromisoformat(scenario.end).timestamp()
+
+    ticks, start = 0, time.perf_counter()
+    while ts <= ts_f:
+        tick(ts, gs_sim, sc_sim, ov_state, sink, store=sink if products else None, sph=sph, sim_uid=sim_uid, constellation=constellation)
+        ts += scenario.time_step
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    gs_sim.stop()
+    if products:
+        Products(object_store=sink).fd_stop_sim(sim_uid, gs_sim.state)
+
+    stats = { 'ticks': ticks, 'seconds': elapsed, 'ticks_per_second': ticks / elapsed if elapsed > 0 else float('inf') }
+    logger.info(f"Batch run done: { ticks } ticks in { elapsed:.3f}s ({ stats['ticks_per_second']:.1f} ticks/s)")
+
+    return stats
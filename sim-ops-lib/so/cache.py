@@ -0,0 +1,51 @@
+
+import threading, logging
+from skyfield.api import load, EarthSatellite
+
+logger = logging.getLogger(__name__)
+
+# process-wide cache of immutable skyfield objects, shared by all simulators
+_LOCK = threading.Lock()
+_TIMESCALE = None
+_EPHEMERIS = {}
+_SATELLITES = {}
+
+def get_timescale():
+    global _TIMESCALE
+
+    with _LOCK:
+        if _TIMESCALE is None:
+            _TIMESCALE = load.timescale()
+
+    return _TIMESCALE
+
+# jplephem memory-maps the kernel segments, so a single kernel object keeps a single mapping of the file
+def get_ephemeris(filename: str = 'de421.bsp'):
+    with _LOCK:
+        if filename not in _EPHEMERIS:
+            logger.info(f"Loading ephemeris: { filename }")
+            _EPHEMERIS[filename] = load(filename)
+
+    return _EPHEMERIS[filename]
+
+def parse_tle(tle: str) -> list[str]:
+    return [x.strip() for x in tle.split("\n") if len(x.strip()) > 0]
+
+# satellites keyed by the normalized TLE text
+def get_satellite(tle: str) -> EarthSatellite:
+    lines = parse_tle(tle)
+    key = '\n'.join(lines)
+
+    with _LOCK:
+        if key not in _SATELLITES:
+            _SATELLITES[key] = EarthSatellite(lines[1], lines[2], lines[0])
+
+    return _SATELLITES[key]
+
+def clear() -> None:
+    global _TIMESCALE
+
+    with _LOCK:
+        _TIMESCALE = None
+        _EPHEMERIS.clear()
+        _SATELLITES.clear()
@@ -0,0 +1,335 @@
+
+import re, copy, logging
+from datetime import datetime
+from dataclasses import dataclass
+import numpy as np
+import pytz
+from skyfield.api import wgs84
+from skyfield.framelib import itrs
+from skyfield.sgp4lib import TEME
+from sgp4.api import SatrecArray, SGP4_ERRORS
+
+from .core import Scenario, Status, TTCModes, TTCState, AOCSTarget
+from .cache import get_timescale, get_ephemeris, get_satellite, parse_tle
+
+logger = logging.getLogger(__name__)
+
+# WGS84 ellipsoid, and the earth radius skyfield uses for is_sunlit
+_A, _F = 6378.137, 1 / 298.257223563
+_E2 = _F * (2 - _F)
+_ERAD = 6378.137
+
+# memory dump rate per TTC mode value, as in SpacecraftSim._update_memory
+def _dump_rate(mode: TTCModes) -> float:
+    _mod = 0.6 if mode.name[-3:] == 'LBR' else 1.2
+    _mod = _mod * 3 if mode.name[0] == 'X' else _mod
+    return _mod * { 'Sup': 1, 'Res': 1/4, 'Sub': 1/8 }[mode.name.split('_')[1]]
+
+_DUMP_RATE = np.array([0.0] + [_dump_rate(x) for x in TTCModes])
+
+# struct of arrays, one entry per spacecraft, field names follow SpacecraftState
+@dataclass
+class ConstellationState:
+    ts: float
+    position: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    altitude: np.ndarray
+    elevation: np.ndarray
+    distance: np.ndarray
+    is_sunlit: np.ndarray
+
+    aocs_mode: np.ndarray
+    aocs_prev_mode: np.ndarray
+    aocs_damp: np.ndarray
+    aocs_rotation: np.ndarray
+    aocs_rates: np.ndarray
+    aocs_sun_angle: np.ndarray
+    aocs_nadir_angle: np.ndarray
+
+    ttc_mode: np.ndarray
+    ttc_tx_status: np.ndarray
+    ttc_snr_ul: np.ndarray
+    ttc_state_ul: np.ndarray
+
+    eps_sol_array: np.ndarray
+    eps_net_power: np.ndarray
+    eps_battery_dod: np.ndarray
+    eps_temperature: np.ndarray
+    safe_mode: np.ndarray
+    triggered_safe_mode: np.ndarray
+
+    dhs_mem_dump_enabled: np.ndarray
+    dhs_memory: np.ndarray
+    dhs_tm_counter: np.ndarray
+
+    pl_gps_status: np.ndarray
+    pl_camera_status: np.ndarray
+
+    @classmethod
+    def new(cls, n: int, ts: float):
+        return cls(
+            ts=ts,
+            position=np.zeros((n, 3)), latitude=np.zeros(n), longitude=np.zeros(n), altitude=np.zeros(n),
+            elevation=np.zeros(n), distance=np.zeros(n), is_sunlit=np.zeros(n, dtype=bool),
+            aocs_mode=np.full(n, AOCSTarget.NADIR.value), aocs_prev_mode=np.full(n, AOCSTarget.NADIR.value),
+            aocs_damp=np.ones(n), aocs_rotation=np.zeros((n, 3)), aocs_rates=np.zeros((n, 3)),
+            aocs_sun_angle=np.zeros(n), aocs_nadir_angle=np.zeros(n),
+            ttc_mode=np.full(n, TTCModes.S_Sub_LBR.value), ttc_tx_status=np.ones(n, dtype=bool),
+            ttc_snr_ul=np.full(n, 12.0), ttc_state_ul=np.full(n, TTCState.NO_RF.value),
+            eps_sol_array=np.ones((n, 2), dtype=bool), eps_net_power=np.zeros(n), eps_battery_dod=np.full(n, 50.0),
+            eps_temperature=np.full(n, 40.0), safe_mode=np.zeros(n, dtype=bool), triggered_safe_mode=np.zeros(n, dtype=bool),
+            dhs_mem_dump_enabled=np.zeros(n, dtype=bool), dhs_memory=np.full(n, 50.0), dhs_tm_counter=np.zeros(n, dtype=int),
+            pl_gps_status=np.zeros(n, dtype=bool), pl_camera_status=np.zeros(n, dtype=bool)
+        )
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+# geodetic latitude, longitude (degrees) and height (km) of ITRS positions, shape (n, 3)
+def geodetic(xyz: np.ndarray):
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    p = np.hypot(x, y)
+
+    lat = np.arctan2(z, p * (1 - _E2))
+    for i in range(5):
+        lat = np.arctan2(z + _E2 * _A / np.sqrt(1 - _E2 * np.sin(lat)**2) * np.sin(lat), p)
+
+    h = p * np.cos(lat) + z * np.sin(lat) - _A * np.sqrt(1 - _E2 * np.sin(lat)**2)
+
+    return np.degrees(lat), np.degrees(np.arctan2(y, x)), h
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / np.linalg.norm(v, axis=1)[:, None]
+
+def _angle(v1: np.ndarray, v2: np.ndarray) -> np.ndarray:
+    return np.degrees(np.arccos(np.clip(np.einsum('ij,ij->i', _unit(v1), _unit(v2)), -1.0, 1.0)))
+
+# row-wise SpacecraftSim._aocs_euler_angles for v2 = [0, 0, -1]
+def _euler_angles(v1: np.ndarray) -> np.ndarray:
+    v1 = _unit(v1)
+    v2 = np.array([0.0, 0.0, -1.0])
+
+    angle = np.arccos(np.clip(v1 @ v2, -1.0, 1.0))
+    axis = _unit(np.cross(v1, v2))
+
+    w = np.cos(angle / 2)
+    x, y, z = (axis * np.sin(angle / 2)[:, None]).T
+    roll = np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x**2 + y**2))
+    pitch = np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0))
+    yaw = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y**2 + z**2))
+
+    return np.degrees(np.vstack([roll, pitch, yaw]).T)
+
+def topic_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', name).strip('-')
+
+# N spacecraft stepped together: SGP4 over all TLEs at once, EPS, DHS memory,
+# TTC SNR and AOCS angles as array operations over the constellation
+class Constellation:
+    def __init__(self, scenario: Scenario, tles: list[str] = None, initial_state: ConstellationState = None) -> None:
+        self.scenario = scenario
+        self.tles = tles if tles else scenario.constellation
+
+        self.time_scale = get_timescale()
+        self.ephemeris = get_ephemeris('de421.bsp')
+        self.earth = self.ephemeris['earth']
+        self.sun = self.ephemeris['sun']
+
+        self.satellites = [get_satellite(x) for x in self.tles]
+        self.names = [parse_tle(x)[0] for x in self.tles]
+        self.topics = [f"spacecraft/{ topic_name(x) }" for x in self.names]
+        self.models = SatrecArray([x.model for x in self.satellites])
+        self.size = len(self.satellites)
+
+        # SGP4 error code per spacecraft, spacecraft in error keep their last position
+        self.errors = np.zeros(self.size, dtype=int)
+
+        location = wgs84.latlon(scenario.ground_station.latitude, scenario.ground_station.longitude, elevation_m=scenario.ground_station.altitude)
+        self.gs_position = location.itrs_xyz.km
+        _lat, _lon = np.radians(scenario.ground_station.latitude), np.radians(scenario.ground_station.longitude)
+        self.gs_up = np.array([np.cos(_lat) * np.cos(_lon), np.cos(_lat) * np.sin(_lon), np.sin(_lat)])
+
+        self.rng = np.random.default_rng()
+
+        if initial_state:
+            self.state = initial_state
+        else:
+            self.state = ConstellationState.new(self.size, 0.0)
+            self._initial_state(scenario.sc_initial_state)
+
+    # scenario initial spacecraft state applies to every spacecraft
+    def _initial_state(self, initial: dict) -> None:
+        if not initial:
+            return
+
+        for k, v in initial.items():
+            match k:
+                case 'eps_battery_dod' | 'dhs_memory':
+                    getattr(self.state, k)[:] = v
+                case 'ttc_tx_status' | 'pl_gps_status' | 'pl_camera_status':
+                    getattr(self.state, k)[:] = v == Status.on or v == 'on'
+                case 'ttc_mode':
+                    self.state.ttc_mode[:] = v.value if isinstance(v, TTCModes) else TTCModes[v].value
+                case 'dhs_obsw_mode':
+                    self.state.safe_mode[:] = v == Status.safe or v == 'safe'
+
+    def _update_position(self, _state: ConstellationState, ts: float) -> np.ndarray:
+        t = self.time_scale.from_datetime(datetime.fromtimestamp(ts, tz=pytz.UTC))
+
+        # SGP4 for all spacecraft in one call on the UTC Julian date, TEME to GCRS and ITRS with one rotation each
+        _jd, _fraction = np.array([t.whole]), np.array([t.ut1_fraction - t.dut1 / 86400.0])
+        e, r, _ = self.models.sgp4(_jd, _fraction)
+        self._check_errors(e[:, 0])
+        _teme = TEME.rotation_at(t)
+        _state.position = np.where(self.errors[:, None] == 0, r[:, 0, :] @ _teme, _state.position)
+        _itrs = _state.position @ itrs.rotation_at(t).T
+
+        _state.latitude, _state.longitude, _state.altitude = geodetic(_itrs)
+
+        d = _itrs - self.gs_position
+        _state.distance = np.linalg.norm(d, axis=1)
+        _state.elevation = np.degrees(np.arcsin(d @ self.gs_up / _state.distance))
+
+        # in shadow if the line towards the sun crosses the earth
+        _sun = self.earth.at(t).observe(self.sun).position.km
+        _dir = _unit(_sun - _state.position)
+        b = np.einsum('ij,ij->i', _state.position, _dir)
+        disc = b**2 - (np.einsum('ij,ij->i', _state.position, _state.position) - _ERAD**2)
+        _state.is_sunlit = ~((disc > 0) & (b < 0))
+
+        return _sun
+
+    # logged when a spacecraft enters or leaves an SGP4 error, not on every tick
+    def _check_errors(self, errors: np.ndarray) -> None:
+        for i in np.nonzero(errors != self.errors)[0]:
+            if errors[i] != 0:
+                logger.error(f"SGP4 error for { self.names[i] }: { SGP4_ERRORS[errors[i]] }")
+            else:
+                logger.info(f"SGP4 recovered for { self.names[i] }")
+        self.errors = errors.copy()
+
+    def _simulate_aocs(self, _state: ConstellationState, sun: np.ndarray) -> None:
+        nadir_dir = -_state.position
+        sun_dir = sun - _state.position
+
+        changed = _state.aocs_mode != _state.aocs_prev_mode
+        _state.aocs_damp = np.where(changed, 0.0, _state.aocs_damp)
+        _state.aocs_prev_mode = _state.aocs_mode.copy()
+        _state.aocs_damp = np.minimum(_state.aocs_damp + 0.05, 1.0)
+
+        sun_mode = _state.aocs_mode == AOCSTarget.SUN.value
+        new_rotation = _euler_angles(np.where(sun_mode[:, None], sun_dir, nadir_dir))
+        _angle_between = _angle(sun_dir, nadir_dir)
+        _state.aocs_nadir_angle = np.where(sun_mode, _angle_between * _state.aocs_damp, (1 - _state.aocs_damp) * _state.aocs_nadir_angle)
+        _state.aocs_sun_angle = np.where(sun_mode, (1 - _state.aocs_damp) * _state.aocs_sun_angle, _angle_between * _state.aocs_damp)
+
+        _state.aocs_rates = np.absolute(new_rotation * _state.aocs_damp[:, None]) - np.absolute(_state.aocs_rotation)
+        _state.aocs_rotation = new_rotation * _state.aocs_damp[:, None]
+
+    def _update_ttc(self, _state: ConstellationState, ul_power: float) -> None:
+        _state.ttc_snr_ul = -20 * np.log10(_state.distance) + 28 + ul_power
+
+        # the ground station only hears spacecraft above the horizon
+        snr, _on = _state.ttc_snr_ul, _state.ttc_tx_status & (_state.elevation > 0)
+        _state.ttc_state_ul = np.select([_on & (snr > 8), _on & (snr > -3), _on & (snr > -4)],
+                                        [TTCState.BIT_LOCK.value, TTCState.PSK_LOCK.value, TTCState.PLL_LOCK.value], TTCState.NO_RF.value)
+
+    def _trigger_safe_mode(self, _state: ConstellationState, mask: np.ndarray) -> None:
+        _state.aocs_mode = np.where(mask, AOCSTarget.SUN.value, _state.aocs_mode)
+        _state.ttc_mode = np.where(mask, TTCModes.S_Sup_LBR.value, _state.ttc_mode)
+        _state.safe_mode |= mask
+        _state.pl_gps_status &= ~mask
+        _state.pl_camera_status &= ~mask
+
+    def _update_eps(self, _state: ConstellationState, ts: float) -> None:
+        _sunlit = _state.is_sunlit.astype(float)
+        _state.eps_net_power = (-2.0 + 5 * _sunlit * _state.eps_sol_array.sum(axis=1)
+                                - 0.5 * _state.pl_gps_status - 4 * _state.pl_camera_status - 5 * _state.ttc_tx_status) / 100
+
+        if _state.ts > 0:
+            _state.eps_battery_dod = _state.eps_battery_dod - _state.eps_net_power * (ts - _state.ts)
+        _state.eps_battery_dod = np.clip(_state.eps_battery_dod, 0, 100)
+
+        # trigger safe mode once when running out of battery
+        _low = _state.eps_battery_dod >= 95
+        self._trigger_safe_mode(_state, _low & ~_state.triggered_safe_mode)
+        _state.triggered_safe_mode = _low
+
+        target_temp = 10 + 10 * _state.ttc_tx_status + 20 * _sunlit + 10 * _state.pl_gps_status + 10 * _state.pl_camera_status
+        _state.eps_temperature = (_state.eps_temperature - (_state.eps_temperature - target_temp) * self.scenario.time_step * 0.005
+                                  + self.rng.random(self.size) - 0.5)
+
+        self._trigger_safe_mode(_state, _state.eps_temperature >= 60)
+
+    def _update_dhs(self, _state: ConstellationState, ts: float) -> None:
+        _state.dhs_tm_counter = _state.dhs_tm_counter + 1
+        _dt = ts - _state.ts
+
+        _state.dhs_mem_dump_enabled &= _state.dhs_memory > 0.0
+
+        _use = 0.0001 + 0.5 * _state.pl_camera_status + 0.0005 * _state.pl_gps_status
+        _state.dhs_memory = _state.dhs_memory + _use * _dt - _state.dhs_mem_dump_enabled * _DUMP_RATE[_state.ttc_mode] * _dt
+
+        _full = _state.dhs_memory >= 100
+        _state.dhs_memory = np.clip(_state.dhs_memory, 0, 100)
+        _state.pl_camera_status &= ~_full
+        _state.pl_gps_status &= ~_full
+
+    def ping(self, ts: float, gs_state = None) -> ConstellationState:
+        # arrays are replaced by every update, only the ones updated in place need copies
+        _state = copy.copy(self.state)
+        for k in ['safe_mode', 'pl_gps_status', 'pl_camera_status', 'dhs_mem_dump_enabled']:
+            setattr(_state, k, getattr(_state, k).copy())
+
+        sun = self._update_position(_state, ts)
+        self._simulate_aocs(_state, sun)
+        self._update_ttc(_state, gs_state.power_ul * int(gs_state.carrier_ul == Status.on) if gs_state else 50)
+        self._update_eps(_state, ts)
+        self._update_dhs(_state, ts)
+
+        _state.ts = ts
+        self.state = _state
+
+        return self.state
+
+    # per spacecraft telemetry, with enum names as in SpacecraftState.to_dict; of the current state or of an earlier snapshot
+    def to_dicts(self, state: ConstellationState = None) -> list[dict]:
+        s = state if state is not None else self.state
+        _status = lambda x: [Status.on.name if y else Status.off.name for y in x.tolist()]
+        _sol = [[Status.nominal.name if y else Status.disabled.name for y in x] for x in s.eps_sol_array.tolist()]
+
+        columns = {
+            'position': s.position.tolist(),
+            'pl_gps_pos': np.vstack([s.latitude, s.longitude, s.altitude]).T.tolist(),
+            'elevation': s.elevation.tolist(),
+            'distance': s.distance.tolist(),
+            'is_sunlit': s.is_sunlit.tolist(),
+            'aocs_mode': [AOCSTarget(x).name for x in s.aocs_mode.tolist()],
+            'aocs_rotation': s.aocs_rotation.tolist(),
+            'aocs_rates': s.aocs_rates.tolist(),
+            'aocs_sun_angle': s.aocs_sun_angle.tolist(),
+            'aocs_nadir_angle': s.aocs_nadir_angle.tolist(),
+            'aocs_damp': s.aocs_damp.tolist(),
+            'ttc_mode': [TTCModes(x).name for x in s.ttc_mode.tolist()],
+            'ttc_tx_status': _status(s.ttc_tx_status),
+            'ttc_snr_ul': s.ttc_snr_ul.tolist(),
+            'ttc_state_ul': [TTCState(x).name for x in s.ttc_state_ul.tolist()],
+            'eps_net_power': s.eps_net_power.tolist(),
+            'eps_sol_array': _sol,
+            'eps_battery_dod': s.eps_battery_dod.tolist(),
+            'eps_temperature': s.eps_temperature.tolist(),
+            'dhs_obsw_mode': [Status.safe.name if x else Status.nominal.name for x in s.safe_mode.tolist()],
+            'dhs_mem_dump_enabled': s.dhs_mem_dump_enabled.tolist(),
+            'dhs_memory': s.dhs_memory.tolist(),
+            'dhs_tm_counter': s.dhs_tm_counter.tolist(),
+            'pl_gps_status': _status(s.pl_gps_status),
+            'pl_camera_status': _status(s.pl_camera_status)
+        }
+
+        keys = list(columns.keys())
+        return [dict(ts=s.ts, name=name, **dict(zip(keys, values))) for name, values in zip(self.names, zip(*columns.values()))]
+
+    def publish(self, backend, state: ConstellationState = None) -> None:
+        for topic, data in zip(self.topics, self.to_dicts(state)):
+            backend.publish(topic, data)
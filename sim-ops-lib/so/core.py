@@ -1,6 +1,9 @@
 
-import os, json, zmq
-from dataclasses import dataclass, asdict
+import os, json, time, hashlib, threading, logging, zmq, urllib3
+from collections import deque, Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from operator import attrgetter
 from enum import Enum
 from scipy.spatial.transform import Rotation
 from numpy import degrees, ndarray
@@ -8,9 +11,13 @@ from skyfield.toposlib import GeographicPosition
 from skyfield.positionlib import Geocentric
 from typing import Any
 from minio import Minio
+from minio.error import S3Error
 from io import BytesIO
 
 from .mqtt import MQTT
+from .archive import SegmentReader
+
+logger = logging.getLogger(__name__)
 
 class Status(int, Enum):
     enabled = 1
@@ -78,6 +85,8 @@ class Scenario:
     ground_station: GroundStation = None
     gs_initial_state: Any = None
     sc_initial_state: Any = None 
+    constellation: list[str] = None # TLEs of additional spacecraft, see so.constellation
+    ground_stations: list[GroundStation] = None # ground station network, see so.network
 
 # load scenario from file
 def load_scenario(uid):
@@ -89,6 +98,12 @@ def load_scenario(uid):
 
             gs_initial_state, sc_initial_state = None, None
 
+            # a network of stations, the first one is the primary station if none is given
+            if 'ground_stations' in data:
+                data['ground_stations'] = [GroundStation(**x) for x in data['ground_stations']]
+                if 'ground_station' not in data:
+                    data['ground_station'] = asdict(data['ground_stations'][0])
+
             gs = GroundStation(**data['ground_station'])
             del data['ground_station']
 
@@ -134,17 +149,60 @@ def load_scenario(uid):
             return scenario
 
 class Backend:
-    def __init__(self, scenario):
+    def __init__(self, scenario, prefix=''):
         self.scenario = scenario
+        self.prefix = prefix
 
         self.mqtt = MQTT()
 
-    def publish(self, topic, data):
+    def publish(self, topic, data, retain=False):
 
-        self.mqtt.publish(topic, data)
+        self.mqtt.publish(self.prefix + topic, data, retain=retain)
 
         return True
 
+    def stats(self):
+        return self.mqtt.stats()
+
+    def close(self):
+        self.mqtt.close()
+
+# shallow copy of a slotted dataclass through its constructor, copy.copy would
+# otherwise go through the much slower __reduce_ex__ for classes without __dict__
+def slotted_copy(cls):
+    _values = attrgetter(*[x.name for x in fields(cls)])
+    cls.__copy__ = lambda self: cls(*_values(self))
+
+    return cls
+
+# enum field of a slotted dataclass kept in its slot as the small int value, read back as the member
+class _EnumSlot:
+    def __init__(self, slot, enum) -> None:
+        self.slot = slot
+        self.members = dict((x.value, x) for x in enum)
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        value = self.slot.__get__(obj, objtype)
+        return self.members[value] if value is not None else None
+
+    def __set__(self, obj, value) -> None:
+        self.slot.__set__(obj, value.value if isinstance(value, Enum) else value)
+
+# enum fields of a slotted dataclass packed as small ints, code keeps using the enum members;
+# pickled (session snapshots, worker processes) as the ints too
+def packed_enums(cls):
+    _slots = [cls.__dict__[x.name] for x in fields(cls)]
+    for x in fields(cls):
+        if isinstance(x.type, type) and issubclass(x.type, Enum):
+            setattr(cls, x.name, _EnumSlot(cls.__dict__[x.name], x.type))
+    cls.__getstate__ = lambda self: [x.__get__(self) for x in _slots]
+    cls.__setstate__ = lambda self, state: [x.__set__(self, v) for x, v in zip(_slots, state)]
+
+    return cls
+
 # return enum types names instead of values (numbers)
 def custom_dict_factory(kv_pairs):
     def convert_value(obj):
@@ -242,23 +300,166 @@ SO_MINIO_ROOT_PASSWORD = os.getenv('SO_MINIO_ROOT_PASSWORD', 'mypassword')
 if not SO_MINIO_ROOT_PASSWORD:
     SO_MINIO_ROOT_PASSWORD = 'mypassword'
 
+# connections kept to MinIO, and the asynchronous uploads: worker threads, queued objects
+# (store_async waits when full) and attempts per object
+SO_MINIO_POOL = os.getenv('SO_MINIO_POOL', '10')
+if not SO_MINIO_POOL:
+    SO_MINIO_POOL = '10'
+SO_MINIO_WORKERS = os.getenv('SO_MINIO_WORKERS', '4')
+if not SO_MINIO_WORKERS:
+    SO_MINIO_WORKERS = '4'
+SO_MINIO_QUEUE = os.getenv('SO_MINIO_QUEUE', '1000')
+if not SO_MINIO_QUEUE:
+    SO_MINIO_QUEUE = '1000'
+SO_MINIO_RETRIES = os.getenv('SO_MINIO_RETRIES', '3')
+if not SO_MINIO_RETRIES:
+    SO_MINIO_RETRIES = '3'
+
+FD_BUCKET = 'flight-dynamics'
+
 class ObjectStore:
-    def __init__(self, endpoint=SO_MINIO_ENDPOINT, access_key=SO_MINIO_ROOT_USER, secret_key=SO_MINIO_ROOT_PASSWORD):
+    def __init__(self, endpoint=SO_MINIO_ENDPOINT, access_key=SO_MINIO_ROOT_USER, secret_key=SO_MINIO_ROOT_PASSWORD, client=None, workers: int = None):
         self.endpoint = endpoint
         self.access_key = access_key
         self.secret_key = secret_key
 
-        self.client = Minio(self.endpoint, access_key=self.access_key, secret_key=self.secret_key, secure=False)
+        # one pool of keep-alive connections, shared by the upload workers
+        self.http_client = urllib3.PoolManager(maxsize=int(SO_MINIO_POOL), block=True, timeout=urllib3.Timeout(connect=5.0, read=30.0),
+                                               retries=urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]))
+        self.client = client if client else Minio(self.endpoint, access_key=self.access_key, secret_key=self.secret_key, secure=False, http_client=self.http_client)
+
+        # buckets known to exist, checked once per bucket instead of before every object
+        self.buckets = set()
+
+        # asynchronous uploads, the workers start with the first one
+        self.workers = int(workers if workers else SO_MINIO_WORKERS)
+        self.retries = int(SO_MINIO_RETRIES)
+        self.backoff = 0.5
+        # bucket -> queued objects, served in turns so that one session's backlog does not delay others
+        self.uploads = OrderedDict()
+        self.queued = 0
+        self.pending = 0
+        self.pending_buckets = Counter()
+        self.cond = threading.Condition()
+        self.threads = []
+        self.uploaded, self.failed, self.retried = 0, 0, 0
+
+        # TM packets archived as segments
+        self.segments = SegmentReader(self)
+
+        # flight dynamics products by object name, (etag, product), and the listing they were checked against
+        self.fd_products = {}
+        self.fd_names = []
+        self.fd_lock = threading.Lock()
+
+    def _bucket(self, bucket):
+        if bucket in self.buckets:
+            return
+
+        try:
+            if not self.client.bucket_exists(bucket):
+                self.client.make_bucket(bucket)
+        except S3Error as e:
+            # created in the meantime by another worker or process
+            if e.code not in ['BucketAlreadyOwnedByYou', 'BucketAlreadyExists']:
+                raise
+
+        self.buckets.add(bucket)
 
     # store space packet tm
     def store(self, bucket, packet_id, byte_stream):
         # create bucket if does not exist
-        if not self.client.bucket_exists(bucket):
-            self.client.make_bucket(bucket)
+        self._bucket(bucket)
 
         data = BytesIO(byte_stream)
 
-        self.client.put_object(bucket_name=bucket, object_name=packet_id, data=data, length=len(byte_stream))
+        try:
+            result = self.client.put_object(bucket_name=bucket, object_name=packet_id, data=data, length=len(byte_stream))
+        except S3Error as e:
+            # bucket removed behind our back, check again next time
+            if e.code == 'NoSuchBucket':
+                self.buckets.discard(bucket)
+            raise
+
+        # products written here are known without downloading them again
+        if bucket == FD_BUCKET:
+            self._fd_cache(packet_id, getattr(result, 'etag', None), json.loads(byte_stream))
+
+    # queue the object for the upload workers, retried with backoff; waits only if the queue is full
+    def store_async(self, bucket, packet_id, byte_stream):
+        with self.cond:
+            if len(self.threads) == 0:
+                self.threads = [threading.Thread(target=self._upload_loop, name=f"so-upload-{ i }", daemon=True) for i in range(self.workers)]
+                for t in self.threads:
+                    t.start()
+
+            while self.queued >= int(SO_MINIO_QUEUE):
+                self.cond.wait()
+            self.uploads.setdefault(bucket, deque()).append((packet_id, byte_stream))
+            self.queued += 1
+            self.pending += 1
+            self.pending_buckets[bucket] += 1
+            self.cond.notify_all()
+
+    def _upload_loop(self):
+        while True:
+            with self.cond:
+                while len(self.uploads) == 0:
+                    self.cond.wait()
+                bucket, queue = next(iter(self.uploads.items()))
+                packet_id, byte_stream = queue.popleft()
+                if len(queue) > 0:
+                    self.uploads.move_to_end(bucket)
+                else:
+                    del self.uploads[bucket]
+                self.queued -= 1
+                self.cond.notify_all()
+
+            _ok = self.store_retry(bucket, packet_id, byte_stream)
+
+            with self.cond:
+                self.pending -= 1
+                self.pending_buckets[bucket] -= 1
+                if self.pending_buckets[bucket] == 0:
+                    del self.pending_buckets[bucket]
+                self.cond.notify_all()
+
+    # store with retries and backoff, false once all attempts failed
+    def store_retry(self, bucket, packet_id, byte_stream) -> bool:
+        for attempt in range(self.retries):
+            try:
+                self.store(bucket, packet_id, byte_stream)
+                with self.cond:
+                    self.uploaded += 1
+                return True
+            except Exception as e:
+                logger.warning(f"Failed upload { bucket }/{ packet_id } (attempt { attempt + 1 }): { e }")
+                if attempt + 1 < self.retries:
+                    with self.cond:
+                        self.retried += 1
+                    time.sleep(self.backoff * 2**attempt)
+
+        logger.error(f"Giving up upload { bucket }/{ packet_id }")
+        with self.cond:
+            self.failed += 1
+
+        return False
+
+    # wait for the queued uploads to the given buckets (all buckets by default), other sessions may
+    # keep queueing; true if they were done within timeout seconds
+    def flush(self, timeout: float = 60.0, buckets: list = None) -> bool:
+        _pending = lambda: self.pending if buckets is None else sum([self.pending_buckets[x] for x in buckets if x in self.pending_buckets])
+
+        _deadline = time.monotonic() + timeout
+        with self.cond:
+            while _pending() > 0 and time.monotonic() < _deadline:
+                self.cond.wait(_deadline - time.monotonic())
+
+            return _pending() == 0
+
+    def stats(self) -> dict:
+        with self.cond:
+            return { 'queued': self.pending, 'uploaded': self.uploaded, 'failed': self.failed, 'retried': self.retried, 'buckets': len(self.buckets) }
 
     def get_objects_tm(self):
         buckets = [x.name for x in self.client.list_buckets()]
@@ -266,28 +467,67 @@ class ObjectStore:
         data = []
         for bucket in buckets:
             if bucket.startswith('sim-') and bucket.endswith('-tm'):
-                objects = self.client.list_objects(bucket)
-                data.append({ 'bucket': bucket, 'data': [x.object_name for x in objects] })
+                # packets archived one per object and in segments
+                objects = [x.object_name for x in self.client.list_objects(bucket) if not x.is_dir]
+                data.append({ 'bucket': bucket, 'data': sorted(objects + self.segments.names(bucket)) })
 
         return data
 
-    # retrieve objects with flight dynamics products
-    def get_objects_fd(self):
-        if not self.client.bucket_exists('flight-dynamics'):
-            return []
-
-        objects = self.client.list_objects('flight-dynamics')
-
-        data = []
-        for object in objects:
-            response = self.client.get_object('flight-dynamics', object.object_name)
-            data.append(response.json())
-        data.reverse()
+    def _fd_cache(self, object_name, etag, product):
+        self.fd_lock.acquire()
+        try:
+            self.fd_products[object_name] = (etag, product)
+        finally:
+            self.fd_lock.release()
+
+    # flight dynamics product, downloaded only if its ETag changed since it was cached
+    def _fd_product(self, object_name, etag=None):
+        if etag is None:
+            etag = self.client.stat_object(FD_BUCKET, object_name).etag
+
+        self.fd_lock.acquire()
+        try:
+            _etag, product = self.fd_products.get(object_name, (None, None))
+        finally:
+            self.fd_lock.release()
+
+        if product is None or _etag != etag:
+            product = self.get(FD_BUCKET, object_name, is_json=True)
+            self._fd_cache(object_name, etag, product)
+
+        return product
+
+    # flight dynamics products, newest first: one listing per call, bodies only of new or changed products;
+    # offset and limit page the products, data=False leaves out the readings; version changes with any product
+    def fd_index(self, offset: int = 0, limit: int = 0, data: bool = True) -> dict:
+        if FD_BUCKET not in self.buckets and not self.client.bucket_exists(FD_BUCKET):
+            return { 'version': '', 'total': 0, 'products': [] }
+
+        objects = list(self.client.list_objects(FD_BUCKET))
+        products = [self._fd_product(x.object_name, etag=x.etag) for x in objects]
+        products.reverse()
+
+        self.fd_lock.acquire()
+        try:
+            # products removed from the bucket
+            for name in set(self.fd_products.keys()) - set([x.object_name for x in objects]):
+                del self.fd_products[name]
+        finally:
+            self.fd_lock.release()
+
+        version = hashlib.sha1(''.join([f"{ x.object_name }:{ x.etag };" for x in objects]).encode()).hexdigest()
+        page = products[offset:offset + limit] if limit > 0 else products[offset:]
+        page = [dict(x) if data else dict((k, v) for k, v in x.items() if k != 'data') for x in page]
+
+        return { 'version': version, 'total': len(products), 'products': page }
 
-        return data
+    # retrieve objects with flight dynamics products
+    def get_objects_fd(self, offset: int = 0, limit: int = 0, data: bool = True):
+        return self.fd_index(offset=offset, limit=limit, data=data)['products']
 
-    def get(self, bucket, object_name, is_json=False):
-        response = self.client.get_object(bucket, object_name)
+    # offset and length read a range of the object
+    def get(self, bucket, object_name, is_json=False, offset=0, length=0):
+        response = self.client.get_object(bucket, object_name, offset=offset, length=length)
 
         if is_json:
             data = response.json()
@@ -296,9 +536,14 @@ class ObjectStore:
 
         return data
 
+    # TM packet by name (its time), from its segment or its own object
+    def get_packet(self, bucket, object_name):
+        data = self.segments.get(bucket, object_name)
+
+        return data if data is not None else self.get(bucket, object_name)
+
     def update_object(self, bucket, object_name, key, value):
-        response = self.client.get_object(bucket, object_name)
-        data = response.json()
+        data = dict(self._fd_product(object_name)) if bucket == FD_BUCKET else self.get(bucket, object_name, is_json=True)
         if key in data:
             data[key] = value
 
@@ -306,21 +551,42 @@ class ObjectStore:
 
         return data
 
+    # several (object name, key, value) updates written concurrently, apart from the upload queue so
+    # that they do not wait behind the TM packets of running sessions
+    def update_objects(self, bucket, updates: list) -> list:
+        def _update(update):
+            object_name, key, value = update
+            data = dict(self._fd_product(object_name)) if bucket == FD_BUCKET else self.get(bucket, object_name, is_json=True)
+            if key in data:
+                data[key] = value
+            self.store_retry(bucket, object_name, json.dumps(data).encode())
+
+            return data
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(_update, updates))
+
 class Products:
     def __init__(self, object_store: ObjectStore = ObjectStore()):
         self.object_store = object_store
 
-    def fd_start_sim(self):
-        objects = self.object_store.get_objects_fd()
+    # products of the session starting, products of other sessions are left to their next start
+    # (products written before sessions existed belong to the default session)
+    def fd_start_sim(self, session: str = 'default'):
+        objects = self.object_store.get_objects_fd(data=False)
 
+        updates = []
         for object in objects:
-            if object['status'] == 1:
+            if object['status'] == 1 and object.get('session', 'default') == session:
                 if object['validity'] > 0:
-                    self.object_store.update_object('flight-dynamics', object['id'], 'status', 2)
+                    updates.append((object['id'], 'status', 2))
                 else:
-                    self.object_store.update_object('flight-dynamics', object['id'], 'status', -1)
+                    updates.append((object['id'], 'status', -1))
+
+        if len(updates) > 0:
+            self.object_store.update_objects(FD_BUCKET, updates)
 
-    def fd_stop_sim(self, sim_uid, gs_state):
+    def fd_stop_sim(self, sim_uid, gs_state, session: str = 'default'):
         _doppler = any([x[-2] for x in gs_state.flight_dynamics])
         _ranging = any([x[-1] for x in gs_state.flight_dynamics])
 
@@ -331,7 +597,7 @@ class Products:
         else:
             _validity = 0
 
-        data = { 'id': sim_uid, 'status': 0, 'validity': _validity, 'data': gs_state.flight_dynamics }
+        data = { 'id': sim_uid, 'session': session, 'status': 0, 'validity': _validity, 'data': gs_state.flight_dynamics }
         self.object_store.store('flight-dynamics', sim_uid, json.dumps(data).encode())
 
         return data
@@ -0,0 +1,132 @@
+
+import os, threading, logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# full: complete states on the legacy topics, delta: changed fields on <topic>/delta with
+# a retained complete state on <topic>/keyframe every SO_KEYFRAME_INTERVAL messages
+SO_PUBLISH = os.getenv('SO_PUBLISH', 'full')
+if not SO_PUBLISH:
+    SO_PUBLISH = 'full'
+SO_KEYFRAME_INTERVAL = os.getenv('SO_KEYFRAME_INTERVAL', '30')
+if not SO_KEYFRAME_INTERVAL:
+    SO_KEYFRAME_INTERVAL = '30'
+
+_MISSING = object()
+
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    if a.__class__ is not b.__class__:
+        return False
+    if a.__class__ is np.ndarray:
+        return np.array_equal(a, b)
+
+    return a == b
+
+# changed fields of a message: 'set' replaces values, 'append' extends lists that only grew
+# (flight dynamics readings, TC history), unchanged lists are detected by identity as states
+# share them between ticks
+def delta(previous: dict, data: dict) -> dict:
+    changes, appended = {}, {}
+
+    for k, v in data.items():
+        _prev = previous.get(k, _MISSING)
+        if _same(_prev, v):
+            continue
+
+        if v.__class__ is list and _prev.__class__ is list and len(v) > len(_prev) > 0 and v[:len(_prev)] == _prev:
+            appended[k] = v[len(_prev):]
+        else:
+            changes[k] = v
+
+    result = { 'set': changes }
+    if appended:
+        result['append'] = appended
+
+    return result
+
+# message from a previous one and a delta, as clients rebuild it
+def apply(data: dict, message: dict) -> dict:
+    data = dict(data)
+    data.update(message['set'])
+    for k, v in message.get('append', {}).items():
+        data[k] = data[k] + v
+
+    return data
+
+# publishes through another backend: a sequence number per topic, keyframes every
+# keyframe_interval messages or on demand and only changed fields in between
+class DeltaBackend:
+    def __init__(self, backend, keyframe_interval: int = None) -> None:
+        self.backend = backend
+        self.keyframe_interval = int(keyframe_interval if keyframe_interval else SO_KEYFRAME_INTERVAL)
+
+        # topic -> (sequence number, last message, messages since the last keyframe)
+        self.topics = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    # next message of every topic is a keyframe, e.g. for clients that lost a delta
+    def keyframe(self) -> None:
+        self.lock.acquire()
+        try:
+            self.pending.update(self.topics.keys())
+        finally:
+            self.lock.release()
+
+    def publish(self, topic, data, retain=False):
+        # binary payloads are not delta encoded
+        if isinstance(data, bytes):
+            return self.backend.publish(topic, data, retain=retain)
+
+        self.lock.acquire()
+        try:
+            seq, last, count = self.topics.get(topic, (0, None, 0))
+            _keyframe = last is None or count >= self.keyframe_interval or topic in self.pending
+            self.pending.discard(topic)
+            seq += 1
+            self.topics[topic] = (seq, data, 1 if _keyframe else count + 1)
+        finally:
+            self.lock.release()
+
+        if _keyframe:
+            return self.backend.publish(topic + '/keyframe', { 'seq': seq, 'data': data }, retain=True)
+        else:
+            return self.backend.publish(topic + '/delta', dict(seq=seq, **delta(last, data)))
+
+    def store(self, bucket, object_name, byte_stream):
+        return self.backend.store(bucket, object_name, byte_stream)
+
+    def close(self):
+        return self.backend.close()
+
+# client side of DeltaBackend for one topic: current message, or None while waiting for a
+# keyframe after a gap in the sequence numbers
+class DeltaDecoder:
+    def __init__(self) -> None:
+        self.seq = None
+        self.data = None
+
+    def synced(self) -> bool:
+        return self.data is not None
+
+    def keyframe(self, message: dict) -> dict:
+        if self.seq is None or self.data is None or message['seq'] > self.seq:
+            self.seq, self.data = message['seq'], message['data']
+
+        return self.data
+
+    def delta(self, message: dict) -> dict:
+        if self.data is None:
+            return None
+
+        if message['seq'] != self.seq + 1:
+            logger.warning(f"Delta sequence gap { self.seq } -> { message['seq'] }, waiting for a keyframe")
+            self.data = None
+            return None
+
+        self.seq, self.data = message['seq'], apply(self.data, message)
+
+        return self.data
@@ -0,0 +1,391 @@
+
+import os, json, logging, bisect, hashlib, tempfile, threading
+from dataclasses import dataclass
+from datetime import datetime
+import numpy as np
+import pytz
+from skyfield.api import wgs84
+from skyfield.searchlib import find_discrete
+
+from .core import Scenario
+from .cache import get_timescale, get_ephemeris, get_satellite, parse_tle
+
+logger = logging.getLogger(__name__)
+
+# columns of the geometry table, one row per sample
+COLUMNS = ['x', 'y', 'z', 'vx', 'vy', 'vz', 'latitude', 'longitude', 'altitude',
+           'gs_x', 'gs_y', 'gs_z', 'elevation', 'azimuth', 'distance', 'range_rate']
+_IDX = dict((c, i) for i, c in enumerate(COLUMNS))
+
+# angles interpolated along the shorter arc, across north and the antimeridian
+_ANGLES = [_IDX['longitude'], _IDX['azimuth']]
+
+# rows of the geometry table computed (and cached) together, the table is filled chunk by chunk
+# as the simulation reaches it, with the next chunk computed in the background
+SO_GEOMETRY_CHUNK = os.getenv('SO_GEOMETRY_CHUNK', '1800')
+if not SO_GEOMETRY_CHUNK:
+    SO_GEOMETRY_CHUNK = '1800'
+
+@dataclass
+class GeometrySample:
+    ts: float = None
+    position: np.ndarray = None     # spacecraft geocentric position (km)
+    velocity: np.ndarray = None     # spacecraft geocentric velocity (km/s)
+    latitude: float = None          # sub-satellite point (degrees)
+    longitude: float = None
+    altitude: float = None          # height above the wgs84 ellipsoid (km)
+    gs_position: np.ndarray = None  # spacecraft position relative to the ground station (km)
+    elevation: float = None         # look angles from the ground station (degrees)
+    azimuth: float = None
+    distance: float = None          # range from the ground station (km)
+    range_rate: float = None        # range rate from the ground station (km/s)
+    sun_position: np.ndarray = None # geocentric astrometric position of the sun (km)
+    is_sunlit: bool = None
+
+# scenario geometry over the scenario window, propagated in batches of chunk rows when first needed
+class GeometryEngine:
+    def __init__(self, scenario: Scenario, time_scale=None, ephemeris=None, satellite=None, step: float = None, sun_step: float = 600.0, cache_dir: str = None, chunk: int = None) -> None:
+        self.scenario = scenario
+
+        self.time_scale = time_scale if time_scale else get_timescale()
+        self.ephemeris = ephemeris if ephemeris else get_ephemeris()
+        self.earth = self.ephemeris['earth']
+        self.sun = self.ephemeris['sun']
+        self.satellite = satellite if satellite else get_satellite(scenario.tle)
+        self.location = wgs84.latlon(scenario.ground_station.latitude,
+                                     scenario.ground_station.longitude,
+                                     elevation_m=scenario.ground_station.altitude)
+
+        self.step = float(step if step else scenario.time_step)
+        self.ts_i = datetime.fromisoformat(scenario.begin).timestamp()
+        self.ts_f = datetime.fromisoformat(scenario.end).timestamp()
+
+        self.sun_step = float(sun_step)
+
+        # one extra sample past the end so the last tick can be interpolated
+        self.size = int(np.floor((self.ts_f - self.ts_i) / self.step)) + 2
+        self.sun_size = int(np.floor((self.ts_f - self.ts_i) / self.sun_step)) + 2
+
+        self.chunk = int(chunk if chunk else SO_GEOMETRY_CHUNK)
+        self.chunks = [None] * int(np.ceil(self.size / self.chunk))
+        self.lock = threading.Lock()
+
+        # pass predictions stored with the cached products, see PassSchedule.snapshot
+        self.pass_snapshot = None
+
+        self.cache_dir = cache_dir
+        self.key = scenario_key(scenario, step=self.step, sun_step=self.sun_step)
+        if self.cache_dir is None or not self._load():
+            self._build()
+            if self.cache_dir is not None:
+                self._save()
+
+    def _build(self):
+        # sun direction changes slowly, sample it on a coarser grid
+        self.sun_table = self._compute_sun(self._times(self.ts_i, np.arange(self.sun_size) * self.sun_step)).T.copy()
+
+        # eclipse entry/exit times within the window
+        self._find_eclipses()
+
+        logger.info(f"Geometry computed: { self.size } samples in { len(self.chunks) } chunks, step { self.step }s, { len(self.eclipses) } eclipses")
+
+    # rows of chunk c, loaded from the cache or computed; the first use of a chunk prefetches the next one
+    def _chunk(self, c: int, prefetch: bool = True) -> np.ndarray:
+        rows = self.chunks[c]
+        if rows is not None:
+            return rows
+
+        with self.lock:
+            if self.chunks[c] is None:
+                self.chunks[c] = self._load_chunk(c)
+            if self.chunks[c] is None:
+                _start, _end = c * self.chunk, min((c + 1) * self.chunk, self.size)
+                self.chunks[c] = self._compute(self._times(self.ts_i, np.arange(_start, _end) * self.step)).T.copy()
+                if self.cache_dir is not None:
+                    self._save_chunk(c)
+            rows = self.chunks[c]
+
+        if prefetch and c + 1 < len(self.chunks) and self.chunks[c + 1] is None:
+            threading.Thread(target=self._chunk, args=(c + 1, False), name='so-geometry', daemon=True).start()
+
+        return rows
+
+    # whole table, computing the chunks not computed yet
+    @property
+    def table(self) -> np.ndarray:
+        return np.concatenate([self._chunk(c, prefetch=False) for c in range(len(self.chunks))])
+
+    def _path(self, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{ self.key }.{ ext }")
+
+    def _meta(self) -> dict:
+        return {
+            'key': self.key,
+            'eclipses': self.eclipses,
+            'sunlit_i': self._sunlit_i,
+            'sunlit_edges': self._sunlit_edges,
+            'sunlit_values': self._sunlit_values,
+            'passes': self.pass_snapshot
+        }
+
+    # write a file atomically, other processes and threads only ever see complete files
+    def _write(self, filename: str, write) -> None:
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), prefix=os.path.basename(filename) + '.', suffix='.tmp', delete=False) as fout:
+            _tmp = fout.name
+            try:
+                write(fout)
+            except BaseException:
+                fout.close()
+                os.unlink(_tmp)
+                raise
+        # readable as a file created with open would be, temporary files are private
+        os.chmod(_tmp, 0o644)
+        os.replace(_tmp, filename)
+
+    def _save_chunk(self, c: int) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write(self._path(f"geometry.{ c }.npy"), lambda fout: np.save(fout, self.chunks[c]))
+        except OSError as e:
+            logger.error(f"Failed caching geometry chunk { c }: { e }")
+
+    # chunks are memory-mapped read-only, shared with other processes through the page cache
+    def _load_chunk(self, c: int) -> np.ndarray:
+        if self.cache_dir is None:
+            return None
+
+        try:
+            rows = np.load(self._path(f"geometry.{ c }.npy"), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+        return rows if rows.shape == (min((c + 1) * self.chunk, self.size) - c * self.chunk, len(COLUMNS)) else None
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write(self._path('sun.npy'), lambda fout: np.save(fout, self.sun_table))
+            self._write(self._path('json'), lambda fout: fout.write(json.dumps(self._meta()).encode()))
+            logger.info(f"Geometry products cached: { self._path('json') }")
+        except OSError as e:
+            logger.error(f"Failed caching geometry products: { e }")
+
+    def _load(self) -> bool:
+        purge_stale(self.cache_dir)
+
+        try:
+            with open(self._path('json'), 'r') as fin:
+                meta = json.load(fin)
+
+            self.sun_table = np.load(self._path('sun.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+
+        if meta['key'] != self.key or self.sun_table.shape != (self.sun_size, 3):
+            return False
+
+        self.eclipses = meta['eclipses']
+        self._sunlit_i = meta['sunlit_i']
+        self._sunlit_edges = meta['sunlit_edges']
+        self._sunlit_values = meta['sunlit_values']
+        self._eclipse_ends = [x[1] if x[1] is not None else np.inf for x in self.eclipses]
+        self.pass_snapshot = meta['passes']
+
+        logger.info(f"Geometry products loaded from cache: { self._path('json') }")
+
+        return True
+
+    # keep pass predictions with the cached products, as they are predicted; sessions sharing the
+    # geometry only replace them with predictions reaching further
+    def store_passes(self, snapshot: dict) -> None:
+        with self.lock:
+            if self.pass_snapshot is not None and self.pass_snapshot['horizon'] >= snapshot['horizon']:
+                return
+            self.pass_snapshot = snapshot
+
+            if self.cache_dir is not None:
+                try:
+                    self._write(self._path('json'), lambda fout: fout.write(json.dumps(self._meta()).encode()))
+                except OSError as e:
+                    logger.error(f"Failed caching pass predictions: { e }")
+
+    def _find_eclipses(self):
+        def sunlit(t):
+            return self.satellite.at(t).is_sunlit(self.ephemeris)
+        sunlit.step_days = 60 / 86400
+
+        t_i = self._times(self.ts_i, 0.0)
+        t_f = self._times(self.ts_i, (self.size - 1) * self.step)
+        t, values = find_discrete(t_i, t_f, sunlit)
+
+        # sunlit state at the beginning of the window and at each transition
+        self._sunlit_i = bool(sunlit(t_i))
+        self._sunlit_edges = [ti.utc_datetime().timestamp() for ti in t]
+        self._sunlit_values = [bool(v) for v in values]
+
+        # eclipse intervals, entry is None if the window starts in eclipse and exit is None if it ends in eclipse
+        self.eclipses, _curr = [], [] if self._sunlit_i else [None]
+        for edge, value in zip(self._sunlit_edges, self._sunlit_values):
+            if value is False:
+                _curr = [edge]
+            elif len(_curr) > 0:
+                _curr.append(edge)
+                self.eclipses.append(_curr)
+                _curr = []
+        if len(_curr) > 0:
+            _curr.append(None)
+            self.eclipses.append(_curr)
+        self._eclipse_ends = [x[1] if x[1] is not None else np.inf for x in self.eclipses]
+
+    def _times(self, ts, offsets):
+        dt = datetime.fromtimestamp(ts, tz=pytz.UTC)
+
+        return self.time_scale.utc(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second + dt.microsecond / 1e6 + offsets)
+
+    # compute all columns for a skyfield time, either a scalar or an array of times
+    def _compute(self, t):
+        geocentric = self.satellite.at(t)
+        latitude, longitude = wgs84.latlon_of(geocentric)
+        height = wgs84.height_of(geocentric)
+
+        topocentric = (self.satellite - self.location).at(t)
+        alt, az, dist = topocentric.altaz()
+        _, _, _, _, _, range_rate = topocentric.frame_latlon_and_rates(self.location)
+
+        return np.vstack([
+            geocentric.position.km,
+            geocentric.velocity.km_per_s,
+            latitude.degrees,
+            longitude.degrees,
+            height.km,
+            topocentric.position.km,
+            alt.degrees,
+            az.degrees,
+            dist.km,
+            range_rate.km_per_s
+        ])
+
+    def _compute_sun(self, t):
+        return self.earth.at(t).observe(self.sun).position.km
+
+    def covers(self, ts: float) -> bool:
+        return self.ts_i <= ts <= self.ts_i + (self.size - 1) * self.step
+
+    def _row(self, i: int) -> np.ndarray:
+        return self._chunk(i // self.chunk)[i % self.chunk]
+
+    # table row for ts, linearly interpolated between samples or computed directly outside the window
+    def row(self, ts: float) -> np.ndarray:
+        if self.covers(ts):
+            x = (ts - self.ts_i) / self.step
+            i = min(int(x), self.size - 2)
+            f = x - i
+            a, b = self._row(i), self._row(i + 1)
+            row = a * (1.0 - f) + b * f
+            row[_ANGLES] = a[_ANGLES] + f * ((b[_ANGLES] - a[_ANGLES] + 180.0) % 360.0 - 180.0)
+        else:
+            row = self._compute(self._times(ts, np.zeros(1))).ravel()
+
+        row[_IDX['azimuth']] = row[_IDX['azimuth']] % 360.0
+        row[_IDX['longitude']] = (row[_IDX['longitude']] + 180.0) % 360.0 - 180.0
+
+        return row
+
+    # geocentric sun position for ts, interpolated from the sun table
+    def sun_position(self, ts: float) -> np.ndarray:
+        if self.covers(ts):
+            x = (ts - self.ts_i) / self.sun_step
+            i = min(int(x), self.sun_size - 2)
+            f = x - i
+            return self.sun_table[i] * (1.0 - f) + self.sun_table[i+1] * f
+        else:
+            return self._compute_sun(self._times(ts, np.zeros(1))).ravel()
+
+    # sunlit state for ts, binary search over the eclipse boundaries
+    def is_sunlit(self, ts: float) -> bool:
+        if self.covers(ts):
+            k = bisect.bisect_right(self._sunlit_edges, ts)
+            return self._sunlit_values[k-1] if k > 0 else self._sunlit_i
+        else:
+            return bool(self.satellite.at(self._times(ts, 0.0)).is_sunlit(self.ephemeris))
+
+    # next (or current) eclipse interval after ts, None if not known
+    def next_eclipse(self, ts: float):
+        k = bisect.bisect_left(self._eclipse_ends, ts)
+
+        return self.eclipses[k] if k < len(self.eclipses) else None
+
+    # eclipse boundaries as scenario events
+    def events(self) -> list[dict]:
+        events = []
+        for entry, exit in self.eclipses:
+            if entry is not None:
+                events.append({ 'ts': entry, 'event': 'eclipse_entry' })
+            if exit is not None:
+                events.append({ 'ts': exit, 'event': 'eclipse_exit' })
+
+        return events
+
+    def sample(self, ts: float) -> GeometrySample:
+        row = self.row(ts)
+
+        return GeometrySample(
+            ts=ts,
+            position=row[0:3],
+            velocity=row[3:6],
+            latitude=row[_IDX['latitude']],
+            longitude=row[_IDX['longitude']],
+            altitude=row[_IDX['altitude']],
+            gs_position=row[9:12],
+            elevation=row[_IDX['elevation']],
+            azimuth=row[_IDX['azimuth']],
+            distance=row[_IDX['distance']],
+            range_rate=row[_IDX['range_rate']],
+            sun_position=self.sun_position(ts),
+            is_sunlit=self.is_sunlit(ts)
+        )
+
+# hash of everything the derived products depend on
+def scenario_key(scenario: Scenario, step: float = None, sun_step: float = 600.0) -> str:
+    gs = scenario.ground_station
+    data = ['\n'.join(parse_tle(scenario.tle)), gs.latitude, gs.longitude, gs.altitude,
+            datetime.fromisoformat(scenario.begin).timestamp(), datetime.fromisoformat(scenario.end).timestamp(),
+            float(step if step else scenario.time_step), float(sun_step), COLUMNS]
+
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()[:16]
+
+def scenario_cache_dir(uid: str) -> str:
+    return os.path.join('data', 'scenarios', uid, 'cache')
+
+# remove cached products older than the scenario definition they were derived from
+def purge_stale(cache_dir: str) -> None:
+    source = os.path.join(os.path.dirname(os.path.normpath(cache_dir)), 'data.json')
+    if not os.path.exists(source) or not os.path.exists(cache_dir):
+        return
+
+    _mtime = os.path.getmtime(source)
+    for filename in os.listdir(cache_dir):
+        filename = os.path.join(cache_dir, filename)
+        try:
+            if os.path.getmtime(filename) < _mtime:
+                os.remove(filename)
+                logger.info(f"Removed stale cached product: { filename }")
+        except OSError:
+            pass
+
+# cached products metadata (eclipses and passes) for a scenario, without any computation
+def cached_products(uid: str) -> list[dict]:
+    cache_dir = scenario_cache_dir(uid)
+    purge_stale(cache_dir)
+
+    if not os.path.exists(cache_dir):
+        return []
+
+    data = []
+    for filename in sorted(os.listdir(cache_dir)):
+        if filename.endswith('.json'):
+            with open(os.path.join(cache_dir, filename), 'r') as fin:
+                meta = json.load(fin)
+            data.append({ 'key': meta['key'], 'eclipses': meta['eclipses'], 'passes': meta['passes'] })
+
+    return data
@@ -1,18 +1,37 @@
 
-import copy, threading, logging
-from dataclasses import dataclass, field, asdict
-from collections import defaultdict
-from skyfield.api import load, wgs84, EarthSatellite
+import os, copy, time, threading, logging
+from dataclasses import dataclass, field
+from skyfield.api import wgs84
 from datetime import datetime
 import numpy as np
-from numpy import cos, pi, log10, sinc, sqrt
-import pytz
+from numpy import cos, pi, log10, sinc
 
-from .core import Scenario, Status, TTCModes, TTCAntenna, TTCState, OverrideState, Quality, custom_dict_factory, DEFAULT_STATUS_DL_TRANSITIONS
+from .core import Scenario, Status, TTCModes, TTCAntenna, TTCState, OverrideState, Quality, slotted_copy, packed_enums, DEFAULT_STATUS_DL_TRANSITIONS
+from .geometry import GeometryEngine
+from .serializer import serializer
+from .passes import PassSchedule
+from .network import StationNetwork
+from .waterfall import Waterfall
+from .cache import get_timescale, get_satellite
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# spectrums are computed for every tick (always) or only while a consumer sent a heartbeat in the
+# last SO_SPECTRUM_TIMEOUT seconds (heartbeat); at most every SO_SPECTRUM_INTERVAL simulated seconds
+SO_SPECTRUM_DEMAND = os.getenv('SO_SPECTRUM_DEMAND', 'always')
+if not SO_SPECTRUM_DEMAND:
+    SO_SPECTRUM_DEMAND = 'always'
+SO_SPECTRUM_INTERVAL = os.getenv('SO_SPECTRUM_INTERVAL', '1')
+if not SO_SPECTRUM_INTERVAL:
+    SO_SPECTRUM_INTERVAL = '1'
+SO_SPECTRUM_TIMEOUT = os.getenv('SO_SPECTRUM_TIMEOUT', '10')
+if not SO_SPECTRUM_TIMEOUT:
+    SO_SPECTRUM_TIMEOUT = '10'
+
+# slotted as SpacecraftState
+@slotted_copy
+@packed_enums
+@dataclass(slots=True)
 class GroundStationState:
     ts: float = None
     carrier_ul: Status = Status.off
@@ -34,7 +53,7 @@ class GroundStationState:
     sweep_done: bool = False
     mode: TTCModes = TTCModes.S_Sub_LBR
     power_ul: float = 50.0
-    position: list[float] = field(default_factory=list)
+    position: np.ndarray = field(default_factory=lambda: np.zeros(0))
 
     # book-keeping
     auto_range: bool = False
@@ -46,13 +65,16 @@ class GroundStationState:
     sweep_count: int = 0
     flight_dynamics: dict = field(default_factory=list)
     name: str = 'ESOC-1'
+    handover: str = 'auto'
+    stations: list = field(default_factory=list)
 
     def to_dict(self):
-        return asdict(self, dict_factory=custom_dict_factory)
+        return serializer(GroundStationState).to_dict(self)
 
 # ground station simulator
 class GroundStationSim:
-    def __init__(self, scenario : Scenario, initial_state : GroundStationState = None) -> None:
+    def __init__(self, scenario : Scenario, initial_state : GroundStationState = None, geometry : GeometryEngine = None, network : StationNetwork = None,
+                 spectrum_demand : str = None, spectrum_interval : float = None) -> None:
         self.scenario = scenario
 
         self.dt_i = datetime.fromisoformat(self.scenario.begin)
@@ -61,32 +83,39 @@ class GroundStationSim:
         self.location = wgs84.latlon(scenario.ground_station.latitude,
                                      scenario.ground_station.longitude,
                                      elevation_m=scenario.ground_station.altitude)
-        lines = [x.strip() for x in self.scenario.tle.split("\n") if len(x) > 0]
-        self.satellite = EarthSatellite(lines[1], lines[2], lines[0])
-        self.time_scale = load.timescale()
+        self.satellite = get_satellite(self.scenario.tle)
+        self.time_scale = get_timescale()
 
-        # calculate passes for current day
-        self.t_i = self.time_scale.utc(self.dt_i.year, self.dt_i.month, self.dt_i.day, 0, 0, 0)
-        self.t_f = self.time_scale.utc(self.dt_f.year, self.dt_f.month, self.dt_f.day, 23, 59, 59)
-        t, events = self.satellite.find_events(self.location, self.t_i, self.t_f, altitude_degrees=0.0)
+        # scenario geometry, shared with the spacecraft simulator if provided
+        self.geometry = geometry if geometry else GeometryEngine(scenario, time_scale=self.time_scale, satellite=self.satellite)
+
+        # pass predictions, extended in the background while the simulation runs and kept with the
+        # scenario products as they are predicted
+        self.schedule = PassSchedule(self.satellite, self.location, self.time_scale,
+                                     self.dt_i.timestamp(), end=self.dt_f.timestamp(),
+                                     snapshot=self.geometry.pass_snapshot, on_extend=self.geometry.store_passes)
+
+        # ground station network, if the scenario declares one
+        self.network = network if network else (StationNetwork(scenario, satellite=self.satellite, time_scale=self.time_scale) if scenario.ground_stations else None)
 
         # store previous values for after removing overrides
         self.prev_states = {}
 
         self.spectrum_gen = SpectrumGenerator()
 
-        self.passes, _curr = [], []
-        for ti, event in zip(t, events):
-            if event == 0:
-                _curr.append(ti.utc_datetime().timestamp())
-            if event == 2:
-                _curr.append(ti.utc_datetime().timestamp())
-                self.passes.append(_curr)
-                _curr = []
+        # demand driven spectrums: heartbeat deadline (monotonic), simulation time of the last
+        # spectrums and whether they were only noise floor, kept as they are while nothing changes
+        self.spectrum_demand = spectrum_demand if spectrum_demand else SO_SPECTRUM_DEMAND
+        self.spectrum_interval = float(spectrum_interval if spectrum_interval else SO_SPECTRUM_INTERVAL)
+        self.spectrum_until = 0.0
+        self.spectrum_ts, self.spectrum_floor = None, False
+
+        # recent spectrums for the waterfall displays, fixed size
+        self.waterfall = Waterfall(bins=self.spectrum_gen.SPECTRUMSIZE)
 
         # start with the initial state argument if available
         if initial_state:
-            self.state = initial_state
+            self.state = copy.copy(initial_state)
         # otherwise start with new state
         else:
             self.state = GroundStationState(ts=datetime.fromisoformat(self.scenario.begin).timestamp())
@@ -94,7 +123,14 @@ class GroundStationSim:
         # update initial state with params defined in the scenario
         if scenario.gs_initial_state:
             for k, v in scenario.gs_initial_state.items():
-                self.state.__setattr__(k, v)
+                if k in GroundStationState.__dataclass_fields__:
+                    self.state.__setattr__(k, v)
+                else:
+                    logger.warning(f"Unknown ground station initial state: { k }")
+
+        # resume a commanded handover
+        if self.network and self.state.handover == 'manual':
+            self.network.select(self.state.name)
 
         self.lock = threading.Lock()
 
@@ -135,45 +171,60 @@ class GroundStationSim:
     def _update_tracking(self, _state: GroundStationState, ts: float, sc_state) -> GroundStationState:
         _state.elevation, _state.azimuth, _state.distance, _state.doppler_velocity = None, None, None, None
 
-        if self.state.program_track is True:
-            for i in self.passes:
-                if i[0] <= ts <= i[1]:
-                    difference = self.satellite - self.location
-                    dt = datetime.fromtimestamp(ts, tz=pytz.UTC)
-                    t = self.time_scale.from_datetime(dt)
-                    topocentric = difference.at(t)
-                    _state.position = topocentric.position.km
-                    alt, az, dist = topocentric.altaz()
-                    _, _, _, _, _, velocity = topocentric.frame_latlon_and_rates(self.location)
-
-                    _state.elevation = alt.degrees
-                    _state.azimuth = az.degrees
-                    _state.distance = dist.km
-                    _state.doppler_velocity = velocity.km_per_s * -1.0
-
-                    # update flight dynamics data every 10s
-                    if len(_state.position) > 0 and int(ts) % 10 == 0:
-                        _reading = _state.position.tolist()
-                        if _state.auto_range is True and sc_state.ttc_ranging == Status.enabled:
-                            _reading.append(_state.distance)
-                        else:
-                            _reading.append(0.0)
-                        if _state.doppler_enabled is True and sc_state.ttc_coherent == Status.enabled:
-                            _reading.append(_state.doppler_velocity)
-                        else:
-                            _reading.append(0.0)
-                        _state.flight_dynamics.append(_reading)
+        if self.network:
+            view = self._update_network(_state, ts)
+        elif self.state.program_track is True and self.schedule.current(ts) is not None:
+            sample = self.geometry.sample(ts)
+            view = { 'position': sample.gs_position, 'elevation': sample.elevation, 'azimuth': sample.azimuth,
+                     'distance': sample.distance, 'range_rate': sample.range_rate }
+        else:
+            view = None
+
+        if self.state.program_track is True and view is not None:
+            _state.position = view['position']
+
+            _state.elevation = view['elevation']
+            _state.azimuth = view['azimuth']
+            _state.distance = view['distance']
+            _state.doppler_velocity = view['range_rate'] * -1.0
+
+            # update flight dynamics data every 10s
+            if len(_state.position) > 0 and int(ts) % 10 == 0:
+                _reading = _state.position.tolist()
+                if _state.auto_range is True and sc_state.ttc_ranging == Status.enabled:
+                    _reading.append(_state.distance)
+                else:
+                    _reading.append(0.0)
+                if _state.doppler_enabled is True and sc_state.ttc_coherent == Status.enabled:
+                    _reading.append(_state.doppler_velocity)
+                else:
+                    _reading.append(0.0)
+                _state.flight_dynamics = _state.flight_dynamics + [_reading]
 
         return _state
 
+    # network visibility and handover, the active station feeds the U/L and D/L chains
+    def _update_network(self, _state: GroundStationState, ts: float):
+        if self.network.update(ts):
+            # the new station has to acquire the spacecraft again
+            _state.carrier_ul = Status.off
+            _state.sweep_done = False
+            _state.doppler_enabled = False
+            _state.auto_range = False
+
+        _state.name = self.network.station()
+        _state.handover = self.network.handover
+        _state.stations = self.network.summary()
+
+        view = self.network.current()
+        return view if view['elevation'] >= 0.0 else None
+
     def _next_pass_window(self, _state: GroundStationState, ts: float) -> GroundStationState:
         _state.next_pass_start, _state.next_pass_end = None, None
 
-        for i in self.passes:
-            if ts <= i[1]:
-                _state.next_pass_start = i[0]
-                _state.next_pass_end = i[1]
-                break
+        _pass = self.schedule.next(ts)
+        if _pass:
+            _state.next_pass_start, _state.next_pass_end = _pass
 
         return _state
 
@@ -244,21 +295,46 @@ class GroundStationSim:
 
         return _state
 
+    # a consumer wants spectrums for the next timeout seconds
+    def request_spectrum(self, timeout: float = None) -> None:
+        self.spectrum_until = time.monotonic() + float(timeout if timeout else SO_SPECTRUM_TIMEOUT)
+
+    # spectrums only with demand, throttled, and once while both are just noise floor
+    def _spectrum_due(self, _state: GroundStationState, ts: float) -> bool:
+        if self.spectrum_demand != 'always' and time.monotonic() > self.spectrum_until:
+            if self.spectrum_ts is not None:
+                _state.spectrum_ul, _state.spectrum_dl = [], []
+                self.spectrum_ts, self.spectrum_floor = None, False
+            return False
+
+        _floor = _state.carrier_ul != Status.on and _state.snr_dl <= -128
+        if self.spectrum_ts is not None and ((_floor and self.spectrum_floor) or ts - self.spectrum_ts < self.spectrum_interval):
+            return False
+
+        self.spectrum_ts, self.spectrum_floor = ts, _floor
+        return True
+
     def _update_spectrums(self, _state: GroundStationState, sc_state) -> GroundStationState:
+        if not self._spectrum_due(_state, _state.ts):
+            return _state
 
         if _state.carrier_ul == Status.on:
-            _freqs, _totals = self.spectrum_gen.uplink_spectrum(_state.mode, power=_state.power_ul)
+            _ul_spectrum = self.spectrum_gen.uplink_spectrum(_state.mode, power=_state.power_ul)
         else:
-            _freqs, _totals = self.spectrum_gen.uplink_spectrum(_state.mode, power=0)
+            _ul_spectrum = self.spectrum_gen.uplink_spectrum(_state.mode, power=0)
+        _freqs, _totals = _ul_spectrum
         _ul_f = list(_freqs[np.isfinite(_totals)])
         _ul_p = list(_totals[np.isfinite(_totals)])
         _ul = list(zip(_ul_f, _ul_p))
 
-        _freqs, _totals = self.spectrum_gen.downlink_spectrum(sc_state.ttc_mode, SNR=_state.snr_dl, v_doppler=_state.doppler_velocity, coherent=sc_state.ttc_coherent)
+        _dl_spectrum = self.spectrum_gen.downlink_spectrum(sc_state.ttc_mode, SNR=_state.snr_dl, v_doppler=_state.doppler_velocity, coherent=sc_state.ttc_coherent)
+        _freqs, _totals = _dl_spectrum
         _dl_f = list(_freqs[np.isfinite(_totals)])
         _dl_p = list(_totals[np.isfinite(_totals)])
         _dl = list(zip(_dl_f, _dl_p))
 
+        self.waterfall.push(_state.ts, _ul_spectrum, _dl_spectrum)
+
         _state.spectrum_ul = _ul
         _state.spectrum_dl = _dl
 
@@ -291,8 +367,8 @@ class GroundStationSim:
 
     def ping(self, ts : float, sc_state = None, ov_state : OverrideState = None) -> GroundStationState:
 
-        # start the next state from the current state
-        _state = copy.deepcopy(self.state)
+        # start the next state from the current state, sharing all values with it (see SpacecraftSim.ping)
+        _state = copy.copy(self.state)
         _state.ts = ts
 
         # updates from spacecraft state
@@ -329,11 +405,17 @@ class GroundStationSim:
         # pong
         return self.state
 
+    def stop(self) -> None:
+        self.schedule.stop()
+        self.geometry.store_passes(self.schedule.snapshot())
+
     def _set_state(self, settings):
         self.lock.acquire()
         try:
+            _state = copy.copy(self.state)
             for attr, value in settings:
-                setattr(self.state, attr, value)
+                setattr(_state, attr, value)
+            self.state = _state
         finally:
             self.lock.release()
 
@@ -397,6 +479,13 @@ class GroundStationSim:
             else:
                 return _fail
 
+        if data['control'] == 'handover':
+            if self.network and self.network.select(data['value']):
+                self._set_state([('handover', self.network.handover), ('name', self.network.station())])
+                return _ok
+            else:
+                return _fail
+
         if data['control'] == 'frame_checks':
             if data['value'] == 'enabled':
                 self._set_state([('frame_checks', Status[data['value']])])
@@ -410,12 +499,24 @@ class GroundStationSim:
         return _fail
 
 
+# spectral shapes per (size, span, direction, mode), shared by all generators
+_TEMPLATES = {}
+
+# downlink shapes are sampled this many times finer than the frequency grid, over the grid plus a
+# relative Doppler margin (two way, about 8 km/s); noise rows are drawn this many spectrums at a time
+OVERSAMPLE = 8
+DOPPLER_MARGIN = 6e-5
+NOISE_BLOCK = 64
+
 # spectrums generator
 class SpectrumGenerator:
-    def __init__(self, SPECTRUMSIZE : int = 200, BW : int = 20) -> None:
+    def __init__(self, SPECTRUMSIZE : int = 200, BW : int = 20, seed: int = None) -> None:
         self.SPECTRUMSIZE = SPECTRUMSIZE
         self.BW = BW
 
+        self.rng = np.random.default_rng(seed)
+        self._noise, self._noise_idx = np.zeros((0, SPECTRUMSIZE)), 0
+
         self.turnaroundRatios = {
             #UL/DL
             "SS" : 240/221,
@@ -494,8 +595,9 @@ class SpectrumGenerator:
 
     def _db2lin(self, x):
         return 10**(x/10)
-    
-    def _NRZ_PM(self, mode: str, bw, frequencies, cf, mod_idx = 0.7):
+
+    # modulated signal without the carrier, x is the offset from the carrier frequency (array)
+    def _NRZ_PM_shape(self, mode: str, bw, x, mod_idx = 0.7):
         if mode == 'Sub': #NRZ/PSK/PM, subcarrier
             bw = bw/16
             P = lambda x: sinc(x/bw)/bw
@@ -509,31 +611,76 @@ class SpectrumGenerator:
             P = lambda x: sinc(x/bw)/bw
             S = lambda x: bw/4*(P(x)**2)
 
-        carrier_idx = min(range(len(frequencies)), key=lambda i: abs(frequencies[i]-cf))
-        carrier = 1e-12*np.ones(self.SPECTRUMSIZE)
-        carrier[carrier_idx] = 10*np.cos(mod_idx)**2 # 10 is just a factor, should be ref_bw/freq_step
+        return np.sin(mod_idx)**2*S(x) + 1e-12
+
+    def _NRZ_PM(self, mode: str, bw, frequencies, cf, mod_idx = 0.7):
+        signal = self._NRZ_PM_shape(mode, bw, frequencies - cf, mod_idx)
+
+        carrier_idx = np.argmin(np.abs(frequencies - cf))
+        signal[carrier_idx] += 10*np.cos(mod_idx)**2 - 1e-12 # 10 is just a factor, should be ref_bw/freq_step
 
-        signal = np.array([S(f-cf) for f in frequencies])
-        signal = np.sin(mod_idx)**2*signal + carrier
         return signal
 
-    
-    def _PSK(self, bw, frequencies, cf, roll_off = 0.4):
-        spectrum_low = cf - self.BW/2
-        spectrum_high = cf + self.BW/2
-        #maybe make this constant until mode changes
-        freq = [spectrum_low,-bw/2*(1+roll_off)+cf, -bw/2*(1-roll_off)+cf, bw/2*(1-roll_off)+cf, bw/2*(1+roll_off)+cf, spectrum_high]
-        signal = np.piecewise(frequencies, [frequencies<freq[1], (frequencies>=freq[1]) & (frequencies<freq[2]), (frequencies>=freq[2]) & (frequencies<freq[3]), (frequencies>=freq[3]) & (frequencies<freq[4]), frequencies>=freq[4] ], 
-                                        [0, lambda x: self._RC_filter(x-cf, roll_off, bw), 1, lambda x: self._RC_filter(x-cf, roll_off, bw), 0])
+    def _PSK_shape(self, bw, x, roll_off = 0.4):
+        edges = [-bw/2*(1+roll_off), -bw/2*(1-roll_off), bw/2*(1-roll_off), bw/2*(1+roll_off)]
+        signal = np.piecewise(x, [x<edges[0], (x>=edges[0]) & (x<edges[1]), (x>=edges[1]) & (x<edges[2]), (x>=edges[2]) & (x<edges[3]), x>=edges[3] ],
+                                 [0, lambda x: self._RC_filter(x, roll_off, bw), 1, lambda x: self._RC_filter(x, roll_off, bw), 0])
         return signal
 
+    def _PSK(self, bw, frequencies, cf, roll_off = 0.4):
+        return self._PSK_shape(bw, frequencies - cf, roll_off)
+
+    # rows of standard normal noise, drawn in blocks from the generator
+    def _standard_normal(self):
+        if self._noise_idx >= len(self._noise):
+            self._noise, self._noise_idx = self.rng.standard_normal((NOISE_BLOCK, self.SPECTRUMSIZE)), 0
+        self._noise_idx += 1
+
+        return self._noise[self._noise_idx - 1]
+
+    # frequency grid and signal shape of a mode, computed once: the uplink signal is fixed, the downlink
+    # shape is sampled OVERSAMPLE times finer than the grid around the nominal carrier, with room for Doppler
+    def _template(self, direction: str, mode: TTCModes) -> dict:
+        key = (self.SPECTRUMSIZE, self.BW, direction, mode)
+        if key in _TEMPLATES:
+            return _TEMPLATES[key]
+
+        if direction == 'ul':
+            zoom = 16
+            cf = self.modeParameters[mode]["up_freq"]
+            bw = self.modeParameters[mode]["ul_bw"]/1e6
+        else:
+            zoom = 4
+            cf = self.modeParameters[mode]["up_freq"]*self.turnaroundRatios[self.modeParameters[mode]["band"]]
+            bw = self.modeParameters[mode]["dl_bw"]/1e6
+        frequencies = np.linspace(cf - self.BW/2/zoom, cf + self.BW/2/zoom, self.SPECTRUMSIZE)
+
+        template = { 'frequencies': frequencies, 'cf': cf, 'bw': bw }
+        if direction == 'ul':
+            template['signal'] = self._NRZ_PM('Res', bw, frequencies, cf, self.modeParameters[mode]["ul_mod_idx"])
+        else:
+            step = (frequencies[1] - frequencies[0]) / OVERSAMPLE
+            margin = DOPPLER_MARGIN * cf
+            x = frequencies[0] - cf - margin + step*np.arange(int(np.ceil((frequencies[-1] - frequencies[0] + 2*margin)/step)) + 1)
+
+            modename = mode.name[2:5]
+            if modename == 'Sup':
+                template['shape'] = self._PSK_shape(bw, x)
+            else:
+                template['shape'] = self._NRZ_PM_shape(modename, bw, x, 0.7)
+            template['x'], template['margin'] = x, margin
+
+        for v in template.values():
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+        _TEMPLATES[key] = template
+
+        return template
+
     def downlink_spectrum(self, mode : TTCModes, v_doppler = 0, SNR = 5, _interference = False, coherent = False):
-        #Frequency span of Spectrum
-        zoom = 4
-        spectrum_center = self.modeParameters[mode]["up_freq"]*self.turnaroundRatios[self.modeParameters[mode]["band"]]
-        spectrum_low = spectrum_center - self.BW/2/zoom
-        spectrum_high = spectrum_center + self.BW/2/zoom
-        frequencies = np.linspace(spectrum_low, spectrum_high, self.SPECTRUMSIZE)
+        template = self._template('dl', mode)
+        frequencies = template['frequencies']
+        spectrum_high = frequencies[-1]
 
         # FIXME
         if v_doppler is None:
@@ -545,17 +692,26 @@ class SpectrumGenerator:
         c = 3e8
 
         doppler = 1+v_doppler*1000/c
-        bw = self.modeParameters[mode]["dl_bw"]/1e6
-        cf = self.modeParameters[mode]["up_freq"]*self.turnaroundRatios[self.modeParameters[mode]["band"]] * doppler
+        bw = template['bw']
+        cf = template['cf'] * doppler
         if coherent:
             cf = cf *doppler
         modename = mode.name[2:5]
-        if modename == 'Sup':
-            signal = self._db2lin(SNR)*self._PSK(bw, frequencies, cf)
+
+        # Doppler shift as a fractional bin shift of the cached shape, evaluated directly beyond the margin
+        if abs(cf - template['cf']) <= template['margin']:
+            signal = np.interp(frequencies - cf, template['x'], template['shape'])
+        elif modename == 'Sup':
+            signal = self._PSK_shape(bw, frequencies - cf)
         else:
-            signal = self._db2lin(SNR)*self._NRZ_PM(modename, bw, frequencies, cf)
+            signal = self._NRZ_PM_shape(modename, bw, frequencies - cf, 0.7)
+
+        if modename != 'Sup':
+            mod_idx = 0.7 # as the _NRZ_PM default
+            signal[np.argmin(np.abs(frequencies - cf))] += 10*np.cos(mod_idx)**2 - 1e-12
+        signal *= self._db2lin(SNR)
 
-        noise = abs(np.random.normal(1, 0.2, self.SPECTRUMSIZE))
+        noise = np.abs(1 + 0.2*self._standard_normal())
         interference = np.piecewise(frequencies, [frequencies<cf*1.01, frequencies<cf*1.02, frequencies<spectrum_high], [0, 1, 0]) if _interference else 0
 
         total = self._lin2db(signal+noise+interference) + noise_level
@@ -563,19 +719,9 @@ class SpectrumGenerator:
         return [frequencies, total]
 
     def uplink_spectrum(self, mode : TTCModes, power = 53, SNR = 20, noisefloor = 10):
-        #Frequency span of Spectrum
-        zoom = 16
-        bw = self.modeParameters[mode]["ul_bw"]/1e6
-        spectrum_center = self.modeParameters[mode]["up_freq"] # center frequency of the spectrum analyzer
-        spectrum_low = spectrum_center - self.BW/2/zoom
-        spectrum_high = spectrum_center + self.BW/2/zoom
-        frequencies = np.linspace(spectrum_low, spectrum_high, self.SPECTRUMSIZE)
+        template = self._template('ul', mode)
 
+        noise = self._db2lin(-SNR)*np.abs(0.5*self._standard_normal()) + self._db2lin(noisefloor-power)*np.abs(0.2*self._standard_normal())
+        total = power + self._lin2db( noise + template['signal'])
 
-        mod_idx = self.modeParameters[mode]["ul_mod_idx"]
-        cf = self.modeParameters[mode]["up_freq"] # center frequency of the signal
-        noise = self._db2lin(-SNR)*abs(np.random.normal(0, 0.5, self.SPECTRUMSIZE)) + self._db2lin(noisefloor-power)*abs(np.random.normal(0, 0.2, self.SPECTRUMSIZE))
-        signal = self._NRZ_PM('Res', bw, frequencies, cf, mod_idx)
-        total = power + self._lin2db( noise + signal)
-
-        return [frequencies, total]
+        return [template['frequencies'], total]
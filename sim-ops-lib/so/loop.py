@@ -0,0 +1,274 @@
+
+import os, time, threading, logging
+from collections import deque
+
+from .core import Status, TTCState, Quality
+from .serializer import to_message, pack_spectrum, SO_SPECTRUM, SPECTRUM_TOPIC
+
+logger = logging.getLogger(__name__)
+
+# tick snapshots waiting for the publisher and for the archiver, see TickPipeline
+SO_PIPELINE_QUEUE = os.getenv('SO_PIPELINE_QUEUE', '100')
+if not SO_PIPELINE_QUEUE:
+    SO_PIPELINE_QUEUE = '100'
+
+# TM packets are archived only if the frames are being received
+def archive_packet(ts: float, gs_state, sc_state) -> bool:
+    # FIXME handle high priority tm edge case
+    c1 = sc_state.status_dl == TTCState['FRAME_LOCK'] and sc_state.frame_quality == Quality.good and sc_state.frame_checks == Status.enabled and sc_state.ov_no_tm is not True
+    c2 = sc_state.status_dl == TTCState['FRAME_LOCK'] and sc_state.frame_quality == Quality.good and sc_state.frame_checks == Status.disabled
+    c3 = sc_state.status_dl == TTCState['FRAME_LOCK'] and sc_state.frame_quality != Quality.good and gs_state.frame_checks == Status.disabled
+
+    # store packet every 5s
+    return (c1 or c2 or c3) and int(ts) % 5 == 0
+
+# physics stage of a tick: ping both simulators and the constellation, the states are immutable snapshots
+def physics(ts: float, gs_sim, sc_sim, ov_state, constellation=None) -> tuple:
+    gs_state = gs_sim.ping(ts, sc_state=sc_sim.state, ov_state=ov_state)
+    sc_state = sc_sim.ping(ts, gs_state=gs_state, ov_state=ov_state)
+    constellation_state = constellation.ping(ts, gs_state=gs_state) if constellation is not None else None
+
+    return gs_state, sc_state, constellation_state
+
+# publishing stage: both states and the additional spacecraft, each on its own topic;
+# spectrum is json, binary or both, see so.serializer.SO_SPECTRUM
+def publish_states(backend, gs_state, sc_state, constellation=None, constellation_state=None, spectrum: str = SO_SPECTRUM) -> None:
+    if gs_state:
+        message = to_message(gs_state)
+        if spectrum != 'json':
+            backend.publish('ground_station' + SPECTRUM_TOPIC, pack_spectrum(gs_state.ts, gs_state.spectrum_ul, gs_state.spectrum_dl))
+            if spectrum == 'binary':
+                del message['spectrum_ul'], message['spectrum_dl']
+        backend.publish('ground_station', message)
+
+    if sc_state:
+        backend.publish('spacecraft', to_message(sc_state))
+
+    if constellation is not None:
+        constellation.publish(backend, constellation_state)
+
+# archiving stage: the TM packet of the tick
+def archive_states(ts: float, sc_state, store, sph, sim_uid) -> None:
+    # queued for the upload workers when the store has them
+    _store = store.store_async if hasattr(store, 'store_async') else store.store
+
+    # scrub packet data if only high priority is available
+    if sc_state.ttc_obc == Status.error:
+        _store(sim_uid+'-tm', str(int(ts)), sph.space_packet(sc_state.scrub()).as_bytes())
+    else:
+        _store(sim_uid+'-tm', str(int(ts)), sph.space_packet(sc_state).as_bytes())
+
+# one simulation tick: ping both simulators, publish their states and archive TM packets, in series
+def tick(ts: float, gs_sim, sc_sim, ov_state, backend, store=None, sph=None, sim_uid=None, constellation=None, spectrum: str = SO_SPECTRUM):
+    gs_state, sc_state, constellation_state = physics(ts, gs_sim, sc_sim, ov_state, constellation=constellation)
+
+    publish_states(backend, gs_state, sc_state, constellation=constellation, constellation_state=constellation_state, spectrum=spectrum)
+
+    # handle packet store
+    if sc_state and store is not None and archive_packet(ts, gs_state, sc_state):
+        archive_states(ts, sc_state, store, sph, sim_uid)
+
+    return gs_state, sc_state
+
+# lateness histogram buckets, upper bounds in ms
+LATENESS_BUCKETS = [1, 5, 10, 50, 100, 500, 1000]
+
+TICK_POLICIES = ['catch_up', 'skip']
+
+# tick scheduler on absolute monotonic deadlines, simulation time advances exactly time_step per tick;
+# late ticks either run back to back until caught up (catch_up) or missed ticks are dropped (skip)
+class TickScheduler:
+    def __init__(self, time_step: float, begin: float, policy: str = 'catch_up', clock=time.monotonic) -> None:
+        if policy not in TICK_POLICIES:
+            raise ValueError(f"Unknown tick policy: { policy }")
+
+        self.time_step = float(time_step)
+        self.begin = begin
+        self.policy = policy
+        self.clock = clock
+
+        self.ticks_count = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.max_lateness = 0.0
+        self.histogram = [0] * (len(LATENESS_BUCKETS) + 1)
+
+    def _record(self, lateness: float) -> None:
+        _ms = lateness * 1000
+        self.max_lateness = max(self.max_lateness, _ms)
+        for i, bound in enumerate(LATENESS_BUCKETS):
+            if _ms <= bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    # yields the simulation time of each tick until stop_event is set
+    def ticks(self, stop_event):
+        t0, k = self.clock(), 0
+
+        while not stop_event.is_set():
+            lateness = max(self.clock() - (t0 + k * self.time_step), 0.0)
+
+            # drop the ticks that should have already happened
+            if self.policy == 'skip' and lateness >= self.time_step:
+                missed = int(lateness // self.time_step)
+                k += missed
+                self.skipped += missed
+                lateness -= missed * self.time_step
+
+            self._record(lateness)
+            self.ticks_count += 1
+
+            yield self.begin + k * self.time_step
+
+            k += 1
+            wait = t0 + k * self.time_step - self.clock()
+            if wait > 0:
+                stop_event.wait(wait)
+            else:
+                self.overruns += 1
+
+    def stats(self) -> dict:
+        labels = [f"<={x}ms" for x in LATENESS_BUCKETS] + [f">{LATENESS_BUCKETS[-1]}ms"]
+
+        return {
+            'policy': self.policy,
+            'ticks': self.ticks_count,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'max_lateness_ms': self.max_lateness,
+            'lateness_ms': dict(zip(labels, self.histogram))
+        }
+
+# running latency figures of a stage, in ms
+class Latency:
+    def __init__(self) -> None:
+        self.count, self.last, self.max, self.sum = 0, 0.0, 0.0, 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.last, self.max = seconds, max(self.max, seconds)
+        self.sum += seconds
+
+    def stats(self) -> dict:
+        return { 'last_ms': self.last * 1000, 'max_ms': self.max * 1000, 'mean_ms': self.sum / self.count * 1000 if self.count > 0 else 0.0 }
+
+STAGE_POLICIES = ['drop_oldest', 'block']
+
+# a worker thread consuming tick snapshots from a bounded queue; when the queue is full the oldest
+# snapshot is dropped (drop_oldest) and the producer never waits, or the producer waits for room (block)
+class Stage:
+    def __init__(self, name: str, handler, size: int, policy: str = 'drop_oldest') -> None:
+        if policy not in STAGE_POLICIES:
+            raise ValueError(f"Unknown stage policy: { policy }")
+
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+
+        self.queue = deque()
+        self.size = size
+        self.cond = threading.Condition()
+        self.closed = False
+
+        self.processed, self.dropped, self.blocked, self.errors, self.max_depth = 0, 0, 0, 0, 0
+        self.wait, self.run = Latency(), Latency()
+
+        self.thread = threading.Thread(target=self._loop, name=f"so-stage-{ name }", daemon=True)
+        self.thread.start()
+
+    def put(self, item) -> None:
+        with self.cond:
+            if len(self.queue) >= self.size and self.policy == 'block':
+                logger.warning(f"Stage { self.name } full, waiting for { self.size } queued snapshots")
+                self.blocked += 1
+                self.cond.wait_for(lambda: len(self.queue) < self.size or self.closed)
+            elif len(self.queue) >= self.size:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append((time.perf_counter(), item))
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.cond.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self.cond:
+                while not self.closed and len(self.queue) == 0:
+                    self.cond.wait()
+                if len(self.queue) == 0:
+                    return
+                enqueued, item = self.queue.popleft()
+
+            _start = time.perf_counter()
+            try:
+                self.handler(item)
+                _ok = True
+            except Exception as e:
+                logger.error(f"Failed { self.name } stage: { e }")
+                _ok = False
+            _end = time.perf_counter()
+
+            with self.cond:
+                self.processed += 1 if _ok else 0
+                self.errors += 0 if _ok else 1
+                self.wait.record(_start - enqueued)
+                self.run.record(_end - _start)
+                self.cond.notify_all()
+
+    # waits for the queued snapshots, at most timeout seconds
+    def close(self, timeout: float = 10.0) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return { 'depth': len(self.queue), 'max_depth': self.max_depth, 'size': self.size, 'policy': self.policy, 'processed': self.processed,
+                     'dropped': self.dropped, 'blocked': self.blocked, 'errors': self.errors, 'wait': self.wait.stats(), 'run': self.run.stats() }
+
+# pipelined tick: the physics stage runs on the simulation thread and hands the immutable snapshots
+# to the publisher and archiver workers, a slow broker never delays simulation time; the archive
+# of record drops nothing, an object store stalled long enough to fill its queue holds the ticks
+class TickPipeline:
+    def __init__(self, backend, store=None, sph=None, sim_uid=None, queue_size: int = None, spectrum: str = SO_SPECTRUM) -> None:
+        self.backend = backend
+        self.store, self.sph, self.sim_uid = store, sph, sim_uid
+        self.spectrum = spectrum
+
+        _size = int(queue_size if queue_size else SO_PIPELINE_QUEUE)
+        self.physics = Latency()
+        self.publisher = Stage('publish', self._publish, _size)
+        self.archiver = Stage('archive', self._archive, _size, policy='block') if store is not None else None
+
+    def _publish(self, snapshot) -> None:
+        gs_state, sc_state, constellation, constellation_state = snapshot
+        publish_states(self.backend, gs_state, sc_state, constellation=constellation, constellation_state=constellation_state, spectrum=self.spectrum)
+
+    def _archive(self, snapshot) -> None:
+        ts, sc_state = snapshot
+        archive_states(ts, sc_state, self.store, self.sph, self.sim_uid)
+
+    def tick(self, ts: float, gs_sim, sc_sim, ov_state, constellation=None):
+        _start = time.perf_counter()
+        gs_state, sc_state, constellation_state = physics(ts, gs_sim, sc_sim, ov_state, constellation=constellation)
+        self.physics.record(time.perf_counter() - _start)
+
+        self.publisher.put((gs_state, sc_state, constellation, constellation_state))
+        if self.archiver and sc_state and archive_packet(ts, gs_state, sc_state):
+            self.archiver.put((ts, sc_state))
+
+        return gs_state, sc_state
+
+    # drains both stages
+    def close(self, timeout: float = 10.0) -> None:
+        self.publisher.close(timeout)
+        if self.archiver:
+            self.archiver.close(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'physics': self.physics.stats(),
+            'publish': self.publisher.stats(),
+            'archive': self.archiver.stats() if self.archiver else {}
+        }
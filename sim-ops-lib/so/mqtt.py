@@ -1,15 +1,173 @@
 
-import os, json
+import os, time, fnmatch, threading, logging
+from collections import OrderedDict
 import paho.mqtt.client as mqtt
 
+from .serializer import dumps
+
+logger = logging.getLogger(__name__)
+
 SO_MQTT = os.getenv('SO_MQTT', 'so-mqtt')
 if not SO_MQTT:
     SO_MQTT = 'so-mqtt'
+SO_MQTT_QOS = os.getenv('SO_MQTT_QOS', '0')
+if not SO_MQTT_QOS:
+    SO_MQTT_QOS = '0'
+
+# outbound messages waiting for the network, and what happens to them per topic: coalesce keeps only
+# the newest queued message of a topic, drop_oldest and drop_newest make room when the queue is full
+SO_MQTT_QUEUE = os.getenv('SO_MQTT_QUEUE', '1000')
+if not SO_MQTT_QUEUE:
+    SO_MQTT_QUEUE = '1000'
+SO_MQTT_POLICY = os.getenv('SO_MQTT_POLICY', 'coalesce')
+if not SO_MQTT_POLICY:
+    SO_MQTT_POLICY = 'coalesce'
+
+POLICIES = ['coalesce', 'drop_oldest', 'drop_newest']
 
+# first matching pattern wins, deltas are never coalesced as clients need all of them
+DEFAULT_TOPIC_POLICIES = [('*/delta', 'drop_oldest')]
+
+def _client():
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    else:
+        return mqtt.Client()
+
+# publishing never blocks the simulation: messages go to a bounded queue, a sender thread encodes and hands
+# them to paho, whose network loop runs in its own thread and reconnects with backoff
 class MQTT:
-    def __init__(self, host=SO_MQTT, port=1883) -> None:
-        self.client = mqtt.Client()
-        self.client.connect(host=host, port=port)
-        
-    def publish(self, topic, data):
-        return self.client.publish(topic, json.dumps(data))
+    def __init__(self, host=SO_MQTT, port=1883, qos: int = None, max_queue: int = None, policy: str = None, topic_policies: list = None, client=None) -> None:
+        self.qos = int(qos if qos is not None else SO_MQTT_QOS)
+        self.max_queue = int(max_queue if max_queue else SO_MQTT_QUEUE)
+        self.policy = policy if policy else SO_MQTT_POLICY
+        self.topic_policies = topic_policies if topic_policies is not None else DEFAULT_TOPIC_POLICIES
+        if self.policy not in POLICIES or any([x[1] not in POLICIES for x in self.topic_policies]):
+            raise ValueError(f"Unknown MQTT queue policy: { self.policy }")
+        self.policies = {}
+
+        # queued messages by key, the topic for coalesced topics, a counter otherwise
+        self.queue = OrderedDict()
+        self.counter = 0
+        self.cond = threading.Condition()
+        self.connected = False
+        self.closed = False
+
+        self.published, self.dropped, self.coalesced, self.errors, self.reconnects = 0, 0, 0, 0, 0
+        self.latency_last, self.latency_max, self.latency_sum = 0.0, 0.0, 0.0
+
+        self.client = client if client else _client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.connect_async(host=host, port=port)
+        self.client.loop_start()
+
+        self.sender = threading.Thread(target=self._send_loop, name='so-mqtt-sender', daemon=True)
+        self.sender.start()
+
+    # paho callbacks, with either callback API version
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        logger.info(f"MQTT connected: { reason_code }")
+        with self.cond:
+            self.connected = True
+            self.cond.notify_all()
+
+    def _on_disconnect(self, client, userdata, *args):
+        logger.warning(f"MQTT disconnected, reconnecting")
+        with self.cond:
+            self.connected = False
+            self.reconnects += 1
+
+    def _policy(self, topic: str) -> str:
+        if topic not in self.policies:
+            self.policies[topic] = next((p for pattern, p in self.topic_policies if fnmatch.fnmatchcase(topic, pattern)), self.policy)
+
+        return self.policies[topic]
+
+    def publish(self, topic, data, retain=False):
+        with self.cond:
+            if self.closed:
+                return False
+
+            policy = self._policy(topic)
+            if policy == 'coalesce' and topic in self.queue:
+                # keep the queue position, the newest message replaces the queued one
+                self.queue[topic] = (topic, data, retain, self.queue[topic][3])
+                self.coalesced += 1
+                return True
+
+            if len(self.queue) >= self.max_queue:
+                self.dropped += 1
+                if policy == 'drop_newest':
+                    return False
+                self.queue.popitem(last=False)
+
+            if policy == 'coalesce':
+                key = topic
+            else:
+                key, self.counter = self.counter, self.counter + 1
+            self.queue[key] = (topic, data, retain, time.monotonic())
+            self.cond.notify()
+
+        return True
+
+    def _send_loop(self):
+        while True:
+            with self.cond:
+                while not self.closed and (not self.connected or len(self.queue) == 0):
+                    self.cond.wait()
+                if self.closed and (not self.connected or len(self.queue) == 0):
+                    return
+                _, (topic, data, retain, enqueued) = self.queue.popitem(last=False)
+                self.cond.notify_all()
+
+            try:
+                # binary payloads (bytes) are sent as they are
+                info = self.client.publish(topic, data if isinstance(data, bytes) else dumps(data), qos=self.qos, retain=retain)
+                _ok = info.rc == mqtt.MQTT_ERR_SUCCESS
+            except Exception as e:
+                logger.error(f"Failed MQTT publish on { topic }: { e }")
+                _ok = False
+
+            _latency = time.monotonic() - enqueued
+            with self.cond:
+                if _ok:
+                    self.published += 1
+                    self.latency_last, self.latency_max = _latency, max(self.latency_max, _latency)
+                    self.latency_sum += _latency
+                else:
+                    self.errors += 1
+
+    # queue depth, counters and the time messages wait until handed to the network loop
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                'connected': self.connected,
+                'queue_depth': len(self.queue),
+                'queue_max': self.max_queue,
+                'published': self.published,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'reconnects': self.reconnects,
+                'latency_ms': {
+                    'last': self.latency_last * 1000,
+                    'max': self.latency_max * 1000,
+                    'mean': self.latency_sum / self.published * 1000 if self.published > 0 else 0.0
+                }
+            }
+
+    # send what is queued, waiting at most timeout seconds while connected, then stop the network loop
+    def close(self, timeout: float = 5.0) -> None:
+        _deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.connected and len(self.queue) > 0 and time.monotonic() < _deadline:
+                self.cond.wait(_deadline - time.monotonic())
+            self.closed = True
+            self.queue.clear()
+            self.cond.notify_all()
+
+        self.sender.join(timeout)
+        self.client.disconnect()
+        self.client.loop_stop()
@@ -0,0 +1,116 @@
+
+import threading, logging
+from datetime import datetime
+import numpy as np
+import pytz
+from skyfield.api import wgs84
+from skyfield.framelib import itrs
+
+from .core import Scenario, GroundStation
+from .cache import get_timescale, get_satellite
+
+logger = logging.getLogger(__name__)
+
+# ground station network: elevation, azimuth, range and range rate towards the spacecraft for all
+# stations in one array computation per tick, and the handover deciding which station is active
+class StationNetwork:
+    def __init__(self, scenario: Scenario, stations: list[GroundStation] = None, satellite=None, time_scale=None, min_elevation: float = 5.0) -> None:
+        self.scenario = scenario
+        self.stations = stations if stations else scenario.ground_stations
+        self.names = [x.name for x in self.stations]
+        self.size = len(self.stations)
+
+        self.satellite = satellite if satellite else get_satellite(scenario.tle)
+        self.time_scale = time_scale if time_scale else get_timescale()
+
+        # below this elevation the active station hands over, same as the U/L carrier cut off
+        self.min_elevation = min_elevation
+
+        # ITRS station positions and local east/north/up axes, one row per station
+        self.positions = np.array([wgs84.latlon(x.latitude, x.longitude, elevation_m=x.altitude).itrs_xyz.km for x in self.stations])
+        _lat, _lon = np.radians([x.latitude for x in self.stations]), np.radians([x.longitude for x in self.stations])
+        self.axes = np.stack([
+            np.vstack([-np.sin(_lon), np.cos(_lon), np.zeros(self.size)]).T,
+            np.vstack([-np.sin(_lat) * np.cos(_lon), -np.sin(_lat) * np.sin(_lon), np.cos(_lat)]).T,
+            np.vstack([np.cos(_lat) * np.cos(_lon), np.cos(_lat) * np.sin(_lon), np.sin(_lat)]).T
+        ], axis=1)
+
+        # handover is either 'auto' or 'manual', the active station is commanded in manual
+        self.handover = 'auto'
+        self.active = 0
+        self.previous = 0
+        self.view = None
+
+        self.lock = threading.Lock()
+
+    # topocentric vectors (GCRS, km), elevation and azimuth (deg), distance (km) and range rate (km/s) for all stations
+    def visibility(self, ts: float) -> dict:
+        t = self.time_scale.from_datetime(datetime.fromtimestamp(ts, tz=pytz.UTC))
+
+        r, v = self.satellite.at(t).frame_xyz_and_velocity(itrs)
+        d = r.km - self.positions
+        distance = np.linalg.norm(d, axis=1)
+        enu = np.einsum('kij,kj->ki', self.axes, d)
+
+        return {
+            'position': d @ itrs.rotation_at(t),
+            'elevation': np.degrees(np.arcsin(enu[:, 2] / distance)),
+            'azimuth': np.degrees(np.arctan2(enu[:, 0], enu[:, 1])) % 360.0,
+            'distance': distance,
+            'range_rate': d @ v.km_per_s / distance
+        }
+
+    # compute the visibility and run the automatic handover, true if the active station changed since the last update
+    def update(self, ts: float) -> bool:
+        view = self.visibility(ts)
+
+        self.lock.acquire()
+        try:
+            self.view = view
+            _active = self.previous
+
+            # keep the active station while it sees the spacecraft, then hand over to the highest one
+            if self.handover == 'auto' and view['elevation'][self.active] < self.min_elevation:
+                _best = int(np.argmax(view['elevation']))
+                if view['elevation'][_best] >= self.min_elevation:
+                    self.active = _best
+
+            if self.active != _active:
+                logger.info(f"Handover from { self.names[_active] } to { self.names[self.active] }")
+            self.previous = self.active
+
+            return self.active != _active
+        finally:
+            self.lock.release()
+
+    # commanded handover to a station, or back to automatic handover
+    def select(self, value: str) -> bool:
+        if value == 'auto':
+            self.handover = 'auto'
+            return True
+
+        if value not in self.names:
+            return False
+
+        self.lock.acquire()
+        try:
+            self.handover = 'manual'
+            self.active = self.names.index(value)
+        finally:
+            self.lock.release()
+
+        return True
+
+    def station(self) -> str:
+        return self.names[self.active]
+
+    # active station values, as in GeometrySample
+    def current(self) -> dict:
+        return dict((k, v[self.active]) for k, v in self.view.items())
+
+    def summary(self) -> list[list]:
+        if self.view is None:
+            return []
+
+        return [[name, el, az, dist, -rr] for name, el, az, dist, rr in zip(self.names, self.view['elevation'].tolist(), self.view['azimuth'].tolist(),
+                                                                           self.view['distance'].tolist(), self.view['range_rate'].tolist())]
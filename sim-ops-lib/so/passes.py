@@ -0,0 +1,155 @@
+
+import threading, bisect, logging
+from datetime import datetime
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# sorted pass schedule for a ground station, predicted in chunks ahead of the simulation time;
+# on_extend is called with a snapshot whenever predictions were extended
+class PassSchedule:
+    def __init__(self, satellite, location, time_scale, begin: float, end: float = None,
+                 lookahead: float = 86400.0, chunk: float = 86400.0, background: bool = True, snapshot: dict = None,
+                 on_extend=None) -> None:
+        self.satellite = satellite
+        self.location = location
+        self.time_scale = time_scale
+
+        # predictions start at midnight of the first day
+        dt = datetime.fromtimestamp(begin, tz=pytz.UTC)
+        self.horizon = datetime(dt.year, dt.month, dt.day, tzinfo=pytz.UTC).timestamp()
+        self.end = end
+        self.lookahead = lookahead
+        self.chunk = chunk
+        self.on_extend = on_extend
+
+        # pass windows as [aos, los], kept sorted with aos and los for bisect lookups
+        self.passes, self._aos, self._los = [], [], []
+        self._rise = None
+        self._latest = begin
+
+        self.lock = threading.Lock()
+        self._extend_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        # resume from previously computed predictions, e.g. from the scenario products cache
+        if snapshot and snapshot['horizon'] > self.horizon:
+            self.passes = [list(x) for x in snapshot['passes']]
+            self._aos = [x[0] for x in self.passes]
+            self._los = [x[1] for x in self.passes]
+            self._rise = snapshot['rise']
+            self.horizon = snapshot['horizon']
+
+        # first chunk is computed synchronously, the rest in the background
+        self.extend(begin + self.lookahead)
+
+        self.worker = None
+        if background:
+            self.worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self.worker.start()
+
+    # predict passes up to (at least) ts
+    def extend(self, ts: float) -> None:
+        with self._extend_lock:
+            _horizon = self.horizon
+            self._extend(ts)
+            _snapshot = self._snapshot() if self.on_extend and self.horizon > _horizon else None
+
+        if _snapshot:
+            try:
+                self.on_extend(_snapshot)
+            except Exception as e:
+                logger.error(f"Failed handling extended pass predictions: { e }")
+
+    def _extend(self, ts: float) -> None:
+        while self.horizon < ts:
+            t_i = self.time_scale.from_datetime(datetime.fromtimestamp(self.horizon, tz=pytz.UTC))
+            _horizon = self.horizon + self.chunk
+            t_f = self.time_scale.from_datetime(datetime.fromtimestamp(_horizon, tz=pytz.UTC))
+            t, events = self.satellite.find_events(self.location, t_i, t_f, altitude_degrees=0.0)
+
+            _new = []
+            for ti, event in zip(t, events):
+                if event == 0:
+                    self._rise = ti.utc_datetime().timestamp()
+                # a set without a rise happens only if predictions start mid-pass
+                if event == 2 and self._rise is not None:
+                    _new.append([self._rise, ti.utc_datetime().timestamp()])
+                    self._rise = None
+
+            self.lock.acquire()
+            try:
+                self.passes.extend(_new)
+                self._aos.extend([x[0] for x in _new])
+                self._los.extend([x[1] for x in _new])
+                self.horizon = _horizon
+            finally:
+                self.lock.release()
+
+            logger.info(f"Pass predictions extended to { datetime.fromtimestamp(self.horizon, tz=pytz.UTC) }: { len(self.passes) } passes")
+
+    def _target(self) -> float:
+        target = self._latest + self.lookahead
+        if self.end is not None:
+            target = max(target, self.end)
+
+        return target
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.horizon < self._target():
+                    self.extend(min(self._target(), self.horizon + self.chunk))
+                    continue
+            except Exception as e:
+                logger.error(f"Failed extending pass predictions: { e }")
+            self._wake.wait(timeout=10)
+            self._wake.clear()
+
+    def _seen(self, ts: float) -> None:
+        self._latest = max(self._latest, ts)
+
+        # wake up the worker if running out of predicted passes, or predict now without one
+        if self.horizon < ts + self.lookahead / 2:
+            if self.worker:
+                self._wake.set()
+            else:
+                self.extend(self._target())
+
+        # the worker is lagging behind the simulation time
+        if self.horizon < ts:
+            self.extend(ts + self.chunk)
+
+    # pass window containing ts, or None
+    def current(self, ts: float):
+        self._seen(ts)
+
+        with self.lock:
+            k = bisect.bisect_right(self._aos, ts) - 1
+            if k >= 0 and ts <= self._los[k]:
+                return self.passes[k]
+
+        return None
+
+    # current or next pass window for ts, or None
+    def next(self, ts: float):
+        self._seen(ts)
+
+        with self.lock:
+            k = bisect.bisect_left(self._los, ts)
+            if k < len(self.passes):
+                return self.passes[k]
+
+        return None
+
+    def _snapshot(self) -> dict:
+        return { 'passes': [list(x) for x in self.passes], 'horizon': self.horizon, 'rise': self._rise }
+
+    def snapshot(self) -> dict:
+        with self._extend_lock:
+            return self._snapshot()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
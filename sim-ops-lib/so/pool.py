@@ -0,0 +1,258 @@
+
+import os, time, threading, logging, multiprocessing
+
+from .core import Backend, ObjectStore, Products
+from .spacecraft import SpacePacketHandler
+from .session import SessionManager, session_name
+
+logger = logging.getLogger(__name__)
+
+# seconds between session snapshots, a restarted worker resumes its sessions from the last one
+SO_SNAPSHOT_INTERVAL = os.getenv('SO_SNAPSHOT_INTERVAL', '5')
+if not SO_SNAPSHOT_INTERVAL:
+    SO_SNAPSHOT_INTERVAL = '5'
+
+# worker process main: a SessionManager answering commands from the supervisor over a pipe
+def _worker(conn, backend, products):
+    if products:
+        obj_store = ObjectStore()
+        manager = SessionManager(obj_store=obj_store, sph=SpacePacketHandler(), products=Products(object_store=obj_store), backend=backend)
+    else:
+        manager = SessionManager(backend=backend)
+
+    while True:
+        try:
+            seq, command, args = conn.recv()
+        except EOFError:
+            seq, command, args = None, 'exit', ()
+
+        try:
+            match command:
+                case 'control':
+                    result = manager.control(*args)
+                case 'snapshot':
+                    result = manager.snapshot(*args)
+                case 'restore':
+                    result = manager.restore(*args)
+                case 'running':
+                    result = manager.running()
+                case 'exit':
+                    for name, running in manager.running().items():
+                        if running:
+                            manager.get(name).stop()
+                    result = None
+                case other:
+                    result = None
+        except Exception as e:
+            logger.error(f"Worker failed command { command }: { e }")
+            result = { 'status': 'FAIL' } if command == 'control' else None
+
+        if command == 'exit':
+            try:
+                conn.send((seq, result))
+            except OSError:
+                pass
+            return
+
+        conn.send((seq, result))
+
+class Worker:
+    def __init__(self, index: int, context, backend, products: bool) -> None:
+        self.index = index
+        self.context = context
+        self.backend = backend
+        self.products = products
+
+        # running sessions, sessions changed since their last snapshot and the last snapshots,
+        # also of stopped sessions so that a restarted worker has their last states
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.dirty = set()
+        self.snapshots = {}
+        self.restarts = 0
+
+        # requests are numbered, replies of requests that timed out are skipped by the next call
+        self.seq = 0
+
+        self.start()
+
+    def start(self) -> None:
+        self.conn, _child = self.context.Pipe()
+        self.process = self.context.Process(target=_worker, args=(_child, self.backend, self.products), name=f"so-worker-{ self.index }", daemon=True)
+        self.process.start()
+        _child.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    # one request/response exchange, raises OSError or EOFError if the worker is gone
+    def call(self, command: str, *args, timeout: float = 60.0):
+        with self.lock:
+            self.seq += 1
+            self.conn.send((self.seq, command, args))
+
+            _deadline = time.monotonic() + timeout
+            while True:
+                if not self.conn.poll(max(_deadline - time.monotonic(), 0.0)):
+                    raise TimeoutError(f"Worker { self.index } did not answer { command }")
+
+                seq, result = self.conn.recv()
+                if seq == self.seq:
+                    return result
+                logger.warning(f"Worker { self.index } late reply to request { seq } skipped")
+
+    def stats(self) -> dict:
+        return {
+            'pid': self.process.pid,
+            'alive': self.alive(),
+            'sessions': sorted(self.sessions),
+            'restarts': self.restarts
+        }
+
+# supervisor placing sessions on worker processes, so that sessions run on separate cores;
+# control messages are routed to the worker owning the session, crashed workers are restarted
+# and their sessions restored from the last snapshot
+class SessionPool:
+    def __init__(self, workers: int = None, backend=Backend, products: bool = True, snapshot_interval: float = None) -> None:
+        self.context = multiprocessing.get_context('spawn')
+        self.snapshot_interval = float(snapshot_interval if snapshot_interval else SO_SNAPSHOT_INTERVAL)
+
+        self.workers = [Worker(i, self.context, backend, products) for i in range(workers if workers else os.cpu_count())]
+        self.owners = {}
+        self.lock = threading.Lock()
+
+        self.end = threading.Event()
+        self.monitor = threading.Thread(target=self._monitor_loop, name='so-pool-monitor', daemon=True)
+        self.monitor.start()
+
+    # new sessions go to the worker with the fewest running sessions, a stopped session
+    # starts again on its worker, which has its last states
+    def _owner(self, name: str, create: bool = False) -> Worker:
+        with self.lock:
+            if name not in self.owners and create:
+                self.owners[name] = min(self.workers, key=lambda x: len(x.sessions))
+
+            return self.owners.get(name)
+
+    # snapshot of the named sessions, all running sessions of the worker by default
+    def _snapshot(self, worker: Worker, names: list = None) -> None:
+        with self.lock:
+            names = list(names if names is not None else worker.sessions)
+            worker.dirty.difference_update(names)
+
+        try:
+            worker.snapshots.update(worker.call('snapshot', names))
+        except (OSError, EOFError, TimeoutError) as e:
+            logger.error(f"Failed snapshot of worker { worker.index }: { e }")
+
+    def _restart(self, worker: Worker) -> None:
+        logger.error(f"Worker { worker.index } exited with code { worker.process.exitcode }, restarting")
+
+        with worker.lock:
+            worker.restarts += 1
+            worker.start()
+
+        for name, snapshot in worker.snapshots.items():
+            try:
+                worker.call('restore', name, snapshot)
+                logger.info(f"Session { name } restored on worker { worker.index }")
+            except (OSError, EOFError, TimeoutError) as e:
+                logger.error(f"Failed restoring session { name }: { e }")
+
+    def _monitor_loop(self) -> None:
+        _last = time.monotonic()
+
+        while not self.end.wait(0.5):
+            _snapshot = time.monotonic() - _last >= self.snapshot_interval
+            if _snapshot:
+                _last = time.monotonic()
+
+            for worker in self.workers:
+                if self.end.is_set():
+                    break
+                if not worker.alive():
+                    self._restart(worker)
+                elif _snapshot and len(worker.sessions) > 0:
+                    self._snapshot(worker)
+                elif len(worker.dirty) > 0:
+                    self._snapshot(worker, names=worker.dirty)
+
+    def running(self) -> dict:
+        result = {}
+
+        for worker in self.workers:
+            try:
+                result.update(worker.call('running'))
+            except (OSError, EOFError, TimeoutError):
+                result.update(dict((x, False) for x in worker.sessions))
+
+        return result
+
+    def stats(self) -> list[dict]:
+        return [x.stats() for x in self.workers]
+
+    def control(self, data):
+        _fail = { 'status': 'FAIL'}
+
+        try:
+            name = session_name(data.get('session'))
+        except ValueError:
+            return _fail
+        data['session'] = name
+
+        _admin = 'system' in data and data['system'] == 'admin'
+        _start, _stop = _admin and data.get('control') == 'start', _admin and data.get('control') == 'stop'
+        _new = name not in self.owners
+        worker = self._owner(name, create=_start)
+
+        # unknown sessions are answered by any worker, as not running
+        _owned = worker is not None
+        if not _owned:
+            worker = self.workers[0]
+
+        if _start:
+            with self.lock:
+                worker.sessions.add(name)
+
+        try:
+            result = worker.call('control', data)
+        except (OSError, EOFError, TimeoutError) as e:
+            logger.error(f"Failed control command on worker { worker.index }: { e }")
+            result = _fail
+            # a crashed worker keeps its running sessions, the monitor restores them
+            _stop = False
+
+        _ok = isinstance(result, dict) and result.get('status') == 'OK'
+
+        if _admin and data.get('control') == 'status' and isinstance(result, dict):
+            result['sessions'] = self.running()
+            result['workers'] = self.stats()
+
+        # starts and stops are snapshot right away, other commands with the next monitor pass
+        if _owned and (_start or _stop) and _ok:
+            self._snapshot(worker, names=[name])
+        elif _owned and not _admin and data.get('system') not in ['spectrum', 'waterfall']:
+            with self.lock:
+                worker.dirty.add(name)
+
+        # stopped and failed sessions no longer count for placement and periodic snapshots
+        if (_start and not _ok) or _stop:
+            with self.lock:
+                worker.sessions.discard(name)
+                if _start and _new:
+                    del self.owners[name]
+
+        return result
+
+    def close(self) -> None:
+        self.end.set()
+        self.monitor.join()
+
+        for worker in self.workers:
+            try:
+                worker.call('exit', timeout=10.0)
+            except (OSError, EOFError, TimeoutError):
+                pass
+            worker.process.join(10.0)
+            if worker.alive():
+                worker.process.terminate()
@@ -0,0 +1,148 @@
+
+import os, json, struct, typing, logging
+from dataclasses import fields
+from enum import Enum
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# JSON backend for published messages: json (default) or orjson, if installed
+SO_JSON = os.getenv('SO_JSON', 'json')
+if not SO_JSON:
+    SO_JSON = 'json'
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if SO_JSON == 'orjson' and orjson is None:
+    logger.warning('orjson is not installed, using json')
+    SO_JSON = 'json'
+
+# orjson writes numpy arrays directly, json needs them as lists
+NUMPY_ARRAYS = SO_JSON == 'orjson'
+
+# ground station spectrums: json (in the state), binary (packed on <topic>/spectrum/bin only) or both
+SO_SPECTRUM = os.getenv('SO_SPECTRUM', 'json')
+if not SO_SPECTRUM:
+    SO_SPECTRUM = 'json'
+
+SPECTRUM_TOPIC = '/spectrum/bin'
+
+def dumps(data):
+    if SO_JSON == 'orjson':
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        return json.dumps(data)
+
+_PLAIN = (str, int, float, bool, type(None))
+
+# core imports this module through mqtt, custom_dict_factory is imported on first use
+_custom_dict_factory = None
+
+# values of fields without a specific converter, as custom_dict_factory
+def _convert(value):
+    global _custom_dict_factory
+
+    if isinstance(value, _PLAIN):
+        return value
+
+    if _custom_dict_factory is None:
+        from .core import custom_dict_factory as _custom_dict_factory
+
+    return _custom_dict_factory([(None, value)])[None]
+
+# one converter per field, chosen once per class from the field type
+def _converter(annotation, arrays: bool):
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        names = dict((x, x.name) for x in annotation)
+        names[None] = None
+        return lambda value: names[value] if value.__class__ is annotation or value is None else _convert(value)
+
+    if origin is list and len(args) == 1 and isinstance(args[0], type) and issubclass(args[0], Enum):
+        names = dict((x, x.name) for x in args[0])
+        return lambda value: [names[x] for x in value] if value is not None else None
+
+    if annotation is np.ndarray:
+        if arrays:
+            return lambda value: value if value.__class__ is np.ndarray or value is None else _convert(value)
+        else:
+            return lambda value: value.tolist() if value.__class__ is np.ndarray else _convert(value)
+
+    # containers of plain values (spectrums, flight dynamics readings, ...) are copy-on-write in the states
+    if origin in (list, dict) or annotation in (list, dict):
+        return lambda value: value if value.__class__ is list or value.__class__ is dict else _convert(value)
+
+    return lambda value: value if value.__class__ in _PLAIN else _convert(value)
+
+# serializer compiled per state class: knows every field and its converter in advance,
+# the dict is built in one pass without asdict recursion and isinstance dispatch
+class StateSerializer:
+    def __init__(self, cls, arrays: bool = False) -> None:
+        hints = typing.get_type_hints(cls)
+
+        self.cls = cls
+        self.arrays = arrays
+        self.fields = [(x.name, _converter(hints.get(x.name), arrays)) for x in fields(cls)]
+
+    def to_dict(self, state) -> dict:
+        return dict((name, convert(getattr(state, name))) for name, convert in self.fields)
+
+_SERIALIZERS = {}
+
+def serializer(cls, arrays: bool = False) -> StateSerializer:
+    key = (cls, arrays)
+    if key not in _SERIALIZERS:
+        _SERIALIZERS[key] = StateSerializer(cls, arrays=arrays)
+
+    return _SERIALIZERS[key]
+
+# state as a message for the configured JSON backend, numpy arrays kept as arrays for orjson
+def to_message(state) -> dict:
+    return serializer(state.__class__, arrays=NUMPY_ARRAYS).to_dict(state)
+
+# binary spectrums: little endian header (magic, version, ts, U/L and D/L sizes) followed by
+# float32 (frequency MHz, power dB) pairs, U/L first
+SPECTRUM_HEADER = struct.Struct('<4sBdHH')
+SPECTRUM_MAGIC = b'SOSP'
+
+def pack_spectrum(ts: float, spectrum_ul, spectrum_dl) -> bytes:
+    _ul = np.asarray(spectrum_ul, dtype='<f4').reshape(-1, 2)
+    _dl = np.asarray(spectrum_dl, dtype='<f4').reshape(-1, 2)
+
+    return SPECTRUM_HEADER.pack(SPECTRUM_MAGIC, 1, ts if ts else 0.0, len(_ul), len(_dl)) + _ul.tobytes() + _dl.tobytes()
+
+def unpack_spectrum(payload: bytes) -> dict:
+    magic, version, ts, n_ul, n_dl = SPECTRUM_HEADER.unpack_from(payload)
+    if magic != SPECTRUM_MAGIC or version != 1:
+        raise ValueError('Not a spectrum payload')
+
+    values = np.frombuffer(payload, dtype='<f4', offset=SPECTRUM_HEADER.size).reshape(-1, 2)
+
+    return { 'ts': ts, 'spectrum_ul': values[:n_ul], 'spectrum_dl': values[n_ul:n_ul + n_dl] }
+
+# binary waterfall rows: little endian header (magic, version, rows, bins) followed by the rows
+# simulation times, first and last frequencies (float64) and the powers (float32, rows x bins)
+WATERFALL_HEADER = struct.Struct('<4sBII')
+WATERFALL_MAGIC = b'SOWF'
+
+def pack_waterfall(data: dict) -> bytes:
+    values = np.ascontiguousarray(data['values'], dtype='<f4')
+    rows, bins = values.shape if values.ndim == 2 else (0, 0)
+
+    return (WATERFALL_HEADER.pack(WATERFALL_MAGIC, 1, rows, bins) + np.asarray(data['ts'], dtype='<f8').tobytes()
+            + np.asarray(data['f0'], dtype='<f8').tobytes() + np.asarray(data['f1'], dtype='<f8').tobytes() + values.tobytes())
+
+def unpack_waterfall(payload: bytes) -> dict:
+    magic, version, rows, bins = WATERFALL_HEADER.unpack_from(payload)
+    if magic != WATERFALL_MAGIC or version != 1:
+        raise ValueError('Not a waterfall payload')
+
+    _offset = WATERFALL_HEADER.size
+    ts, f0, f1 = [np.frombuffer(payload, dtype='<f8', count=rows, offset=_offset + i*rows*8) for i in range(3)]
+    values = np.frombuffer(payload, dtype='<f4', count=rows*bins, offset=_offset + 3*rows*8).reshape(rows, bins)
+
+    return { 'ts': ts, 'f0': f0, 'f1': f1, 'values': values }
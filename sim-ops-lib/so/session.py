@@ -0,0 +1,490 @@
+
+import os, re, json, glob, time, copy, base64, threading, logging, resource
+from datetime import datetime
+from concurrent.futures import Future
+import numpy as np
+
+from .core import load_scenario, Backend, OverrideState, Status
+from .geometry import GeometryEngine, scenario_cache_dir, scenario_key
+from .ground_station import GroundStationSim
+from .spacecraft import SpacecraftSim
+from .constellation import Constellation
+from .loop import tick, TickScheduler, TickPipeline, TICK_POLICIES
+from .delta import DeltaBackend, SO_PUBLISH
+from .topics import SubsystemBackend, SO_TOPICS
+from .serializer import pack_waterfall
+from .archive import SegmentWriter, SO_ARCHIVE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = 'default'
+
+# catch_up: run late ticks back to back, skip: drop missed ticks
+SO_TICK_POLICY = os.getenv('SO_TICK_POLICY', 'catch_up')
+if not SO_TICK_POLICY:
+    SO_TICK_POLICY = 'catch_up'
+
+# 1: publishing and archiving run on their own workers (see loop.TickPipeline), 0: the whole tick in series
+SO_PIPELINE = os.getenv('SO_PIPELINE', '1')
+if not SO_PIPELINE:
+    SO_PIPELINE = '1'
+
+# current resident set size in MB, peak RSS if /proc is not available
+def resident_memory():
+    try:
+        with open('/proc/self/statm', 'r') as fin:
+            return int(fin.read().split()[1]) * resource.getpagesize() / 2**20
+    except:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def get_scenarios_data(scenarios):
+    data = {}
+
+    for scenario in scenarios:
+        with open(os.path.join('data', 'scenarios', scenario, 'data.json'), 'r') as fin:
+            data[scenario] = json.load(fin)
+
+    return data
+
+# session names end up in MQTT topics, history paths and the <sim_uid>-tm bucket names, whose
+# 63 characters (S3 rules, lowercase) leave 39 after 'sim-YYYY.MM.DD-HHhMM-' and '-tm'
+def session_name(name: str = None) -> str:
+    name = name if name else DEFAULT_SESSION
+    if not re.fullmatch(r'[a-z0-9-]{1,39}', name):
+        raise ValueError(f"Invalid session name: { name }")
+
+    return name
+
+# control history of a session, saved on every stop; readable without the session, e.g. after a restart
+def history_path(name: str) -> str:
+    if name == DEFAULT_SESSION:
+        return os.path.join('data', 'hist')
+    else:
+        return os.path.join('data', 'hist', name)
+
+def get_history(name: str) -> list:
+    _path = history_path(name)
+
+    if os.path.exists(_path):
+        _filenames = sorted(glob.glob(os.path.join(_path, '*.json')), reverse=True)
+    else:
+        _filenames = []
+
+    result = []
+    for _filename in _filenames:
+        with open(_filename, 'r') as fin:
+            curr = json.load(fin)
+            result.append([int(_filename.split('/')[-1].split('.')[0]), curr])
+
+    return result
+
+# one simulation exercise: scenario, simulators, overrides and control history
+class Session:
+    def __init__(self, name: str, manager) -> None:
+        self.name = name
+        self.manager = manager
+
+        # the default session keeps the legacy topics, other sessions publish under their name
+        self.prefix = '' if name == DEFAULT_SESSION else f"{ name }/"
+
+        self.scenario, self.geometry, self.gs_sim, self.sc_sim, self.backend = None, None, None, None, None
+        self.publisher, self.delta, self.subsystems = None, None, None
+        self.constellation, self.last_constellation_state = None, None
+        self.end_sim, self.scheduler, self.pipeline, self.thread = None, None, None, None
+        self.archive = None
+        self.last_gs_state, self.last_sc_state = None, None
+        self.control_hist = []
+        self.ov_state = OverrideState()
+        self.sim_uid = None
+        self.startup = {}
+        self.uid, self.begin = None, None
+
+    def running(self) -> bool:
+        return not self.end_sim.is_set() if self.end_sim else False
+
+    def sim_loop(self):
+        logger.info(f"Starting sim loop: { self.name }")
+
+        self.scheduler = TickScheduler(self.scenario.time_step, self.begin, policy=SO_TICK_POLICY)
+        self.pipeline = TickPipeline(self.backend, store=self.archive, sph=self.manager.sph, sim_uid=self.sim_uid) if int(SO_PIPELINE) else None
+
+        for ts in self.scheduler.ticks(self.end_sim):
+            logger.info(f"sim loop ping! session: { self.name } ts: {ts} dt: {str(datetime.utcfromtimestamp(ts))}")
+
+            if self.pipeline:
+                self.pipeline.tick(ts, self.gs_sim, self.sc_sim, self.ov_state, constellation=self.constellation)
+            else:
+                tick(ts, self.gs_sim, self.sc_sim, self.ov_state, self.backend, store=self.archive, sph=self.manager.sph, sim_uid=self.sim_uid, constellation=self.constellation)
+
+        # publish and archive what the last ticks produced
+        if self.pipeline:
+            self.pipeline.close()
+
+    # resume_ts is the last simulated time of a restored session, ticks continue from there instead of the scenario begin
+    def start(self, uid, resume_ts=None, sim_uid=None):
+        logger.info(f"Starting sim { uid }, session { self.name }")
+
+        # fail the start command, not the simulation thread
+        if SO_TICK_POLICY not in TICK_POLICIES:
+            raise ValueError(f"Unknown tick policy: { SO_TICK_POLICY }")
+
+        self.end_sim = threading.Event()
+
+        _start, _rss = time.perf_counter(), resident_memory()
+        _timings, _t = {}, _start
+
+        self.uid = uid
+        self.scenario = load_scenario(uid)
+        self.begin = resume_ts + self.scenario.time_step if resume_ts else datetime.fromisoformat(self.scenario.begin).timestamp()
+        _timings['scenario'], _t = time.perf_counter() - _t, time.perf_counter()
+        self.geometry = self.manager.get_geometry(uid, self.scenario)
+        _timings['geometry'], _t = time.perf_counter() - _t, time.perf_counter()
+        self.gs_sim = GroundStationSim(self.scenario, initial_state=self.last_gs_state, geometry=self.geometry)
+        _timings['ground_station'], _t = time.perf_counter() - _t, time.perf_counter()
+        self.sc_sim = SpacecraftSim(self.scenario, initial_state=self.last_sc_state, geometry=self.geometry)
+        _timings['spacecraft'], _t = time.perf_counter() - _t, time.perf_counter()
+        self.constellation = Constellation(self.scenario, initial_state=self.last_constellation_state) if self.scenario.constellation else None
+        _timings['constellation'], _t = time.perf_counter() - _t, time.perf_counter()
+        self.publisher = self.backend = self.manager.backend(self.scenario, prefix=self.prefix)
+        if self.manager.publish == 'delta':
+            self.delta = self.backend = DeltaBackend(self.backend)
+        if self.manager.topics != 'legacy':
+            self.subsystems = self.backend = SubsystemBackend(self.backend, legacy=self.manager.topics == 'both')
+        _timings['backend'], _t = time.perf_counter() - _t, time.perf_counter()
+
+        self.startup = { 'seconds': time.perf_counter() - _start, 'timings': _timings,
+                         'rss_mb': resident_memory(), 'rss_delta_mb': resident_memory() - _rss }
+        logger.info(f"Sim startup took { self.startup['seconds']:.3f}s, rss { self.startup['rss_mb']:.1f}MB ({ self.startup['rss_delta_mb']:+.1f}MB)")
+
+        self.sim_uid = sim_uid if sim_uid else 'sim-' + datetime.utcnow().isoformat(sep='T', timespec='minutes').replace('-','.').replace(':','h').replace('T', '-')
+        if self.name != DEFAULT_SESSION and not sim_uid:
+            self.sim_uid += f"-{ self.name }"
+        logger.info(f"Sim UID set to: { self.sim_uid }")
+
+        if self.manager.products and not sim_uid:
+            logger.info('Products handling: flight dynamics start sim')
+            self.manager.products.fd_start_sim(session=self.name)
+
+        # TM packets appended to segments of the <sim_uid>-tm bucket, or one object each
+        if self.manager.obj_store is not None and SO_ARCHIVE == 'segments':
+            self.archive = SegmentWriter(self.manager.obj_store)
+        else:
+            self.archive = self.manager.obj_store
+
+        self.thread = threading.Thread(target=self.sim_loop)
+        self.thread.start()
+
+    def stop(self):
+        logger.info(f"Stopping sim, session { self.name }")
+
+        if self.end_sim == None or self.scenario == None or self.gs_sim == None or self.sc_sim == None:
+            logger.info("No sim running")
+            return
+        self.end_sim.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(30.0)
+        self.gs_sim.stop()
+
+        # flush the messages still queued, each start gets a new backend
+        if hasattr(self.publisher, 'close'):
+            self.publisher.close()
+
+        # packets still queued for the object store are uploaded before flight dynamics reads the archive
+        if hasattr(self.archive, 'flush') and not self.archive.flush(buckets=[self.sim_uid + '-tm']):
+            logger.warning(f"Archive uploads still pending: { self.archive.stats() }")
+
+        logger.info('Storing current ground station and spacecraft state')
+        self.last_gs_state = self.gs_sim.state if self.gs_sim else None
+        self.last_sc_state = self.sc_sim.state if self.sc_sim else None
+        self.last_constellation_state = self.constellation.state.copy() if self.constellation else None
+
+        if self.manager.products:
+            logger.info('Products handling: flight dynamics stop sim')
+            self.manager.products.fd_stop_sim(self.sim_uid, self.last_gs_state, session=self.name)
+
+        # save control history to file and reset
+        _path, _now = self.history_path(), int(datetime.utcnow().timestamp())
+        if not os.path.exists(_path):
+            os.makedirs(_path)
+        with open(os.path.join(_path, f"{ str(_now) }.json"), 'w') as fout:
+            json.dump(self.control_hist, fout)
+        self.control_hist = []
+
+        self.sim_uid = None
+        self.manager.release_geometry(self.geometry)
+
+    # everything needed to bring the session back in another process, all picklable
+    def snapshot(self) -> dict:
+        running = self.running()
+
+        return {
+            'uid': self.uid,
+            'running': running,
+            'sim_uid': self.sim_uid,
+            'gs_state': self.gs_sim.state if running else self.last_gs_state,
+            'sc_state': self.sc_sim.state if running else self.last_sc_state,
+            'constellation_state': (self.constellation.state.copy() if self.constellation else None) if running else self.last_constellation_state,
+            'ov_state': copy.deepcopy(self.ov_state),
+            'control_hist': list(self.control_hist)
+        }
+
+    def restore(self, snapshot: dict) -> None:
+        self.last_gs_state, self.last_sc_state = snapshot['gs_state'], snapshot['sc_state']
+        self.last_constellation_state = snapshot['constellation_state']
+        self.ov_state = snapshot['ov_state']
+        self.control_hist = snapshot['control_hist']
+
+        if snapshot['running']:
+            _resume = self.last_sc_state.ts if self.last_sc_state and self.last_sc_state.ts else None
+            self.start(snapshot['uid'], resume_ts=_resume, sim_uid=snapshot['sim_uid'])
+        else:
+            self.uid = snapshot['uid']
+
+    # complete messages on the next tick, for clients that lost a delta or just connected
+    def keyframe(self) -> bool:
+        if self.delta is None and self.subsystems is None:
+            return False
+
+        if self.delta:
+            self.delta.keyframe()
+        if self.subsystems:
+            self.subsystems.reset()
+
+        return True
+
+    def history_path(self):
+        return history_path(self.name)
+
+    def get_history(self):
+        return get_history(self.name)
+
+    def log_control(self, data, result, ts):
+        data['result'] = result['status']
+        data['ts'] = ts
+
+        if 'admin' in data and data['admin'] is True:
+            pass # FIXME log admin
+        else:
+            self.control_hist.append(data)
+
+    def status(self):
+        return {
+            'session': self.name,
+            'running': self.running(),
+            'name': self.scenario.name if self.scenario else '',
+            'overrides': self.ov_state.current(),
+            'events': self.geometry.events() if self.geometry else [],
+            'startup': self.startup,
+            'scheduler': self.scheduler.stats() if self.scheduler else {},
+            'publisher': self.publisher.stats() if hasattr(self.publisher, 'stats') else {},
+            'pipeline': self.pipeline.stats() if self.pipeline else {},
+            'archive': self.archive.stats() if hasattr(self.archive, 'stats') else {}
+        }
+
+    def control(self, data):
+        _ok, _fail = { 'status': 'OK' }, { 'status': 'FAIL'}
+        _admin = False
+        if 'admin' in data and data['admin'] is True:
+            _admin = True
+        else:
+            _admin = False
+
+        # handle spacecraft controls
+        if 'system' in data and data['system'] == 'spacecraft' and _admin is False:
+            _fail = { 'status': 'r:REL r:ACC r:FAIL'}
+            _ts = None
+
+            # need at least ground station U/L carrier enabled and sweep done to send commands
+            if self.gs_sim is None:
+                result = _fail
+            elif self.gs_sim.state.carrier_ul is None or self.gs_sim.state.carrier_ul == Status.off or self.gs_sim.state.sweep_done is False:
+                result = { 'status': 'r:REL r:ACC r:FAIL'}
+                _ts = self.gs_sim.state.ts
+            elif self.gs_sim.state.power_ul < 50:
+                result = { 'status': 'g:REL r:ACC r:FAIL'}
+                _ts = self.gs_sim.state.ts
+            else:
+                try:
+                    if self.ov_state.no_tc is not True:
+                        result = self.sc_sim.control(data, ov_state=self.ov_state, admin=_admin)
+                        self.sc_sim.tc_history(data, result)
+                        _ts = self.sc_sim.state.ts
+                    else:
+                        # FIXME result for no TC override
+                        result = { 'status': 'g:REL w:ACC w:UNK'}
+                        _ts = self.sc_sim.state.ts
+                except:
+                    logger.error(f"Failed spacecraft command: { data }")
+                    result = _fail
+            self.log_control(data, result, _ts)
+
+        # handle ground station control
+        elif 'system' in data and data['system'] == 'ground_station':
+
+            try:
+                result = self.gs_sim.control(data, sc_sim=self.sc_sim)
+                _ts = self.gs_sim.state.ts
+                self.log_control(data, result, _ts)
+            except:
+                logger.error(f"Failed ground station command: { data }")
+                result = _fail
+
+        # handle admin control for spacecraft, without overrides and requiring TC
+        elif 'system' in data and data['system'] == 'spacecraft' and _admin is True:
+            result = self.sc_sim.control(data, admin=_admin)
+            if 'OK' in result['status']:
+                result = _ok
+            else:
+                result = _fail
+
+        # spectrum demand from consumers, heartbeats or requests for the current spectrums (not logged)
+        elif 'system' in data and data['system'] == 'spectrum':
+            if self.gs_sim is None or data.get('control') not in ['heartbeat', 'get']:
+                result = _fail
+            else:
+                self.gs_sim.request_spectrum()
+                result = { 'status': 'OK' }
+                if data['control'] == 'get':
+                    _state = self.gs_sim.state
+                    result.update({ 'ts': _state.ts, 'spectrum_ul': _state.spectrum_ul, 'spectrum_dl': _state.spectrum_dl })
+
+        # recent spectrums for waterfall displays, packed binary (base64) or as lists with null for non finite values
+        elif 'system' in data and data['system'] == 'waterfall':
+            try:
+                _rows = self.gs_sim.waterfall.query(data.get('direction', 'dl'), start=data.get('start'), end=data.get('end'),
+                                                    max_rows=data.get('rows'), bins=data.get('bins'))
+            except (AttributeError, ValueError, TypeError):
+                _rows = None
+
+            if _rows is None:
+                result = _fail
+            elif data.get('format') == 'binary':
+                result = { 'status': 'OK', 'data': base64.b64encode(pack_waterfall(_rows)).decode() }
+            else:
+                _values = _rows['values'].astype(object)
+                _values[~np.isfinite(_rows['values'])] = None
+                result = { 'status': 'OK', 'ts': _rows['ts'].tolist(), 'f0': _rows['f0'].tolist(), 'f1': _rows['f1'].tolist(), 'values': _values.tolist() }
+
+        # handle overrides
+        elif 'system' in data and data['system'] == 'override':
+            if data['value'] is None or len(data['value']) == 0:
+                result = _fail
+            else:
+                if self.ov_state.update(data['control'], data['value']):
+                    result = { 'status': 'OK' }
+                else:
+                    result = _fail
+        else:
+            result = _fail
+
+        return result
+
+# hosts independent sessions, sharing the object store, products and the scenario geometry
+class SessionManager:
+    def __init__(self, obj_store=None, sph=None, products=None, backend=Backend, publish: str = None, topics: str = None) -> None:
+        self.obj_store = obj_store
+        self.sph = sph
+        self.products = products
+        self.backend = backend
+        self.publish = publish if publish else SO_PUBLISH
+        self.topics = topics if topics else SO_TOPICS
+
+        self.sessions = {}
+        self.geometries = {}
+        self.lock = threading.Lock()
+
+    def get(self, name: str = None, create: bool = False) -> Session:
+        name = session_name(name)
+
+        with self.lock:
+            if name not in self.sessions and create:
+                self.sessions[name] = Session(name, self)
+
+            return self.sessions.get(name)
+
+    def running(self) -> dict:
+        with self.lock:
+            return dict((k, v.running()) for k, v in self.sessions.items())
+
+    # all sessions, or the named ones
+    def snapshot(self, names: list = None) -> dict:
+        with self.lock:
+            sessions = [x for x in self.sessions.values() if names is None or x.name in names]
+
+        return dict((x.name, x.snapshot()) for x in sessions)
+
+    def restore(self, name: str, snapshot: dict) -> None:
+        self.get(name, create=True).restore(snapshot)
+
+    # geometry tables are immutable, sessions running the same scenario share them; the first session
+    # builds it outside the manager lock, the others wait for its future
+    def get_geometry(self, uid: str, scenario) -> GeometryEngine:
+        key = scenario_key(scenario)
+
+        with self.lock:
+            future = self.geometries.get(key)
+            _build = future is None
+            if _build:
+                future = self.geometries[key] = Future()
+
+        if _build:
+            try:
+                future.set_result(GeometryEngine(scenario, cache_dir=scenario_cache_dir(uid)))
+            except Exception as e:
+                with self.lock:
+                    del self.geometries[key]
+                future.set_exception(e)
+
+        return future.result()
+
+    # geometry of a stopped session is dropped once no running session shares it
+    def release_geometry(self, geometry: GeometryEngine) -> None:
+        with self.lock:
+            if geometry is None or any([x.running() and x.geometry is geometry for x in self.sessions.values()]):
+                return
+
+            for key, future in list(self.geometries.items()):
+                if future.done() and future.exception() is None and future.result() is geometry:
+                    del self.geometries[key]
+
+    def control(self, data):
+        _fail = { 'status': 'FAIL'}
+
+        try:
+            name = session_name(data.get('session'))
+            session = self.get(name, create=data.get('system') == 'admin' and data.get('control') == 'start')
+        except ValueError:
+            return _fail
+
+        # handle admin control
+        if 'system' in data and data['system'] == 'admin':
+            result = { 'status': 'OK' }
+
+            match data['control']:
+                case 'start':
+                    session.start(data['value'])
+                case 'stop':
+                    if session:
+                        session.stop()
+                case 'status':
+                    result['scenarios'] = sorted(os.listdir(os.path.join('data', 'scenarios')))
+                    result['data'] = get_scenarios_data(result['scenarios'])
+                    result['sessions'] = self.running()
+                    if session:
+                        result.update(session.status())
+                    else:
+                        result.update({ 'running': False, 'name': '', 'overrides': [] })
+                case 'history':
+                    result = get_history(name)
+                case 'keyframe':
+                    if not (session and session.keyframe()):
+                        result = _fail
+                case other:
+                    result = _fail
+
+            return result
+
+        if session is None:
+            return _fail
+
+        return session.control(data)
@@ -1,8 +1,6 @@
 
-import threading, random, copy, struct
-from dataclasses import dataclass, field, asdict
-from skyfield.api import load, wgs84, EarthSatellite, Timescale
-from skyfield.positionlib import Geocentric
+import threading, random, copy, struct, logging
+from dataclasses import dataclass, field
 from datetime import datetime
 import numpy as np
 from numpy import cos, pi, log10, sinc, sqrt, arccos, degrees, radians
@@ -10,20 +8,31 @@ import pytz
 from scipy.spatial.transform import Rotation
 from minsp import SpacePacket
 
-from .core import Scenario, Status, TTCModes, TTCAntenna, AOCSTarget, TTCState, OverrideState, custom_dict_factory, HPTC, Quality
+from .core import Scenario, Status, TTCModes, TTCAntenna, AOCSTarget, TTCState, OverrideState, slotted_copy, packed_enums, HPTC, Quality
+from .geometry import GeometryEngine
+from .serializer import serializer
+from .cache import get_timescale, get_ephemeris, get_satellite
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# slotted, no per-instance __dict__; vectors are float arrays of size 3 and enum fields
+# are kept as small ints, read as the enum members (see core.packed_enums)
+@slotted_copy
+@packed_enums
+@dataclass(slots=True)
 class SpacecraftState:
     ts: float = 0.0
-    position: Geocentric = None
+    position: np.ndarray = None
     is_sunlit: bool = None
+    next_eclipse_start: float = None
+    next_eclipse_end: float = None
 
     aocs_chain: str = 'A'
     aocs_mode: AOCSTarget = AOCSTarget.NADIR
     aocs_valid: Status = Status.unkown
     aocs_prev_mode: AOCSTarget = AOCSTarget.NADIR
-    aocs_rotation: list[float] = field(default_factory=lambda: [0.0, 0.0, 0.0])
-    aocs_rates: list[float] = field(default_factory=lambda: [0.0, 0.0, 0.0])
+    aocs_rotation: np.ndarray = field(default_factory=lambda: np.zeros(3))
+    aocs_rates: np.ndarray = field(default_factory=lambda: np.zeros(3))
     aocs_sun_angle: float = 0.0
     aocs_nadir_angle: float = 0.0
     aocs_damp: float = 1.0
@@ -59,15 +68,15 @@ class SpacecraftState:
     dhs_uploaded: list[str] = field(default_factory=list)
 
     pl_gps_status: Status = Status.off
-    pl_gps_pos: list[Status] = field(default_factory=lambda: [0.0, 0.0, 0.0])
+    pl_gps_pos: np.ndarray = field(default_factory=lambda: np.zeros(3))
     pl_camera_status: Status = Status.off
     pl_camera_config: str = 'LE'
     pl_sdr_status: Status = Status.off
     pl_sdr_config: str = 'BCN'
 
     # book-keeping
-    gs_carrier_ul = Status.off
-    gs_position: list[float] = field(default_factory=lambda: [0.0, 0.0, 0.0])
+    gs_carrier_ul: Status = Status.off
+    gs_position: np.ndarray = field(default_factory=lambda: np.zeros(3))
     status_dl: TTCState = TTCState.NO_RF
     sweep_done: bool = False
     ov_no_tm: bool = False
@@ -75,16 +84,16 @@ class SpacecraftState:
     frame_checks: Status = Status.enabled
 
     def to_dict(self):
-        return asdict(self, dict_factory=custom_dict_factory)
+        return serializer(SpacecraftState).to_dict(self)
 
     def scrub(self):
-        _state = copy.deepcopy(self)
+        _state = copy.copy(self)
 
         _state.aocs_chain = '0'
         _state.aocs_mode = AOCSTarget.NADIR
         _state.aocs_valid = Status.unkown
-        _state.aocs_rotation = [0.0, 0.0, 0.0]
-        _state.aocs_rates = [0.0, 0.0, 0.0]
+        _state.aocs_rotation = np.zeros(3)
+        _state.aocs_rates = np.zeros(3)
         _state.aocs_sun_angle = 0.0
         _state.aocs_nadir_angle = 0.0
 
@@ -104,7 +113,7 @@ class SpacecraftState:
         _state.dhs_tc_counter = 0
 
         _state.pl_gps_status = Status.off
-        _state.pl_gps_pos = [0.0, 0.0, 0.0]
+        _state.pl_gps_pos = np.zeros(3)
         _state.pl_camera_status = Status.off
         _state.pl_camera_config = ''
         _state.pl_sdr_status = Status.off
@@ -113,22 +122,24 @@ class SpacecraftState:
         return _state
 
 class SpacecraftSim:
-    def __init__(self, scenario: Scenario, initial_state: SpacecraftState = None) -> None:
+    def __init__(self, scenario: Scenario, initial_state: SpacecraftState = None, geometry: GeometryEngine = None) -> None:
         self.scenario = scenario
-        self.time_scale = load.timescale()
+        self.time_scale = get_timescale()
 
-        self.ephemeris = load('de421.bsp')
+        self.ephemeris = get_ephemeris('de421.bsp')
         self.earth = self.ephemeris['earth']
         self.sun = self.ephemeris['sun']
-        lines = [x.strip() for x in self.scenario.tle.split("\n") if len(x) > 0]
-        self.satellite = EarthSatellite(lines[1], lines[2], lines[0])
+        self.satellite = get_satellite(self.scenario.tle)
+
+        # scenario geometry, shared with the ground station simulator if provided
+        self.geometry = geometry if geometry else GeometryEngine(scenario, time_scale=self.time_scale, ephemeris=self.ephemeris, satellite=self.satellite)
 
         # store previous values for after removing overries
         self.prev_states = {}
 
         # start with the initial state argument if available
         if initial_state:
-            self.state = initial_state
+            self.state = copy.copy(initial_state)
         # otherwise start with new state
         else:
             self.state = SpacecraftState(ts=datetime.fromisoformat(self.scenario.begin).timestamp())
@@ -136,7 +147,10 @@ class SpacecraftSim:
         # update initial state with params defined in the scenario
         if scenario.sc_initial_state:
             for k, v in scenario.sc_initial_state.items():
-                self.state.__setattr__(k, v)
+                if k in SpacecraftState.__dataclass_fields__:
+                    self.state.__setattr__(k, v)
+                else:
+                    logger.warning(f"Unknown spacecraft initial state: { k }")
 
         # spacecraft commanding for tc
         self.command = Command()
@@ -165,7 +179,7 @@ class SpacecraftSim:
         if gs_state and len(gs_state.position)>1:
             _state.gs_position = gs_state.position
         else:
-            _state.gs_position = [0.0, 0.0, 0.0]
+            _state.gs_position = np.zeros(3)
         
         return _state
 
@@ -206,27 +220,25 @@ class SpacecraftSim:
         return _state
 
     def _update_position(self, _state: SpacecraftState, ts: float) -> SpacecraftState:
-        dt = datetime.fromtimestamp(ts, tz=pytz.UTC)
-        t = self.time_scale.from_datetime(dt)
+        sample = self.geometry.sample(ts)
+
+        _state.position = sample.position
+        _state.is_sunlit = sample.is_sunlit
 
-        _state.position = self.satellite.at(t)
-        _state.is_sunlit = bool(_state.position.is_sunlit(self.ephemeris))
+        _eclipse = self.geometry.next_eclipse(ts)
+        _state.next_eclipse_start, _state.next_eclipse_end = _eclipse if _eclipse else (None, None)
 
         if self.state.pl_gps_status == Status.on:
-            pos = wgs84.geographic_position_of(_state.position)
-            _state.pl_gps_pos = [pos.latitude.degrees, pos.longitude.degrees, pos.elevation.km]
+            _state.pl_gps_pos = np.array([sample.latitude, sample.longitude, sample.altitude])
         else:
-            _state.pl_gps_pos = [0,0,0]
+            _state.pl_gps_pos = np.zeros(3)
         return _state
 
     # AOCS
     def _simulate_aocs(self, _state: SpacecraftState, ts: float) -> SpacecraftState:
-        dt = datetime.fromtimestamp(ts, tz=pytz.UTC)
-        t = self.time_scale.from_datetime(dt)
-
-        sat_pos = _state.position.position.km
-        earth_pos = self.earth.at(t).observe(self.earth).position.km
-        sun_pos = self.earth.at(t).observe(self.sun).position.km
+        sat_pos = _state.position
+        earth_pos = np.zeros(3) # geocentric frame
+        sun_pos = self.geometry.sun_position(ts)
 
         nadir_dir = earth_pos - sat_pos
         sun_dir = sun_pos - sat_pos
@@ -250,8 +262,8 @@ class SpacecraftSim:
             _state.aocs_nadir_angle = self._aocs_calc_angle(nadir_dir, sun_dir) * _state.aocs_damp
             _state.aocs_sun_angle = self._aocs_calc_angle(sun_dir, sun_dir) + (1-_state.aocs_damp)*_state.aocs_sun_angle
 
-        _state.aocs_rates = list(np.absolute(np.array(new_rotation)*_state.aocs_damp) - np.absolute(np.array(_state.aocs_rotation)))
-        _state.aocs_rotation = list(np.array(new_rotation)*_state.aocs_damp)
+        _state.aocs_rates = np.absolute(new_rotation*_state.aocs_damp) - np.absolute(_state.aocs_rotation)
+        _state.aocs_rotation = new_rotation*_state.aocs_damp
 
         return _state
 
@@ -450,8 +462,9 @@ class SpacecraftSim:
 
     def ping(self, ts: float, gs_state = None, ov_state: OverrideState = None) -> SpacecraftState:
 
-        # start new state from previous state
-        _state = copy.deepcopy(self.state)
+        # start new state from previous state, states are immutable snapshots: the new state shares
+        # all values with the previous one, updates replace fields and never modify them in place
+        _state = copy.copy(self.state)
 
         # updates from ground station state
         _state = self._updates_from_gs_state(_state, gs_state)
@@ -506,7 +519,7 @@ class SpacecraftSim:
 
         # handle admin commands
         if admin is True:
-            _state, _result = self.command.execute(self.state, data, ov_state=ov_state, admin=True)
+            _state, _result = self.command.execute(copy.copy(self.state), data, ov_state=ov_state, admin=True)
             self.set_state(_state)
             return _result
 
@@ -529,7 +542,7 @@ class SpacecraftSim:
             return { 'status': 'g:REL w:UNK w:UNK' }
 
         # handle spacon commands
-        _state, _result = self.command.execute(self.state, data, ov_state=ov_state, admin=False)
+        _state, _result = self.command.execute(copy.copy(self.state), data, ov_state=ov_state, admin=False)
         self.set_state(_state)
         return _result
 
@@ -539,10 +552,12 @@ class SpacecraftSim:
 
         self.lock.acquire()
         try:
-            self.state.dhs_tc_counter += 1
-            _count = str(self.state.dhs_tc_counter).zfill(3)
-            _time_stamp = datetime.fromtimestamp(self.state.ts, tz=pytz.UTC).isoformat().replace('+00:00', '')
-            self.state.dhs_tc_history.append(f"{_count}\t{_time_stamp}\t{data['command']}")
+            _state = copy.copy(self.state)
+            _state.dhs_tc_counter += 1
+            _count = str(_state.dhs_tc_counter).zfill(3)
+            _time_stamp = datetime.fromtimestamp(_state.ts, tz=pytz.UTC).isoformat().replace('+00:00', '')
+            _state.dhs_tc_history = _state.dhs_tc_history + [f"{_count}\t{_time_stamp}\t{data['command']}"]
+            self.state = _state
             # FIXME TC history length
             # if len(self.state.dhs_tc_history) > 12:
             #     self.state.dhs_tc_history = self.state.dhs_tc_history[-12:]
@@ -700,7 +715,7 @@ class Command:
             if data['value'] in ['nominal', 'enabled', 'disabled']:
                 _idx = int(data['control'].split('__')[-1])
                 if _idx in [0, 1]:
-                    state.eps_sol_array[_idx] = Status[data['value']]
+                    state.eps_sol_array = [Status[data['value']] if i == _idx else x for i, x in enumerate(state.eps_sol_array)]
                     result = _ok
             else:
                 result = _fail
@@ -0,0 +1,107 @@
+
+import os, threading, logging
+from dataclasses import dataclass
+
+from .delta import _same
+
+logger = logging.getLogger(__name__)
+
+# legacy: only the aggregate spacecraft and ground_station topics, subsystem: only the
+# per subsystem topics (e.g. spacecraft/aocs), both: aggregate and per subsystem topics
+SO_TOPICS = os.getenv('SO_TOPICS', 'legacy')
+if not SO_TOPICS:
+    SO_TOPICS = 'legacy'
+
+# fields of a subsystem topic, names ending in * match by prefix; interval is the minimum
+# simulation time between messages and on_change skips messages where no field changed
+@dataclass
+class SubsystemTopic:
+    name: str
+    fields: list[str]
+    interval: float = 0.0
+    on_change: bool = True
+
+SUBSYSTEM_TOPICS = {
+    'spacecraft': [
+        SubsystemTopic('orbit', ['position', 'is_sunlit', 'next_eclipse_start', 'next_eclipse_end']),
+        SubsystemTopic('aocs', ['aocs_*']),
+        SubsystemTopic('ttc', ['ttc_*', 'status_dl', 'gs_carrier_ul', 'frame_quality', 'frame_checks']),
+        SubsystemTopic('eps', ['eps_*']),
+        SubsystemTopic('dhs', ['dhs_*']),
+        SubsystemTopic('payload', ['pl_*'])
+    ],
+    'ground_station': [
+        SubsystemTopic('spectrum', ['spectrum_ul', 'spectrum_dl']),
+        SubsystemTopic('tracking', ['elevation', 'azimuth', 'distance', 'position', 'auto_track', 'program_track', 'doppler_enabled',
+                                    'doppler_velocity', 'next_pass_start', 'next_pass_end', 'name', 'handover', 'stations']),
+        SubsystemTopic('link', ['carrier_ul', 'power_ul', 'mode', 'status_dl', 'snr_dl', 'ul_state', 'ul_snr', 'frame_quality', 'frame_checks',
+                                'sweep_done', 'sweep_count', 'auto_range', 'interference']),
+        SubsystemTopic('flight_dynamics', ['flight_dynamics'], interval=10.0),
+        SubsystemTopic('config', ['modes', 'status_dl_transitions'])
+    ]
+}
+
+# fans the aggregate states out to per subsystem topics, retained so new consoles get the
+# last values of topics that publish on change only; other topics go through as they are
+class SubsystemBackend:
+    def __init__(self, backend, topics: dict = None, legacy: bool = True) -> None:
+        self.backend = backend
+        self.topics = topics if topics else SUBSYSTEM_TOPICS
+        self.legacy = legacy
+
+        # (topic, subsystem) -> field names, and -> (ts, message) last published
+        self.names = {}
+        self.last = {}
+        self.lock = threading.Lock()
+
+    def _names(self, topic: str, subsystem: SubsystemTopic, data: dict) -> list[str]:
+        key = (topic, subsystem.name)
+        if key not in self.names:
+            self.names[key] = [k for k in data.keys() if k != 'ts' and any([k == x or (x.endswith('*') and k.startswith(x[:-1])) for x in subsystem.fields])]
+
+        return self.names[key]
+
+    # the next message of every subsystem topic is published regardless of rate and changes
+    def reset(self) -> None:
+        self.lock.acquire()
+        try:
+            self.last = {}
+        finally:
+            self.lock.release()
+
+    def publish(self, topic, data, retain=False):
+        if topic not in self.topics or not isinstance(data, dict):
+            return self.backend.publish(topic, data, retain=retain)
+
+        if self.legacy:
+            self.backend.publish(topic, data, retain=retain)
+
+        ts = data.get('ts')
+        for subsystem in self.topics[topic]:
+            names = self._names(topic, subsystem, data)
+            if len(names) == 0:
+                continue
+            message = dict((k, data[k]) for k in names if k in data)
+
+            self.lock.acquire()
+            try:
+                key = (topic, subsystem.name)
+                _ts, _last = self.last.get(key, (None, None))
+                if _last is not None and ts is not None and _ts is not None and ts - _ts < subsystem.interval:
+                    continue
+                if _last is not None and subsystem.on_change and all([_same(_last.get(k), v) for k, v in message.items()]):
+                    continue
+                self.last[key] = (ts, message)
+            finally:
+                self.lock.release()
+
+            message['ts'] = ts
+            self.backend.publish(f"{ topic }/{ subsystem.name }", message, retain=True)
+
+        return True
+
+    def store(self, bucket, object_name, byte_stream):
+        return self.backend.store(bucket, object_name, byte_stream)
+
+    def close(self):
+        return self.backend.close()
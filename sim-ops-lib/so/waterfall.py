@@ -0,0 +1,70 @@
+
+import os, threading
+import numpy as np
+
+# spectrums kept for the waterfall displays, a ten minute pass at one spectrum per second
+SO_WATERFALL_ROWS = os.getenv('SO_WATERFALL_ROWS', '600')
+if not SO_WATERFALL_ROWS:
+    SO_WATERFALL_ROWS = '600'
+
+DIRECTIONS = ['ul', 'dl']
+
+# preallocated ring buffers of the last rows U/L and D/L spectrums, float32 time x frequency;
+# each row keeps its simulation time and the first and last frequency of its grid (MHz)
+class Waterfall:
+    def __init__(self, rows: int = None, bins: int = 200) -> None:
+        self.rows = int(rows if rows else SO_WATERFALL_ROWS)
+        self.bins = bins
+
+        self.ts = np.full(self.rows, np.nan)
+        self.bounds = dict((x, np.zeros((self.rows, 2))) for x in DIRECTIONS)
+        self.values = dict((x, np.full((self.rows, self.bins), np.nan, dtype=np.float32)) for x in DIRECTIONS)
+
+        # rows pushed since the start, the next row goes to count % rows
+        self.count = 0
+        self.lock = threading.Lock()
+
+    # one row per direction, spectrums as the frequencies and powers arrays of SpectrumGenerator
+    def push(self, ts: float, ul: tuple, dl: tuple) -> None:
+        self.lock.acquire()
+        try:
+            i = self.count % self.rows
+            self.ts[i] = ts
+            for direction, (frequencies, totals) in zip(DIRECTIONS, [ul, dl]):
+                self.bounds[direction][i] = frequencies[0], frequencies[-1]
+                self.values[direction][i] = totals
+            self.count += 1
+        finally:
+            self.lock.release()
+
+    # rows between start and end (simulation time), oldest first; more than max_rows rows are merged in groups
+    # and more than bins frequency bins as well, keeping the maximum as a spectrum analyzer max hold would
+    def query(self, direction: str = 'dl', start: float = None, end: float = None, max_rows: int = None, bins: int = None) -> dict:
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction: { direction }")
+
+        self.lock.acquire()
+        try:
+            n = min(self.count, self.rows)
+            idx = np.arange(self.count - n, self.count) % self.rows
+            ts = self.ts[idx]
+
+            mask = np.ones(n, dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts <= end
+            idx = idx[mask]
+
+            ts, bounds, values = ts[mask], self.bounds[direction][idx], self.values[direction][idx]
+        finally:
+            self.lock.release()
+
+        if max_rows and len(ts) > max_rows:
+            groups = np.arange(0, len(ts), int(np.ceil(len(ts) / max_rows)))
+            ts, bounds, values = ts[groups], bounds[groups], np.maximum.reduceat(values, groups, axis=0)
+
+        if bins and bins < self.bins and len(ts) > 0:
+            values = np.maximum.reduceat(values, np.arange(0, self.bins, int(np.ceil(self.bins / bins))), axis=1)
+
+        return { 'ts': ts, 'f0': bounds[:, 0], 'f1': bounds[:, 1], 'values': values }
@@ -0,0 +1,131 @@
+import json, time, hashlib
+from types import SimpleNamespace
+
+from so.core import ObjectStore
+from so.archive import SegmentWriter, segment_names
+
+class _Response:
+    def __init__(self, data) -> None:
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def json(self):
+        return json.loads(self.data)
+
+# stands in for the minio client, objects in memory with ranged reads and listings
+class _Client:
+    def __init__(self) -> None:
+        self.buckets = set()
+        self.objects = {}
+        self.gets = []
+        self.puts = []
+
+    def bucket_exists(self, bucket):
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        self.buckets.add(bucket)
+
+    def list_buckets(self):
+        return [SimpleNamespace(name=x) for x in sorted(self.buckets)]
+
+    def put_object(self, bucket_name, object_name, data, length):
+        self.objects[(bucket_name, object_name)] = data.read(length)
+        self.puts.append((object_name, length))
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        self.gets.append((object_name, offset, length))
+        data = self.objects[(bucket_name, object_name)]
+        return _Response(data[offset:offset + length] if length else data[offset:])
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False):
+        result, dirs = [], set()
+        for (bucket, name), data in sorted(self.objects.items()):
+            if bucket != bucket_name or (prefix and not name.startswith(prefix)):
+                continue
+            if not recursive and '/' in name:
+                dirs.add(name.split('/')[0] + '/')
+                continue
+            result.append(SimpleNamespace(object_name=name, etag=hashlib.md5(data).hexdigest(), is_dir=False))
+
+        return result + [SimpleNamespace(object_name=x, etag=None, is_dir=True) for x in sorted(dirs)]
+
+def _packet(ts):
+    return f"packet-{ ts }".encode() * 4
+
+def test_segment_archive():
+    for compression in ['none', 'zlib']:
+        client = _Client()
+        store = ObjectStore(client=client)
+        writer = SegmentWriter(store, segment=60, gap=30, compression=compression, flush_packets=4)
+
+        # a pass of 100s, then another one after a gap; one packet per object before segments
+        store.store('sim-tm', '900', _packet(900))
+        times = list(range(1000, 1100, 5)) + list(range(2000, 2030, 5))
+        for ts in times:
+            writer.store('sim-tm', str(ts), _packet(ts))
+        assert writer.flush(5.0) == True
+
+        stats = writer.stats()
+        assert stats['packets'] == len(times)
+        assert stats['segments'] == 3
+        assert stats['open'] == 0
+        assert stats['failed'] == 0
+
+        # parts of 4 packets, the last part of each segment closes it
+        indexes = [json.loads(v) for (b, k), v in client.objects.items() if k.endswith('.json')]
+        assert sorted(set([x['segment_start'] for x in indexes])) == [1000, 1060, 2000]
+        assert sorted([x['start'] for x in indexes if x['closed']]) == [1040, 1080, 2020]
+        assert len(client.objects) == 15
+
+        data = store.get_objects_tm()
+        assert data == [{ 'bucket': 'sim-tm', 'data': sorted(['900'] + [str(x) for x in times]) }]
+
+        for ts in [900, 1000, 1055, 1060, 2025]:
+            assert store.get_packet('sim-tm', str(ts)) == _packet(ts)
+
+        # packets are ranged reads of their segment, indexes are not downloaded again
+        client.gets = []
+        assert store.get_packet('sim-tm', '1065') == _packet(1065)
+        assert [x[0] for x in client.gets] == [segment_names(1060, 0)[0]]
+        assert client.gets[0][2] > 0
+
+def test_segment_archive_open():
+    client = _Client()
+    store = ObjectStore(client=client)
+    writer = SegmentWriter(store, segment=0, gap=30, flush_packets=2)
+
+    # open segments are uploaded in parts of flush_packets packets, readers see the complete parts
+    for ts in range(0, 20, 5):
+        writer.store('sim-tm', str(ts), _packet(ts))
+    deadline = time.monotonic() + 5.0
+    while writer.stats()['pending'] > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.stats()['open'] == 1
+    assert store.get_packet('sim-tm', '5') == _packet(5)
+    assert store.segments.get('sim-tm', '15') == None
+
+    writer.store('sim-tm', '20', _packet(20))
+    assert writer.flush(5.0) == True
+    assert store.get_packet('sim-tm', '15') == _packet(15)
+    assert store.get_packet('sim-tm', '20') == _packet(20)
+    assert len(client.objects) == 6
+
+def test_segment_archive_upload_bytes():
+    client = _Client()
+    store = ObjectStore(client=client)
+    writer = SegmentWriter(store, segment=600, gap=30, flush_packets=12)
+
+    # a full segment, one packet per second: every packet and every index is uploaded once
+    for ts in range(0, 600):
+        writer.store('sim-tm', str(ts), _packet(ts))
+    assert writer.flush(5.0) == True
+
+    packets = sum([len(_packet(ts)) for ts in range(0, 600)])
+    indexes = sum([len(v) for (b, k), v in client.objects.items() if k.endswith('.json')])
+    assert len(client.puts) == len(client.objects) == 100
+    assert sum([x[1] for x in client.puts]) == packets + indexes
+    assert indexes < packets
+
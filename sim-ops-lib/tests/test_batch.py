@@ -0,0 +1,33 @@
+
+import json
+from dataclasses import replace
+
+from so.batch import run_batch, NullSink, MemorySink, FileSink
+from .shared import scenario
+
+_scenario = replace(scenario, end='2023-08-27 04:42:00+00:00')
+
+def test_batch_null_sink():
+    stats = run_batch(_scenario, sink=NullSink())
+
+    assert stats['ticks'] == 121
+    assert stats['ticks_per_second'] > 0
+
+def test_batch_memory_sink():
+    sink = MemorySink()
+    run_batch(_scenario, sink=sink)
+
+    assert len([x for x in sink.messages if x[0] == 'spacecraft']) == 121
+    assert ('flight-dynamics', 'sim-batch') in sink.objects
+
+def test_batch_file_sink(tmp_path):
+    filename = str(tmp_path / 'batch.jsonl')
+    sink = FileSink(filename)
+    run_batch(_scenario, sink=sink, products=False)
+    sink.close()
+
+    with open(filename, 'r') as fin:
+        lines = [json.loads(x) for x in fin]
+
+    assert len(lines) == 2 * 121
+    assert lines[0]['topic'] == 'ground_station'
@@ -0,0 +1,24 @@
+
+from so import cache
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from .shared import scenario
+
+def test_cache_timescale():
+    assert cache.get_timescale() is cache.get_timescale()
+
+def test_cache_ephemeris():
+    assert cache.get_ephemeris('de421.bsp') is cache.get_ephemeris('de421.bsp')
+
+def test_cache_satellite():
+    satellite = cache.get_satellite(scenario.tle)
+
+    assert satellite is cache.get_satellite(scenario.tle + '\n')
+    assert satellite.name == 'OPS-SAT'
+
+def test_cache_shared_by_sims():
+    gs_sim = GroundStationSim(scenario)
+    sc_sim = SpacecraftSim(scenario)
+
+    assert gs_sim.satellite is sc_sim.satellite
+    assert gs_sim.time_scale is sc_sim.time_scale
@@ -0,0 +1,80 @@
+import numpy as np
+from dataclasses import replace
+
+from so.constellation import Constellation, geodetic
+from so.geometry import GeometryEngine
+from so.batch import run_batch, MemorySink
+from .shared import scenario, _is_jsonable
+
+_iss = 'ISS (ZARYA)\n1 25544U 98067A   23238.52740963  .00015618  00000+0  28286-3 0  9993\n2 25544  51.6418 330.8541 0005476 269.8467 207.4851 15.49663005412453'
+_scenario = replace(scenario, constellation=[scenario.tle, _iss])
+
+def test_constellation_geometry():
+    constellation = Constellation(_scenario)
+    geometry = GeometryEngine(_scenario)
+
+    for ts in [geometry.ts_i, geometry.ts_i + 300, geometry.ts_f]:
+        state = constellation.ping(ts)
+        sample = geometry.sample(ts)
+
+        assert np.allclose(state.position[0], sample.position, atol=1e-6) == True
+        assert np.allclose([state.latitude[0], state.longitude[0], state.altitude[0]], [sample.latitude, sample.longitude, sample.altitude], atol=1e-6) == True
+        assert abs(state.elevation[0] - sample.elevation) < 1e-6
+        assert abs(state.distance[0] - sample.distance) < 1e-6
+        assert state.is_sunlit[0] == sample.is_sunlit
+
+def test_constellation_eclipses():
+    constellation = Constellation(replace(_scenario, constellation=[_iss]))
+    geometry = GeometryEngine(replace(scenario, tle=_iss, end='2023-08-27 06:40:00+00:00'))
+
+    for ts in np.arange(geometry.ts_i, geometry.ts_f, 60.0):
+        assert constellation.ping(ts).is_sunlit[0] == geometry.is_sunlit(ts)
+
+def test_constellation_updates():
+    constellation = Constellation(_scenario)
+
+    state = constellation.ping(1693111200.0)
+    memory = state.dhs_memory.copy()
+    constellation.state.pl_camera_status[1] = True
+    constellation.state.dhs_memory[1] = 50.0
+    state = constellation.ping(1693111210.0)
+
+    assert state.dhs_tm_counter.tolist() == [2, 2]
+    assert state.dhs_memory[1] > 50.0
+    assert state.dhs_memory[0] == memory[0]
+    assert state.eps_net_power[1] < state.eps_net_power[0]
+
+    dicts = constellation.to_dicts()
+    assert [x['name'] for x in dicts] == ['OPS-SAT', 'ISS (ZARYA)']
+    assert dicts[1]['pl_camera_status'] == 'on'
+    assert _is_jsonable(dicts) == True
+
+def test_constellation_sgp4_errors():
+    constellation = Constellation(_scenario)
+    state = constellation.ping(1693111200.0)
+    position = state.position[1].copy()
+
+    # the second spacecraft decays, it keeps its last position instead of NaN
+    _sgp4 = constellation.models.sgp4
+    def _decayed(jd, fraction):
+        e, r, v = _sgp4(jd, fraction)
+        e[1], r[1] = 6, np.nan
+        return e, r, v
+    constellation.models = type('Models', (), { 'sgp4': staticmethod(_decayed) })()
+
+    state = constellation.ping(1693111210.0)
+    assert constellation.errors.tolist() == [0, 6]
+    assert np.allclose(state.position[1], position) == True
+    assert np.isfinite(state.distance).all() == True
+
+def test_geodetic():
+    lat, lon, alt = geodetic(np.array([[6378.137, 0.0, 0.0], [0.0, 0.0, 6356.752314245]]))
+
+    assert np.allclose(lat, [0.0, 90.0]) == True
+    assert np.allclose(alt, [0.0, 0.0], atol=1e-6) == True
+
+def test_constellation_batch():
+    sink = MemorySink()
+    run_batch(replace(_scenario, end='2023-08-27 04:41:00+00:00'), sink=sink, products=False)
+
+    assert len([x for x in sink.messages if x[0] == 'spacecraft/ISS-ZARYA']) == 61
@@ -0,0 +1,51 @@
+import json
+
+from so.batch import MemorySink
+from so.delta import DeltaBackend, DeltaDecoder
+from .shared import _run, _Tee
+
+def test_delta_publishing():
+    sink, full = MemorySink(), MemorySink()
+    backend = DeltaBackend(sink, keyframe_interval=5)
+    _run(_Tee(backend, full))
+
+    topics = [x[0] for x in sink.messages if x[0].startswith('spacecraft')]
+    assert topics[0] == 'spacecraft/keyframe'
+    assert topics[5] == 'spacecraft/keyframe'
+    assert topics[1:5] == ['spacecraft/delta'] * 4
+
+    # decoded messages are the full messages
+    decoder = DeltaDecoder()
+    decoded = []
+    for topic, data in sink.messages:
+        if topic == 'ground_station/keyframe':
+            decoded.append(decoder.keyframe(data))
+        elif topic == 'ground_station/delta':
+            decoded.append(decoder.delta(data))
+    assert decoded == [x[1] for x in full.messages if x[0] == 'ground_station']
+
+    # deltas leave out the fields that did not change
+    _delta = [x[1] for x in sink.messages if x[0] == 'ground_station/delta'][0]
+    assert 'modes' not in _delta['set']
+    assert 'status_dl_transitions' not in _delta['set']
+    assert len(json.dumps(_delta)) < len(json.dumps(full.messages[0][1]))
+
+def test_delta_gap_and_keyframe():
+    sink = MemorySink()
+    backend = DeltaBackend(sink, keyframe_interval=100)
+    _run(backend, ticks=4)
+
+    messages = [x[1] for x in sink.messages if x[0].startswith('spacecraft')]
+    decoder = DeltaDecoder()
+    decoder.keyframe(messages[0])
+
+    # a lost delta stops decoding until the next keyframe
+    assert decoder.delta(messages[2]) is None
+    assert decoder.synced() == False
+
+    # keyframes on demand
+    backend.keyframe()
+    backend.publish('spacecraft', messages[0]['data'])
+    assert sink.messages[-1][0] == 'spacecraft/keyframe'
+    assert decoder.keyframe(sink.messages[-1][1]) == messages[0]['data']
+    assert decoder.synced() == True
@@ -0,0 +1,159 @@
+
+import os, json, time, threading
+from dataclasses import replace
+from datetime import datetime
+import numpy as np
+
+from so.geometry import GeometryEngine, GeometrySample, purge_stale
+from so.ground_station import GroundStationSim
+from .shared import scenario
+
+def test_geometry_engine():
+    geometry = GeometryEngine(scenario)
+
+    assert isinstance(geometry, GeometryEngine) == True
+    assert geometry.table.shape == (geometry.size, 16)
+
+def test_geometry_sample():
+    geometry = GeometryEngine(scenario)
+    ts = datetime.fromisoformat(scenario.begin).timestamp() + 300.5
+
+    sample = geometry.sample(ts)
+    direct = geometry._compute(geometry._times(ts, np.zeros(1))).ravel()
+
+    assert isinstance(sample, GeometrySample) == True
+    assert np.allclose(sample.position, direct[0:3], atol=0.1)
+    assert abs(sample.elevation - direct[12]) < 0.01
+    assert abs(sample.range_rate - direct[15]) < 0.001
+
+def test_geometry_chunks():
+    # a week at one second, only the chunks reached are computed
+    _scenario = replace(scenario, end='2023-09-03 10:00:00+00:00', time_step=1)
+    geometry = GeometryEngine(_scenario, chunk=600)
+    ts = datetime.fromisoformat(_scenario.begin).timestamp()
+
+    assert geometry.size > 600000
+    assert all([x is None for x in geometry.chunks])
+
+    for dt in [0.5, 599.5, 600.0, 1250.25]:
+        direct = geometry._compute(geometry._times(ts + dt, np.zeros(1))).ravel()
+        assert np.allclose(geometry.row(ts + dt)[0:6], direct[0:6], atol=1.0)
+    assert sum([x is not None for x in geometry.chunks]) <= 4
+
+def test_geometry_longitude_antimeridian():
+    _scenario = replace(scenario, end='2023-08-27 07:40:00+00:00', time_step=10)
+    geometry = GeometryEngine(_scenario)
+    ts = datetime.fromisoformat(_scenario.begin).timestamp()
+    longitude = geometry.table[:, 7]
+
+    # samples either side of the antimeridian interpolate through +-180, not through 0
+    i = int(np.nonzero(np.abs(np.diff(longitude)) > 180.0)[0][0])
+    for f in [0.25, 0.5, 0.75]:
+        assert abs(geometry.row(ts + (i + f) * geometry.step)[7]) > 170.0
+
+def test_geometry_sample_outside_window():
+    geometry = GeometryEngine(scenario)
+    ts = datetime.fromisoformat(scenario.end).timestamp() + 3600
+
+    assert geometry.covers(ts) == False
+    assert geometry.sample(ts).distance > 0
+
+def test_geometry_eclipses():
+    # OPS-SAT is sunlit all the time in late August, use an ISS orbit instead
+    _tle = 'ISS (ZARYA)\n1 25544U 98067A   23239.18256944  .00012765  00000-0  23208-3 0  9993\n2 25544  51.6416 349.8174 0004937 354.4620 125.1236 15.49782542413142'
+    _scenario = replace(scenario, tle=_tle, end='2023-08-27 10:40:00+00:00', time_step=10)
+    geometry = GeometryEngine(_scenario)
+
+    assert len(geometry.eclipses) > 0
+    assert all([x['event'] in ['eclipse_entry', 'eclipse_exit'] for x in geometry.events()])
+
+    for entry, exit in geometry.eclipses:
+        if entry is not None:
+            assert geometry.is_sunlit(entry + 30) == False
+            assert geometry.is_sunlit(entry - 30) == True
+            assert geometry.next_eclipse(entry - 30) == [entry, exit]
+
+def test_geometry_sun_position():
+    geometry = GeometryEngine(scenario)
+    ts = datetime.fromisoformat(scenario.begin).timestamp() + 450.0
+
+    direct = geometry._compute_sun(geometry._times(ts, np.zeros(1))).ravel()
+
+    assert np.allclose(geometry.sun_position(ts), direct, rtol=1e-6)
+
+def test_geometry_cache(tmp_path):
+    cache_dir = tmp_path / 'scenario' / 'cache'
+    os.makedirs(cache_dir)
+    (tmp_path / 'scenario' / 'data.json').write_text('{}')
+
+    geometry = GeometryEngine(scenario, cache_dir=str(cache_dir))
+    geometry.store_passes({ 'passes': [[1.0, 2.0]], 'horizon': 3.0, 'rise': None })
+    ts = datetime.fromisoformat(scenario.begin).timestamp() + 120.5
+    row = geometry.row(ts)
+
+    cached = GeometryEngine(scenario, cache_dir=str(cache_dir))
+
+    assert np.allclose(cached.row(ts), row)
+    assert isinstance(cached.chunks[0], np.memmap) == True
+    assert np.allclose(cached.row(ts), geometry.row(ts))
+    assert cached.eclipses == geometry.eclipses
+    assert cached.pass_snapshot['passes'] == [[1.0, 2.0]]
+
+def test_geometry_cache_passes(tmp_path):
+    cache_dir = tmp_path / 'scenario' / 'cache'
+    os.makedirs(cache_dir)
+    (tmp_path / 'scenario' / 'data.json').write_text('{}')
+
+    # pass predictions are cached as they are predicted, not only when a session stops
+    geometry = GeometryEngine(scenario, cache_dir=str(cache_dir))
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    try:
+        with open(geometry._path('json'), 'r') as fin:
+            passes = json.load(fin)['passes']
+        assert len(passes['passes']) > 0
+        assert passes['horizon'] > geometry.ts_f
+
+        # predictions reaching less far do not replace them
+        geometry.store_passes({ 'passes': [], 'horizon': 0.0, 'rise': None })
+        assert geometry.pass_snapshot['passes'] == passes['passes']
+    finally:
+        gs_sim.stop()
+
+def test_geometry_cache_threads(tmp_path):
+    cache_dir = tmp_path / 'scenario' / 'cache'
+    os.makedirs(cache_dir)
+    (tmp_path / 'scenario' / 'data.json').write_text('{}')
+
+    # sessions of one process building the same products at once
+    errors = []
+    def _build():
+        try:
+            GeometryEngine(scenario, cache_dir=str(cache_dir)).row(datetime.fromisoformat(scenario.begin).timestamp())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_build) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert sorted([x.split('.', 1)[-1] for x in os.listdir(cache_dir)]) == ['geometry.0.npy', 'json', 'sun.npy']
+    assert isinstance(GeometryEngine(scenario, cache_dir=str(cache_dir))._chunk(0), np.memmap) == True
+
+def test_geometry_cache_stale(tmp_path):
+    cache_dir = tmp_path / 'scenario' / 'cache'
+    os.makedirs(cache_dir)
+    source = tmp_path / 'scenario' / 'data.json'
+    source.write_text('{}')
+
+    GeometryEngine(scenario, cache_dir=str(cache_dir)).table
+    assert len(os.listdir(cache_dir)) == 3
+
+    # scenario definition updated after the products were cached
+    _mtime = time.time() + 10
+    os.utime(source, (_mtime, _mtime))
+    purge_stale(str(cache_dir))
+
+    assert len(os.listdir(cache_dir)) == 0
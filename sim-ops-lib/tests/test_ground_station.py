@@ -1,5 +1,8 @@
 
-from so.ground_station import GroundStationState, GroundStationSim
+import numpy as np
+
+from so.core import TTCModes, Status
+from so.ground_station import GroundStationState, GroundStationSim, SpectrumGenerator
 from so.spacecraft import SpacecraftSim
 from .shared import scenario, _is_jsonable
 
@@ -23,3 +26,70 @@ def test_ground_station_sim_ping():
     assert state.ts > _prev_state.ts
 
     assert _is_jsonable(state.to_dict()) == True
+
+def test_ground_station_sim_snapshots():
+    gs_sim = GroundStationSim(scenario)
+    sc_sim = SpacecraftSim(scenario)
+    gs_sim.state.program_track = True
+
+    # earlier states are not modified by ticks or commands
+    _prev_state = gs_sim.state
+    for i in range(30):
+        gs_sim.ping(_prev_state.ts + 300 + i, sc_sim.state)
+    gs_sim.control({ 'control': 'power_ul', 'value': 40 })
+
+    assert len(_prev_state.flight_dynamics) == 0
+    assert len(gs_sim.state.flight_dynamics) == 3
+    assert _prev_state.power_ul != 40.0
+    assert gs_sim.state.power_ul == 40.0
+
+def test_spectrum_generator():
+    gen = SpectrumGenerator(seed=7)
+
+    # same seed, same noise
+    _f, _ul = gen.uplink_spectrum(TTCModes.S_Sub_LBR, power=50)
+    assert np.array_equal(_ul, SpectrumGenerator(seed=7).uplink_spectrum(TTCModes.S_Sub_LBR, power=50)[1]) == True
+
+    # shifted cached shapes match the shapes evaluated at the Doppler shifted carrier
+    for mode in [TTCModes.S_Sup_LBR, TTCModes.X_Res_LBR, TTCModes.S_Sub_LBR]:
+        template = gen._template('dl', mode)
+        frequencies, cf = template['frequencies'], template['cf'] * (1 + 6.5*1000/3e8)
+        shape = np.interp(frequencies - cf, template['x'], template['shape'])
+
+        if mode.name[2:5] == 'Sup':
+            direct = gen._PSK(template['bw'], frequencies, cf)
+        else:
+            direct = gen._NRZ_PM_shape(mode.name[2:5], template['bw'], frequencies - cf, 0.7)
+
+        assert np.max(np.abs(10*np.log10(shape + 1) - 10*np.log10(direct + 1))) < 0.05
+
+    _f, _dl = gen.downlink_spectrum(TTCModes.S_Sub_LBR, v_doppler=6.5, SNR=10, coherent=True)
+    assert len(_dl) == gen.SPECTRUMSIZE
+    assert np.all(np.isfinite(_dl)) == True
+
+def test_ground_station_spectrum_demand():
+    gs_sim = GroundStationSim(scenario, spectrum_demand='heartbeat', spectrum_interval=5)
+    sc_sim = SpacecraftSim(scenario)
+    gs_sim.state.program_track = True
+    ts = gs_sim.state.ts + 300
+
+    # no consumer, no spectrums, tracking still runs
+    state = gs_sim.ping(ts, sc_sim.state)
+    assert state.spectrum_dl == []
+    assert state.elevation is not None
+
+    # computed on demand, then at most every 5s
+    gs_sim.request_spectrum()
+    state = gs_sim.ping(ts + 1, sc_sim.state)
+    assert len(state.spectrum_dl) > 0
+    assert gs_sim.ping(ts + 2, sc_sim.state).spectrum_dl is state.spectrum_dl
+    assert gs_sim.ping(ts + 6, sc_sim.state).spectrum_dl is not state.spectrum_dl
+
+    # noise floor only once, with the transmitter off and no U/L carrier
+    sc_sim.state.ttc_tx_status = Status.off
+    state = gs_sim.ping(ts + 12, sc_sim.state)
+    assert gs_sim.ping(ts + 20, sc_sim.state).spectrum_dl is state.spectrum_dl
+
+    # back to no spectrums once the heartbeats stop
+    gs_sim.spectrum_until = 0.0
+    assert gs_sim.ping(ts + 21, sc_sim.state).spectrum_dl == []
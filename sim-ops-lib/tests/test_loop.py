@@ -0,0 +1,122 @@
+
+import time
+
+from so.loop import TickScheduler, TickPipeline, Stage
+from so.batch import MemorySink
+from so.core import OverrideState
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim, SpacePacketHandler
+from .shared import scenario
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class FakeEvent:
+    def __init__(self, clock, ticks):
+        self.clock = clock
+        self.ticks = ticks
+
+    def is_set(self):
+        return self.ticks <= 0
+
+    def wait(self, timeout):
+        self.clock.now += timeout
+
+def _run(policy, durations):
+    clock = FakeClock()
+    event = FakeEvent(clock, len(durations))
+    scheduler = TickScheduler(1, 1000.0, policy=policy, clock=clock)
+
+    result = []
+    for ts in scheduler.ticks(event):
+        result.append(ts)
+        clock.now += durations[len(result)-1]
+        event.ticks -= 1
+
+    return scheduler, result
+
+def test_tick_scheduler_no_drift():
+    scheduler, result = _run('catch_up', [0.3] * 5)
+
+    assert result == [1000.0, 1001.0, 1002.0, 1003.0, 1004.0]
+    assert scheduler.overruns == 0
+
+def test_tick_scheduler_catch_up():
+    scheduler, result = _run('catch_up', [0.1, 2.5, 0.1, 0.1, 0.1])
+
+    assert result == [1000.0, 1001.0, 1002.0, 1003.0, 1004.0]
+    assert scheduler.overruns == 2
+    assert scheduler.stats()['lateness_ms']['>1000ms'] == 1
+
+def test_tick_scheduler_skip():
+    scheduler, result = _run('skip', [0.1, 2.5, 0.1, 0.1])
+
+    assert result == [1000.0, 1001.0, 1003.0, 1004.0]
+    assert scheduler.skipped == 1
+
+# sink that takes its time, as a broker with a backlog or an object store hiccup
+class SlowSink(MemorySink):
+    def publish(self, topic, data, retain=False):
+        time.sleep(0.05)
+        return super().publish(topic, data)
+
+    def store(self, bucket, object_name, byte_stream):
+        time.sleep(0.2)
+        super().store(bucket, object_name, byte_stream)
+
+def test_tick_pipeline():
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    sink = SlowSink()
+    pipeline = TickPipeline(sink, store=sink, sph=SpacePacketHandler(), sim_uid='sim-test')
+
+    ts = gs_sim.state.ts + 300
+    start = time.perf_counter()
+    for i in range(10):
+        pipeline.tick(ts + i, gs_sim, sc_sim, OverrideState())
+    elapsed = time.perf_counter() - start
+
+    # physics did not wait for the sinks
+    assert elapsed < 10 * 2 * 0.05
+    pipeline.close()
+    gs_sim.stop()
+
+    stats = pipeline.stats()
+    assert stats['publish']['processed'] == 10
+    assert stats['publish']['max_depth'] > 1
+    assert len(sink.messages) == 20
+    assert stats['physics']['max_ms'] > 0.0
+    assert stats['archive']['dropped'] == 0
+
+def test_stage_blocks():
+    done = []
+    stage = Stage('test', lambda x: (time.sleep(0.05), done.append(x)), size=2, policy='block')
+
+    start = time.perf_counter()
+    for i in range(5):
+        stage.put(i)
+    assert time.perf_counter() - start > 0.05
+    stage.close()
+
+    # nothing dropped, the producer waited for room instead
+    assert done == [0, 1, 2, 3, 4]
+    assert stage.stats()['dropped'] == 0
+    assert stage.stats()['blocked'] > 0
+
+def test_stage_drops_oldest():
+    done = []
+    stage = Stage('test', lambda x: (time.sleep(0.05), done.append(x)), size=2)
+
+    for i in range(5):
+        stage.put(i)
+    stage.close()
+
+    # the first one was already being handled, the newest ones are kept
+    assert done[-2:] == [3, 4]
+    assert stage.stats()['dropped'] == 5 - len(done)
@@ -0,0 +1,82 @@
+import time, json
+import paho.mqtt.client as mqtt
+
+from so.mqtt import MQTT
+
+class _Info:
+    rc = mqtt.MQTT_ERR_SUCCESS
+
+# stands in for the paho client, connects when told to and records publishes
+class _Client:
+    def __init__(self, delay=0.0) -> None:
+        self.messages = []
+        self.delay = delay
+        self.on_connect, self.on_disconnect = None, None
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def connect(self):
+        self.on_connect(self, None, {}, 0, None)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        time.sleep(self.delay)
+        self.messages.append((topic, payload, qos, retain))
+        return _Info()
+
+def _wait(f, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not f() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_mqtt_queue_while_disconnected():
+    client = _Client()
+    publisher = MQTT(client=client, max_queue=3, qos=1)
+
+    # states coalesce per topic, deltas are all kept until the queue is full
+    for i in range(5):
+        assert publisher.publish('spacecraft', { 'ts': i }) == True
+        publisher.publish('spacecraft/delta', { 'seq': i })
+    stats = publisher.stats()
+    assert stats['queue_depth'] == 3
+    assert stats['coalesced'] == 3
+    assert stats['dropped'] == 4
+    assert client.messages == []
+
+    # sent once connected, newest state only and the newest deltas
+    client.connect()
+    _wait(lambda: len(client.messages) == 3)
+    assert [x[0] for x in client.messages] == ['spacecraft', 'spacecraft/delta', 'spacecraft/delta']
+    assert [json.loads(x[1]) for x in client.messages] == [{ 'ts': 4 }, { 'seq': 3 }, { 'seq': 4 }]
+    assert client.messages[0][2] == 1
+
+    publisher.close()
+    assert publisher.publish('spacecraft', { 'ts': 6 }) == False
+
+def test_mqtt_does_not_block():
+    client = _Client(delay=0.05)
+    publisher = MQTT(client=client, policy='drop_newest', topic_policies=[])
+    client.connect()
+
+    # a slow broker does not slow down publishing
+    start = time.perf_counter()
+    for i in range(20):
+        publisher.publish('ground_station', { 'ts': i })
+    assert time.perf_counter() - start < 0.05
+
+    publisher.close(timeout=5.0)
+    assert len(client.messages) == 20
+    assert publisher.stats()['published'] == 20
+    assert publisher.stats()['latency_ms']['max'] > 50.0
@@ -0,0 +1,67 @@
+import numpy as np
+from dataclasses import replace
+
+from so.core import GroundStation, Status
+from so.network import StationNetwork
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from .shared import scenario, ground_station, _is_jsonable
+
+_stations = [ground_station, GroundStation('Kiruna', 67.857, 20.964, 402), GroundStation('Redu', 50.002, 5.146, 385)]
+_scenario = replace(scenario, ground_stations=_stations)
+
+def test_network_visibility():
+    network = StationNetwork(_scenario)
+    geometry = GeometryEngine(scenario)
+
+    for ts in [geometry.ts_i, geometry.ts_i + 300, geometry.ts_f]:
+        view = network.visibility(ts)
+        sample = geometry.sample(ts)
+
+        assert len(view['elevation']) == 3
+        assert np.allclose(view['position'][0], sample.gs_position, atol=1e-6) == True
+        assert abs(view['elevation'][0] - sample.elevation) < 1e-6
+        assert abs(view['azimuth'][0] - sample.azimuth) < 1e-6
+        assert abs(view['distance'][0] - sample.distance) < 1e-6
+        assert abs(view['range_rate'][0] - sample.range_rate) < 1e-6
+
+def test_network_handover():
+    network = StationNetwork(_scenario)
+    geometry = GeometryEngine(scenario)
+
+    active = []
+    for ts in np.arange(geometry.ts_i, geometry.ts_f, 10.0):
+        network.update(ts)
+        active.append(network.station())
+
+    # Darmstadt hands over to Kiruna when the spacecraft sets
+    assert active[0] == 'Darmstadt'
+    assert active[-1] == 'Kiruna'
+
+    assert network.select('Redu') == True
+    network.update(geometry.ts_f)
+    assert network.station() == 'Redu'
+    assert network.select('Villafranca') == False
+    assert network.select('auto') == True
+
+def test_ground_station_sim_network():
+    gs_sim = GroundStationSim(_scenario)
+    sc_sim = SpacecraftSim(_scenario)
+    gs_sim.state.program_track = True
+
+    ts = gs_sim.state.ts + 300
+    state = gs_sim.ping(ts, sc_sim.state)
+    assert state.name == 'Darmstadt'
+    assert state.elevation > 40
+    assert len(state.stations) == 3
+
+    gs_sim.state.carrier_ul = Status.on
+    assert gs_sim.control({ 'control': 'handover', 'value': 'Kiruna' }) == { 'status': 'OK' }
+    state = gs_sim.ping(ts + 1, sc_sim.state)
+    assert state.name == 'Kiruna'
+    assert state.handover == 'manual'
+    assert state.carrier_ul == Status.off
+    assert state.elevation < 5
+
+    assert _is_jsonable(state.to_dict()) == True
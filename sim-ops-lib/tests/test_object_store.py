@@ -0,0 +1,193 @@
+import time, json, hashlib, threading
+from io import BytesIO
+from types import SimpleNamespace
+from minio.error import S3Error
+
+from so.core import ObjectStore, Products
+
+def _error(code):
+    return S3Error(None, code, code, None, None, None)
+
+# stands in for the minio client, keeps objects in memory and fails the first puts when told to
+class _Client:
+    def __init__(self, delay=0.0, failures=0, slow=None) -> None:
+        self.buckets = set()
+        self.objects = {}
+        self.delay = delay
+        self.slow = slow
+        self.failures = failures
+        self.calls = { 'bucket_exists': 0, 'make_bucket': 0, 'put_object': 0, 'get_object': 0 }
+        self.lock = threading.Lock()
+
+    def bucket_exists(self, bucket):
+        self.calls['bucket_exists'] += 1
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        self.calls['make_bucket'] += 1
+        if bucket in self.buckets:
+            raise _error('BucketAlreadyOwnedByYou')
+        self.buckets.add(bucket)
+
+    def put_object(self, bucket_name, object_name, data, length):
+        if self.slow is None or bucket_name in self.slow:
+            time.sleep(self.delay)
+        with self.lock:
+            self.calls['put_object'] += 1
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError('connection reset')
+            if bucket_name not in self.buckets:
+                raise _error('NoSuchBucket')
+            self.objects[(bucket_name, object_name)] = data.read(length)
+            return SimpleNamespace(etag=hashlib.md5(self.objects[(bucket_name, object_name)]).hexdigest())
+
+    def _object(self, bucket_name, object_name):
+        data = self.objects[(bucket_name, object_name)]
+        return SimpleNamespace(object_name=object_name, etag=hashlib.md5(data).hexdigest(), is_dir=False)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False):
+        return [self._object(b, k) for b, k in sorted(self.objects.keys()) if b == bucket_name]
+
+    def stat_object(self, bucket_name, object_name):
+        return self._object(bucket_name, object_name)
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        self.calls['get_object'] += 1
+        data = self.objects[(bucket_name, object_name)]
+        return SimpleNamespace(read=lambda: data, json=lambda: json.loads(data))
+
+def test_object_store_bucket_cache():
+    client = _Client()
+    store = ObjectStore(client=client)
+
+    for i in range(10):
+        store.store('sim-tm', str(i), b'packet')
+
+    assert len(client.objects) == 10
+    assert client.calls['bucket_exists'] == 1
+    assert client.calls['make_bucket'] == 1
+
+    # bucket created by someone else between the check and the creation
+    client.bucket_exists = lambda bucket: False
+    store.store('sim-tm-2', '0', b'packet')
+    store.buckets.clear()
+    store.store('sim-tm-2', '1', b'packet')
+    assert ('sim-tm-2', '1') in client.objects
+
+    # bucket removed, checked again on the next store
+    client.buckets.discard('sim-tm-2')
+    try:
+        store.store('sim-tm-2', '2', b'packet')
+    except S3Error:
+        pass
+    assert 'sim-tm-2' not in store.buckets
+
+def test_object_store_async():
+    client = _Client(delay=0.01, failures=2)
+    store = ObjectStore(client=client, workers=4)
+    store.backoff = 0.01
+
+    start = time.perf_counter()
+    for i in range(20):
+        store.store_async('sim-tm', str(i), f"packet-{ i }".encode())
+    assert time.perf_counter() - start < 0.1
+
+    assert store.flush(5.0) == True
+    assert len(client.objects) == 20
+    assert client.objects[('sim-tm', '7')] == b'packet-7'
+
+    stats = store.stats()
+    assert stats['queued'] == 0
+    assert stats['uploaded'] == 20
+    assert stats['failed'] == 0
+    assert stats['retried'] == 2
+
+def test_object_store_flush_buckets():
+    client = _Client(delay=0.5, slow=['sim-a-tm'])
+    store = ObjectStore(client=client, workers=2)
+
+    # a session stopping waits for its own packets, not those of the other sessions
+    for i in range(4):
+        store.store_async('sim-a-tm', str(i), b'packet')
+    store.store_async('sim-b-tm', '0', b'packet')
+
+    start = time.perf_counter()
+    assert store.flush(5.0, buckets=['sim-b-tm']) == True
+    assert time.perf_counter() - start < 0.8
+    assert ('sim-b-tm', '0') in client.objects
+    assert store.flush(0.1, buckets=['sim-a-tm']) == False
+    assert store.flush(5.0) == True
+
+def test_object_store_async_failed():
+    client = _Client(failures=3)
+    store = ObjectStore(client=client, workers=1)
+    store.backoff = 0.01
+
+    store.store_async('sim-tm', '0', b'packet')
+    assert store.flush(5.0) == True
+    assert store.stats()['failed'] == 1
+    assert len(client.objects) == 0
+
+def _product(client, uid, status, validity, data):
+    body = json.dumps({ 'id': uid, 'status': status, 'validity': validity, 'data': data }).encode()
+    client.put_object('flight-dynamics', uid, BytesIO(body), len(body))
+
+def test_object_store_fd_index():
+    client = _Client()
+    store = ObjectStore(client=client)
+    products = Products(object_store=store)
+
+    # products written by another process are downloaded once, then only if changed
+    client.make_bucket('flight-dynamics')
+    for i in range(5):
+        _product(client, f"sim-{ i }", 1, i % 2, [[i]])
+
+    index = store.fd_index()
+    assert index['total'] == 5
+    assert [x['id'] for x in index['products']] == ['sim-4', 'sim-3', 'sim-2', 'sim-1', 'sim-0']
+    assert client.calls['get_object'] == 5
+    assert store.fd_index()['version'] == index['version']
+    assert client.calls['get_object'] == 5
+
+    # paging and metadata only
+    page = store.get_objects_fd(offset=1, limit=2, data=False)
+    assert [x['id'] for x in page] == ['sim-3', 'sim-2']
+    assert 'data' not in page[0]
+    assert client.calls['get_object'] == 5
+
+    # writes through the store update the index without downloads
+    products.fd_start_sim()
+    index = store.fd_index()
+    assert [x['status'] for x in index['products']] == [-1, 2, -1, 2, -1]
+    assert index['products'][0]['data'] == [[4]]
+    assert client.calls['get_object'] == 5
+
+    data = store.update_object('flight-dynamics', 'sim-1', 'status', 3)
+    assert data['status'] == 3
+    assert json.loads(client.objects[('flight-dynamics', 'sim-1')])['status'] == 3
+    assert store.get_objects_fd()[3]['status'] == 3
+    assert client.calls['get_object'] == 5
+
+    # changed behind our back
+    _product(client, 'sim-0', 0, 0, [])
+    assert store.get_objects_fd()[4]['status'] == 0
+    assert client.calls['get_object'] == 6
+    assert store.fd_index()['version'] != index['version']
+
+def test_products_sessions():
+    client = _Client()
+    store = ObjectStore(client=client)
+    products = Products(object_store=store)
+
+    gs_state = SimpleNamespace(flight_dynamics=[[0, 0, 0, 1.0, True, True]])
+    products.fd_stop_sim('sim-a', gs_state)
+    products.fd_stop_sim('sim-b-team-b', gs_state, session='team-b')
+    for uid in ['sim-a', 'sim-b-team-b']:
+        store.update_object('flight-dynamics', uid, 'status', 1)
+
+    # starting a session only takes its own products
+    products.fd_start_sim(session='team-b')
+    assert dict((x['id'], x['status']) for x in store.get_objects_fd(data=False)) == { 'sim-a': 1, 'sim-b-team-b': 2 }
+    products.fd_start_sim()
+    assert dict((x['id'], x['status']) for x in store.get_objects_fd(data=False)) == { 'sim-a': 2, 'sim-b-team-b': 2 }
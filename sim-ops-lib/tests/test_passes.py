@@ -0,0 +1,47 @@
+
+from datetime import datetime
+from skyfield.api import load, wgs84, EarthSatellite
+
+from so.passes import PassSchedule
+from .shared import scenario
+
+def _schedule(**kwargs):
+    lines = [x.strip() for x in scenario.tle.split("\n") if len(x) > 0]
+    satellite = EarthSatellite(lines[1], lines[2], lines[0])
+    location = wgs84.latlon(scenario.ground_station.latitude, scenario.ground_station.longitude,
+                            elevation_m=scenario.ground_station.altitude)
+    begin = datetime.fromisoformat(scenario.begin).timestamp()
+
+    return PassSchedule(satellite, location, load.timescale(), begin, **kwargs), begin
+
+def test_pass_schedule():
+    schedule, begin = _schedule(background=False)
+
+    assert len(schedule.passes) > 0
+    assert schedule.horizon >= begin + schedule.lookahead
+    assert all([x[0] < x[1] for x in schedule.passes])
+    assert all([schedule.passes[i][1] < schedule.passes[i+1][0] for i in range(len(schedule.passes)-1)])
+
+def test_pass_schedule_lookups():
+    schedule, begin = _schedule(background=False)
+
+    aos, los = schedule.next(begin)
+    assert schedule.current((aos + los) / 2) == [aos, los]
+    assert schedule.current(aos - 1) is None
+    assert schedule.next(los + 1)[0] > los
+
+def test_pass_schedule_rolling_horizon():
+    schedule, begin = _schedule(background=False, chunk=21600.0)
+    horizon = schedule.horizon
+
+    _pass = schedule.next(begin + 3 * 86400)
+
+    assert schedule.horizon > horizon
+    assert _pass is not None and _pass[1] >= begin + 3 * 86400
+
+def test_pass_schedule_snapshot():
+    schedule, begin = _schedule(background=False)
+    resumed, _ = _schedule(background=False, snapshot=schedule.snapshot())
+
+    assert resumed.passes == schedule.passes
+    assert resumed.horizon == schedule.horizon
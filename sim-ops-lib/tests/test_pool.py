@@ -0,0 +1,83 @@
+import time, threading, multiprocessing
+import pytest
+
+from so.batch import NullSink
+from so.pool import SessionPool, Worker
+from .shared import _workdir
+
+# module level so that spawned workers can unpickle it
+def _backend(scenario, prefix=''):
+    return NullSink()
+
+def _wait(condition, timeout=60.0):
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.2)
+
+    return condition()
+
+def test_pool_routing_and_restart(tmp_path, monkeypatch):
+    _workdir(tmp_path, monkeypatch)
+    pool = SessionPool(workers=2, backend=_backend, products=False, snapshot_interval=0.5)
+
+    try:
+        assert pool.control({ 'system': 'admin', 'control': 'start', 'value': 'ops-sat-demo', 'session': 'a' })['status'] == 'OK'
+        assert pool.control({ 'system': 'admin', 'control': 'start', 'value': 'ops-sat-demo', 'session': 'b' })['status'] == 'OK'
+        assert pool.control({ 'system': 'override', 'control': 'no_tc', 'value': 'true', 'session': 'b' })['status'] == 'OK'
+
+        # sessions are spread over the workers
+        worker_a, worker_b = pool.owners['a'], pool.owners['b']
+        assert worker_a is not worker_b
+
+        status = pool.control({ 'system': 'admin', 'control': 'status', 'session': 'b' })
+        assert status['sessions'] == { 'a': True, 'b': True }
+        assert len(status['workers']) == 2
+        overrides = status['overrides']
+
+        # a crashed worker is restarted and its session restored, other workers are not affected
+        pid_a, pid_b = worker_a.process.pid, worker_b.process.pid
+        time.sleep(1.5)
+        worker_b.process.kill()
+
+        assert _wait(lambda: worker_b.restarts == 1 and pool.running() == { 'a': True, 'b': True }) == True
+        assert worker_b.process.pid != pid_b
+        assert worker_a.process.pid == pid_a
+
+        status = pool.control({ 'system': 'admin', 'control': 'status', 'session': 'b' })
+        assert status['overrides'] == overrides
+        assert status['scheduler']['ticks'] >= 0
+
+        # unknown sessions are reported as not running
+        assert pool.control({ 'system': 'admin', 'control': 'status', 'session': 'c' })['running'] == False
+        assert pool.control({ 'system': 'ground_station', 'control': 'carrier_ul', 'session': 'c' }) == { 'status': 'FAIL' }
+
+        # commands only mark their session for the next snapshot
+        assert pool.control({ 'system': 'override', 'control': 'no_tm', 'value': 'true', 'session': 'b' })['status'] == 'OK'
+        assert _wait(lambda: len(worker_b.dirty) == 0) == True
+        assert 'no_tm' in dict(worker_b.snapshots['b']['ov_state'].current())
+
+        # failed starts and stopped sessions are not placed nor snapshot
+        assert pool.control({ 'system': 'admin', 'control': 'start', 'value': 'unknown', 'session': 'c' }) == { 'status': 'FAIL' }
+        assert 'c' not in pool.owners
+        assert pool.control({ 'system': 'admin', 'control': 'stop', 'session': 'a' })['status'] == 'OK'
+        assert worker_a.sessions == set()
+        assert worker_b.sessions == set(['b'])
+        assert worker_a.snapshots['a']['running'] == False
+    finally:
+        pool.control({ 'system': 'admin', 'control': 'stop', 'session': 'a' })
+        pool.control({ 'system': 'admin', 'control': 'stop', 'session': 'b' })
+        pool.close()
+
+def test_worker_late_reply():
+    # a worker without a process, answering through the other end of its pipe
+    worker = Worker.__new__(Worker)
+    worker.index, worker.lock, worker.seq = 0, threading.Lock(), 0
+    worker.conn, _child = multiprocessing.Pipe()
+
+    with pytest.raises(TimeoutError):
+        worker.call('running', timeout=0.1)
+
+    # the late reply to the first request is not taken for the answer to the second
+    _child.send((1, { 'a': True }))
+    _child.send((2, { 'b': True }))
+    assert worker.call('running', timeout=1.0) == { 'b': True }
@@ -0,0 +1,68 @@
+import json
+from dataclasses import asdict
+import numpy as np
+
+from so.core import custom_dict_factory, OverrideState
+from so.batch import MemorySink
+from so.loop import tick
+from so.geometry import GeometryEngine
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from so.serializer import serializer, dumps, pack_spectrum, unpack_spectrum
+from .shared import scenario, _is_jsonable
+
+def _states():
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    gs_sim.state.program_track = True
+
+    ts = gs_sim.state.ts + 300
+    gs_state = gs_sim.ping(ts, sc_state=sc_sim.state)
+    sc_state = sc_sim.ping(ts, gs_state=gs_state)
+    gs_sim.stop()
+
+    return gs_state, sc_state
+
+def test_serializer_to_dict():
+    for state in _states():
+        data = state.to_dict()
+
+        # same messages as asdict with custom_dict_factory
+        assert json.dumps(data) == json.dumps(asdict(state, dict_factory=custom_dict_factory))
+        assert _is_jsonable(data) == True
+
+def test_serializer_arrays():
+    gs_state, sc_state = _states()
+    data = serializer(sc_state.__class__, arrays=True).to_dict(sc_state)
+
+    assert isinstance(data['aocs_rotation'], np.ndarray) == True
+    assert data['aocs_mode'] == sc_state.aocs_mode.name
+    assert data['eps_sol_array'] == [x.name for x in sc_state.eps_sol_array]
+
+    # the cached serializer is compiled once per class
+    assert serializer(sc_state.__class__, arrays=True) is serializer(sc_state.__class__, arrays=True)
+    assert json.loads(dumps(sc_state.to_dict())) == json.loads(json.dumps(sc_state.to_dict()))
+
+def test_serializer_spectrum():
+    gs_state, sc_state = _states()
+    payload = pack_spectrum(gs_state.ts, gs_state.spectrum_ul, gs_state.spectrum_dl)
+    data = unpack_spectrum(payload)
+
+    assert data['ts'] == gs_state.ts
+    assert np.allclose(data['spectrum_ul'], gs_state.spectrum_ul, rtol=1e-6) == True
+    assert np.allclose(data['spectrum_dl'], gs_state.spectrum_dl, rtol=1e-6) == True
+    assert len(payload) < len(json.dumps([gs_state.spectrum_ul, gs_state.spectrum_dl])) / 4
+
+def test_serializer_spectrum_topic():
+    geometry = GeometryEngine(scenario)
+    gs_sim = GroundStationSim(scenario, geometry=geometry)
+    sc_sim = SpacecraftSim(scenario, geometry=geometry)
+    sink = MemorySink()
+
+    tick(gs_sim.state.ts + 1, gs_sim, sc_sim, OverrideState(), sink, spectrum='binary')
+    gs_sim.stop()
+
+    messages = dict(sink.messages)
+    assert isinstance(messages['ground_station/spectrum/bin'], bytes) == True
+    assert 'spectrum_ul' not in messages['ground_station']
@@ -0,0 +1,108 @@
+import os, time, base64, threading
+from types import SimpleNamespace
+import pytest
+from minio.helpers import check_bucket_name
+
+from so.batch import MemorySink
+from so.session import SessionManager, DEFAULT_SESSION
+from so.serializer import unpack_waterfall
+from .shared import _workdir, scenario
+
+def _manager(sink):
+    return SessionManager(backend=lambda scenario, prefix='': _PrefixSink(sink, prefix))
+
+class _PrefixSink:
+    def __init__(self, sink, prefix) -> None:
+        self.sink, self.prefix = sink, prefix
+
+    def publish(self, topic, data, retain=False):
+        return self.sink.publish(self.prefix + topic, data, retain=retain)
+
+def test_session_names():
+    manager = SessionManager()
+
+    assert manager.get('exercise-1', create=True).prefix == 'exercise-1/'
+    assert manager.get(None, create=True).name == DEFAULT_SESSION
+    assert manager.get(DEFAULT_SESSION).prefix == ''
+    assert manager.control({ 'system': 'admin', 'control': 'stop', 'session': '../etc' }) == { 'status': 'FAIL' }
+    assert manager.control({ 'system': 'admin', 'control': 'stop', 'session': 'Team_B' }) == { 'status': 'FAIL' }
+    assert manager.control({ 'system': 'admin', 'control': 'stop', 'session': 'x' * 40 }) == { 'status': 'FAIL' }
+
+    # the longest name still makes a valid archive bucket
+    check_bucket_name(f"sim-2026.10.18-12h34-{ 'x' * 39 }-tm", True)
+    assert manager.control({ 'system': 'ground_station', 'control': 'carrier_ul', 'session': 'unknown' }) == { 'status': 'FAIL' }
+
+def test_session_tick_policy(tmp_path, monkeypatch):
+    _workdir(tmp_path, monkeypatch)
+    monkeypatch.setattr('so.session.SO_TICK_POLICY', 'unknown')
+    manager = SessionManager()
+
+    with pytest.raises(ValueError):
+        manager.control({ 'system': 'admin', 'control': 'start', 'value': 'ops-sat-demo' })
+    assert manager.running() == { DEFAULT_SESSION: False }
+
+def test_session_geometry_build(monkeypatch):
+    builds = []
+    def _build(scenario, cache_dir=None):
+        builds.append(scenario)
+        time.sleep(0.5)
+        return SimpleNamespace(scenario=scenario)
+    monkeypatch.setattr('so.session.GeometryEngine', _build)
+    manager = SessionManager()
+
+    # sessions of the same scenario wait for one build, without holding up the other sessions
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_geometry('testing-0', scenario))) for i in range(3)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    assert manager.running() == {}
+    assert time.perf_counter() - start < 0.1
+    for t in threads:
+        t.join()
+
+    assert len(builds) == 1
+    assert results[0] is results[1] is results[2]
+
+    manager.release_geometry(results[0])
+    assert manager.geometries == {}
+
+def test_concurrent_sessions(tmp_path, monkeypatch):
+    _workdir(tmp_path, monkeypatch)
+    sink = MemorySink()
+    manager = _manager(sink)
+
+    assert manager.control({ 'system': 'admin', 'control': 'start', 'value': 'ops-sat-demo' })['status'] == 'OK'
+    assert manager.control({ 'system': 'admin', 'control': 'start', 'value': 'ops-sat-demo', 'session': 'team-b' })['status'] == 'OK'
+
+    try:
+        # overrides are per session
+        manager.control({ 'system': 'override', 'control': 'no_tc', 'value': 'true', 'session': 'team-b' })
+        time.sleep(1.5)
+
+        status = manager.control({ 'system': 'admin', 'control': 'status', 'session': 'team-b' })
+        assert status['sessions'] == { DEFAULT_SESSION: True, 'team-b': True }
+        assert status['overrides'] != manager.get(DEFAULT_SESSION).ov_state.current()
+
+        # spectrums for API consumers
+        assert manager.control({ 'system': 'spectrum', 'control': 'get', 'session': 'team-b' })['status'] == 'OK'
+        waterfall = manager.control({ 'system': 'waterfall', 'session': 'team-b', 'format': 'binary', 'rows': 10 })
+        assert len(unpack_waterfall(base64.b64decode(waterfall['data']))['ts']) > 0
+
+        # both sessions share the geometry tables
+        assert manager.get(DEFAULT_SESSION).geometry is manager.get('team-b').geometry
+    finally:
+        manager.control({ 'system': 'admin', 'control': 'stop' })
+        manager.control({ 'system': 'admin', 'control': 'stop', 'session': 'team-b' })
+
+    # the last session stopped drops the shared geometry
+    assert manager.geometries == {}
+
+    topics = set(x[0] for x in sink.messages)
+    assert topics == set(['ground_station', 'spacecraft', 'team-b/ground_station', 'team-b/spacecraft'])
+    assert len(manager.control({ 'system': 'admin', 'control': 'history', 'session': 'team-b' })) == 1
+    assert os.path.exists(os.path.join('data', 'hist', 'team-b'))
+
+    # history survives a restart, before any session exists
+    assert len(SessionManager().control({ 'system': 'admin', 'control': 'history', 'session': 'team-b' })) == 1
+    assert len(SessionManager().control({ 'system': 'admin', 'control': 'history' })) == 1
@@ -1,5 +1,8 @@
+import copy, struct, pickle
+import numpy as np
 
-from so.spacecraft import SpacecraftState, SpacecraftSim
+from so.spacecraft import SpacecraftState, SpacecraftSim, SpacePacketHandler
+from so.core import TTCModes, AOCSTarget
 from .shared import scenario, _is_jsonable
 
 def test_spacecraft_state():
@@ -21,3 +24,41 @@ def test_spacecraft_sim_ping():
     assert state.ts > _prev_state.ts
 
     assert _is_jsonable(state.to_dict()) == True
+
+def test_spacecraft_sim_snapshots():
+    sc_sim = SpacecraftSim(scenario)
+    sc_sim.ping(sc_sim.state.ts + 1.0)
+
+    # earlier states are not modified by ticks or commands
+    _prev_state = sc_sim.state
+    _window, _history = list(_prev_state.dhs_tm_window), list(_prev_state.dhs_tc_history)
+    sc_sim.control({ 'control': 'eps_sol_array__0', 'value': 'disabled' }, admin=True)
+    sc_sim.tc_history({ 'command': 'TC_TEST' }, { 'status': 'OK' })
+    sc_sim.ping(sc_sim.state.ts + 1.0)
+
+    assert _prev_state.dhs_tm_window == _window
+    assert _prev_state.dhs_tc_history == _history
+    assert len(sc_sim.state.dhs_tc_history) == len(_history) + 1
+
+def test_spacecraft_state_compact():
+    state = SpacecraftState()
+    _copy = copy.copy(state)
+
+    assert hasattr(state, '__dict__') == False
+    assert isinstance(state.aocs_rotation, np.ndarray) == True
+    assert _copy is not state and _copy.dhs_tc_history is state.dhs_tc_history
+    assert state.to_dict()['aocs_rotation'] == [0.0, 0.0, 0.0]
+    assert state.to_dict()['aocs_mode'] == 'NADIR'
+    assert len(SpacePacketHandler().as_byte_string(state)) == struct.calcsize(SpacePacketHandler().fmt)
+
+def test_spacecraft_state_packed_enums():
+    state = SpacecraftState()
+    state.ttc_mode = TTCModes.X_Sup_HBR
+
+    # enums are kept as their small int values and read back as members, also once unpickled
+    assert type(SpacecraftState.ttc_mode.slot.__get__(state)) is int
+    assert state.ttc_mode is TTCModes.X_Sup_HBR
+    assert state.aocs_mode is AOCSTarget.NADIR
+    assert pickle.loads(pickle.dumps(state)).ttc_mode is TTCModes.X_Sup_HBR
+    assert state.to_dict()['ttc_mode'] == 'X_Sup_HBR'
+
@@ -0,0 +1,35 @@
+from so.batch import MemorySink
+from so.topics import SubsystemBackend, SubsystemTopic
+from .shared import _run
+
+def test_subsystem_topics():
+    sink = MemorySink()
+    _run(SubsystemBackend(sink, legacy=False))
+
+    topics = [x[0] for x in sink.messages]
+    assert 'spacecraft' not in topics
+    assert set(['spacecraft/aocs', 'spacecraft/eps', 'spacecraft/dhs', 'ground_station/spectrum', 'ground_station/tracking']) <= set(topics)
+
+    # only the fields of the subsystem, with the simulation time
+    aocs = [x[1] for x in sink.messages if x[0] == 'spacecraft/aocs'][0]
+    assert all([k == 'ts' or k.startswith('aocs_') for k in aocs.keys()]) == True
+
+    # on change only, and at most every 10s
+    assert topics.count('ground_station/config') == 1
+    assert topics.count('ground_station/flight_dynamics') <= 2
+    assert topics.count('ground_station/tracking') == 12
+
+def test_subsystem_topics_legacy():
+    sink = MemorySink()
+    backend = SubsystemBackend(sink, topics={ 'spacecraft': [SubsystemTopic('eps', ['eps_*'], interval=5.0, on_change=False)] })
+    _run(backend)
+
+    topics = [x[0] for x in sink.messages]
+    assert topics.count('spacecraft') == 12
+    assert topics.count('ground_station') == 12
+    assert topics.count('spacecraft/eps') == 3
+
+    # everything again on the next message after a reset
+    backend.reset()
+    backend.publish('spacecraft', sink.messages[-1][1])
+    assert sink.messages[-1][0] == 'spacecraft/eps'
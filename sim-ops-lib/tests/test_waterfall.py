@@ -0,0 +1,50 @@
+import numpy as np
+
+from so.waterfall import Waterfall
+from so.serializer import pack_waterfall, unpack_waterfall
+from so.ground_station import GroundStationSim
+from so.spacecraft import SpacecraftSim
+from .shared import scenario
+
+def _spectrum(value, bins=8):
+    return np.linspace(2000.0, 2001.0, bins), np.full(bins, value)
+
+def test_waterfall_ring():
+    waterfall = Waterfall(rows=5, bins=8)
+    nbytes = waterfall.values['dl'].nbytes
+
+    for i in range(12):
+        waterfall.push(100.0 + i, _spectrum(-i), _spectrum(i))
+
+    # fixed size, oldest row first
+    assert waterfall.values['dl'].nbytes == nbytes
+    rows = waterfall.query('dl')
+    assert rows['ts'].tolist() == [107.0, 108.0, 109.0, 110.0, 111.0]
+    assert rows['values'][:, 0].tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert rows['f0'][0] == 2000.0
+
+    # time range, merged rows and bins keep the maximum
+    assert waterfall.query('ul', start=109.0, end=110.0)['values'][:, 0].tolist() == [-9.0, -10.0]
+    rows = waterfall.query('dl', max_rows=2, bins=4)
+    assert rows['ts'].tolist() == [107.0, 110.0]
+    assert rows['values'].shape == (2, 4)
+    assert rows['values'][:, 0].tolist() == [9.0, 11.0]
+
+    # binary form
+    data = unpack_waterfall(pack_waterfall(rows))
+    assert np.array_equal(data['values'], rows['values']) == True
+    assert data['ts'].tolist() == rows['ts'].tolist()
+
+def test_waterfall_ground_station():
+    gs_sim = GroundStationSim(scenario)
+    sc_sim = SpacecraftSim(scenario)
+    gs_sim.state.program_track = True
+
+    ts = gs_sim.state.ts + 300
+    for i in range(3):
+        gs_sim.ping(ts + i, sc_sim.state)
+
+    rows = gs_sim.waterfall.query('dl')
+    assert rows['ts'].tolist() == [ts, ts + 1, ts + 2]
+    assert rows['values'].shape == (3, gs_sim.spectrum_gen.SPECTRUMSIZE)
+    assert rows['values'].dtype == np.float32